@@ -0,0 +1,135 @@
+import re
+import logging
+from typing import List, Optional
+
+from Retriever.bm25 import tokenize
+from Retriever.product_index import LOW_RATED_PATTERN, TOP_RATED_PATTERN, ProductIndex
+
+logger = logging.getLogger(__name__)
+
+# Questions about a product's review statistics rather than what the reviews say
+AGGREGATE_PATTERNS = [
+    re.compile(r"\b(?:average|avg|mean|overall) (?:(?:star|customer|user|review) )?(?:ratings?|stars?|score)\b"),
+    re.compile(r"\bwhat(?:'s| is) (?:the |its )?(?:ratings?|score)\b"),
+    re.compile(r"\bhow (?:many|much) stars?\b"),
+    re.compile(r"\bhow many (?:reviews|ratings)\b"),
+    re.compile(r"\bhow many (?:people|customers|buyers|users) (?:have )?(?:reviewed|rated)\b"),
+    re.compile(r"\b(?:number|count|total) of (?:reviews|ratings)\b"),
+    re.compile(r"\bhow many (?:[1-5]|one|two|three|four|five)[- ]stars?(?: (?:reviews|ratings))?\b"),
+    re.compile(r"\b(?:ratings?|stars?) (?:breakdown|distribution|histogram|split)\b"),
+    TOP_RATED_PATTERN,
+    LOW_RATED_PATTERN,
+]
+CLAUSE_SPLIT = re.compile(r"[?.;!,]|\b(?:and|also|but|plus)\b")
+# Words that carry no question of their own once the product and the statistic are accounted for
+FILLER_WORDS = frozenset({
+    "a", "an", "the", "of", "for", "on", "in", "to", "is", "are", "was", "does", "do", "did", "has", "have",
+    "it", "its", "s", "this", "that", "these", "those", "them", "they", "what", "whats", "which", "how", "many",
+    "much", "tell", "me", "please", "show", "give", "can", "you", "i", "want", "know", "get", "got", "there",
+    "product", "products", "one", "ones", "item", "headphones", "earphones", "earbuds", "model",
+})
+
+
+def _is_aggregate(text: str) -> bool:
+    return any(pattern.search(text) for pattern in AGGREGATE_PATTERNS)
+
+
+class AggregateAnswerer:
+    """
+    Answers questions about review statistics ("average rating of the Rockerz 235v2",
+    "how many reviews does the Airdopes 131 have", "best rated earphones") from the
+    per-product aggregates in the ProductIndex, without retrieval or generation.
+
+    A question is answered directly only when every clause of it asks for a
+    statistic of the products the (rewritten) query names; "what's the rating of X
+    and how is the battery?" still goes through retrieval, with the aggregates of
+    X injected into the prompt instead, so the model quotes the catalogue-wide
+    figures rather than averaging the few reviews it was shown.
+    """
+
+    def __init__(self, product_index: ProductIndex, direct_answers: bool = True, inject: bool = True,
+                 max_products: int = 3, top_summaries: int = 3):
+        self.product_index = product_index
+        self.direct_answers = direct_answers
+        self.inject = inject
+        self.max_products = max_products
+        self.top_summaries = top_summaries
+        self._name_words = frozenset(token for product in product_index.products.values()
+                                     for token in tokenize(product["name"]))
+        self.answered = 0
+        self.injected = 0
+
+    @classmethod
+    def from_config(cls, product_index: ProductIndex, config: dict) -> "AggregateAnswerer":
+        aggregates_config = config.get("aggregates", {})
+        return cls(
+            product_index,
+            direct_answers=aggregates_config.get("direct_answers", True),
+            inject=aggregates_config.get("inject_into_prompt", True),
+            max_products=aggregates_config.get("max_products", 3),
+            top_summaries=aggregates_config.get("top_summaries", 3),
+        )
+
+    def _products(self, query: str) -> List[str]:
+        product_ids = self.product_index.resolve_products(query)
+        return product_ids if len(product_ids) <= self.max_products else []
+
+    def _only_aggregate(self, question: str) -> bool:
+        """
+        True when no clause of the question asks for anything but statistics: once the
+        statistic phrases are cut out, only filler and product-name words may remain
+        ("what is the rating of X mic quality" leaves "mic quality" and goes to retrieval).
+        """
+        for clause in CLAUSE_SPLIT.split(question.lower()):
+            for pattern in AGGREGATE_PATTERNS:
+                clause = pattern.sub(" ", clause)
+            if any(token not in FILLER_WORDS and token not in self._name_words for token in tokenize(clause)):
+                return False
+        return True
+
+    def describe(self, product_id: str) -> str:
+        """One line of catalogue-wide statistics for a product."""
+        product = self.product_index.products[product_id]
+        if not product["rating_count"]:
+            return f"{product['name']} has {len(product['doc_ids'])} reviews and no star ratings yet."
+        histogram = product.get("rating_histogram", {})
+        stars = ", ".join(f"{star}★ {histogram[star]}"
+                          for star in sorted(histogram, key=float, reverse=True))
+        line = (f"{product['name']} has an average rating of {product['mean_rating']:.1f}/5 "
+                f"from {product['rating_count']} reviews ({stars}).")
+        summaries = product.get("top_summaries", [])[: self.top_summaries]
+        if summaries:
+            line += " Most common review summaries: " + ", ".join(f'"{text}" ({n})' for text, n in summaries) + "."
+        return line
+
+    def answer(self, question: str, query: str) -> Optional[str]:
+        """
+        Direct answer for a pure statistics question, or None. Intent is read from the
+        customer's own words, products from the rewritten query (pronouns resolved).
+        """
+        if not self.direct_answers or not _is_aggregate(question.lower()) or not self._only_aggregate(question):
+            return None
+        product_ids = self._products(query)
+        if not product_ids:
+            return None
+        self.answered += 1
+        logger.info(f"Answered from product aggregates: {len(product_ids)} products")
+        return " ".join(self.describe(product_id) for product_id in product_ids)
+
+    def context(self, question: str, query: str) -> str:
+        """Aggregates block to put in front of the retrieved reviews, or "" when the question wants none."""
+        if not self.inject or not (_is_aggregate(question.lower()) or _is_aggregate(query.lower())):
+            return ""
+        product_ids = self._products(query)
+        if not product_ids:
+            return ""
+        self.injected += 1
+        lines = [f"[Catalogue statistics over all reviews] {self.describe(product_id)}" for product_id in product_ids]
+        return "\n".join(lines)
+
+    def stats(self) -> dict:
+        return {
+            "products": len(self.product_index),
+            "answered": self.answered,
+            "injected": self.injected,
+        }
@@ -0,0 +1,174 @@
+import os
+import re
+import json
+import logging
+from array import array
+from collections import Counter, defaultdict
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+POSTINGS_FILE = "postings.npz"
+VOCAB_FILE = "vocab.json"
+IDS_FILE = "ids.json"
+MIN_SCORE = 2.0  # BM25 score below which a lexical hit is too weak to count as a match
+
+# Function words and question phrasing: frequent enough in reviews and questions to match
+# almost anything, so they are neither indexed nor searched
+STOPWORDS = frozenset({
+    "a", "about", "above", "after", "again", "all", "also", "am", "an", "and", "any", "are", "as", "at", "be",
+    "been", "before", "being", "below", "between", "both", "but", "by", "can", "could", "did", "do", "does",
+    "doing", "down", "during", "each", "few", "for", "from", "further", "had", "has", "have", "having", "he",
+    "her", "here", "hers", "him", "his", "how", "i", "if", "in", "into", "is", "it", "its", "itself", "just",
+    "me", "more", "most", "my", "myself", "no", "nor", "not", "now", "of", "off", "on", "once", "only", "or",
+    "other", "our", "ours", "out", "over", "own", "please", "s", "same", "she", "should", "so", "some", "such",
+    "t", "tell", "than", "that", "the", "their", "theirs", "them", "then", "there", "these", "they", "this",
+    "those", "through", "to", "too", "under", "until", "up", "us", "very", "was", "we", "were", "what", "when",
+    "where", "which", "while", "who", "whom", "why", "will", "with", "would", "you", "your", "yours",
+})
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def index_terms(text: str) -> List[str]:
+    """Tokens the BM25 index covers: `tokenize` without stopwords."""
+    return [token for token in tokenize(text) if token not in STOPWORDS]
+
+
+def indexed_text(doc: Document) -> str:
+    """Fields the lexical index covers: product title, review summary and review body."""
+    return " ".join([
+        str(doc.metadata.get("product_name", "")),
+        str(doc.metadata.get("product_summary", "")),
+        doc.page_content,
+    ])
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an array-backed inverted index.
+
+    Postings are stored CSR-style: term t's documents are
+    doc_ids[offsets[t]:offsets[t + 1]] with matching term frequencies in tfs,
+    so the whole index is four flat NumPy arrays plus the vocabulary and the
+    document ID of each row. Texts and metadata are not kept: callers look the
+    matching IDs up in the vector store, which holds them anyway.
+    """
+
+    def __init__(self, vocab: dict, offsets: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray,
+                 doc_lengths: np.ndarray, ids: List[str], k1: float = 1.5, b: float = 0.75):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.ids = ids
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        doc_freqs = np.diff(offsets)
+        num_docs = len(doc_lengths)
+        self.idf = np.log(1.0 + (num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def search(self, query: str, k: int = 10, min_score: float = MIN_SCORE) -> List[Tuple[str, float]]:
+        """Top-k (document ID, BM25 score) pairs, ignoring documents scoring below `min_score`."""
+        term_ids = [self.vocab[token] for token in set(index_terms(query)) if token in self.vocab]
+        if not term_ids or not len(self):
+            return []
+
+        scores = np.zeros(len(self), dtype=np.float32)
+        length_norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths / self.avg_doc_length)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end]
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1.0) / (tf + length_norm[docs])
+
+        matched = np.flatnonzero(scores >= max(min_score, 1e-9))
+        k = min(k, len(matched))
+        if k == 0:
+            return []
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[row], float(scores[row])) for row in top]
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.savez(os.path.join(path, POSTINGS_FILE), offsets=self.offsets, doc_ids=self.doc_ids,
+                 tfs=self.tfs, doc_lengths=self.doc_lengths)
+        with open(os.path.join(path, VOCAB_FILE), "w") as f:
+            json.dump(self.vocab, f)
+        with open(os.path.join(path, IDS_FILE), "w") as f:
+            json.dump(self.ids, f)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        arrays = np.load(os.path.join(path, POSTINGS_FILE))
+        with open(os.path.join(path, VOCAB_FILE), "r") as f:
+            vocab = json.load(f)
+        with open(os.path.join(path, IDS_FILE), "r") as f:
+            ids = json.load(f)
+        logger.info(f"Loaded BM25 index: {len(ids)} docs, {len(vocab)} terms from {path}")
+        return cls(vocab, arrays["offsets"], arrays["doc_ids"], arrays["tfs"], arrays["doc_lengths"], ids)
+
+
+class BM25Builder:
+    """
+    Accumulates documents one at a time (e.g. from a streaming transform) and freezes them into a
+    BM25Index. Only postings, document lengths and IDs are kept, as flat int32 arrays: each
+    document appends one (term, frequency) pair per distinct term, and build() sorts them by term.
+    """
+
+    def __init__(self):
+        self._term_ids: dict = {}           # term -> id in order of first appearance (renumbered by build)
+        self._terms = array("i")            # per posting
+        self._tfs = array("i")              # per posting
+        self._distinct_terms = array("i")   # per document: its number of postings
+        self._doc_lengths = array("i")
+        self._ids: List[str] = []
+
+    def add(self, doc: Document):
+        if doc.id is None:
+            raise ValueError("BM25Builder needs document IDs to look matches up in the vector store")
+        tokens = index_terms(indexed_text(doc))
+        counts = Counter(tokens)
+        term_ids = self._term_ids
+        for token in counts:
+            if token not in term_ids:
+                term_ids[token] = len(term_ids)
+        self._terms.extend(map(term_ids.__getitem__, counts))
+        self._tfs.extend(counts.values())
+        self._distinct_terms.append(len(counts))
+        self._doc_lengths.append(len(tokens))
+        self._ids.append(doc.id)
+
+    def consume(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """Index documents as they stream past, yielding each one unchanged."""
+        for doc in documents:
+            self.add(doc)
+            yield doc
+
+    def build(self) -> BM25Index:
+        terms = sorted(self._term_ids)
+        vocab = {term: term_id for term_id, term in enumerate(terms)}
+        sorted_ids = np.empty(len(terms), dtype=np.int32)
+        sorted_ids[[self._term_ids[term] for term in terms]] = np.arange(len(terms), dtype=np.int32)
+        posting_terms = sorted_ids[np.frombuffer(self._terms, dtype=np.int32)]
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(posting_terms, minlength=len(vocab)))
+        order = np.argsort(posting_terms, kind="stable")  # stable: rows stay ascending within a term
+        del posting_terms  # the postings are the bulk of the index; keep one temporary copy at a time
+        rows = np.repeat(np.arange(len(self._ids), dtype=np.int32), np.frombuffer(self._distinct_terms, dtype=np.int32))
+        doc_ids = rows[order]
+        del rows
+        tfs = np.frombuffer(self._tfs, dtype=np.int32)[order].astype(np.float32)
+        return BM25Index(vocab, offsets, doc_ids, tfs, np.asarray(self._doc_lengths, dtype=np.float32), list(self._ids))
@@ -0,0 +1,205 @@
+import os
+import re
+import math
+import json
+import logging
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from langchain_core.documents import Document
+
+from Retriever.bm25 import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Words in product titles that describe a kind of product rather than name one
+GENERIC_NAME_TOKENS = frozenset({
+    "bluetooth", "wireless", "wired", "headset", "headsets", "headphone", "headphones", "earphone",
+    "earphones", "earbuds", "neckband", "bass", "edition", "series", "version", "with", "and", "for",
+    "the", "low", "price", "charging", "fast", "mic", "pro", "new",
+})
+MAX_NAME_SHARE = 0.5  # name tokens shared by more than this share of products cannot single one out
+
+TOP_RATED_PATTERN = re.compile(r"\b(?:best|top|highest)[- ]rated\b")
+LOW_RATED_PATTERN = re.compile(r"\b(?:worst|lowest|poorly)[- ]rated\b")
+MIN_STARS_PATTERNS = [
+    (re.compile(r"\b(?:at least|minimum|min) ([1-5]) stars?\b"), "$gte"),
+    (re.compile(r"\b([1-5])\+? stars? (?:and|or) (?:above|up|more|higher)\b"), "$gte"),
+    (re.compile(r"\b(?:above|over|more than|higher than) ([1-5]) stars?\b"), "$gt"),
+]
+MAX_STARS_PATTERNS = [
+    (re.compile(r"\b(?:at most|maximum|max) ([1-5]) stars?\b"), "$lte"),
+    (re.compile(r"\b([1-5]) stars? (?:and|or) (?:below|under|less|lower)\b"), "$lte"),
+    (re.compile(r"\b(?:below|under|less than|lower than) ([1-5]) stars?\b"), "$lt"),
+]
+EXACT_STARS_PATTERN = re.compile(r"\b([1-5])[- ]stars? (?:reviews?|ratings?)\b")
+
+
+def _name_tokens(name: str) -> List[str]:
+    # Single characters ("z", "q", the "i" of "U&I") are too ambiguous in questions to name a product
+    return [token for token in dict.fromkeys(tokenize(name)) if len(token) > 1]
+
+
+class ProductIndex:
+    """
+    Catalogue of products built at ingestion: product_id -> name, normalized name
+    tokens, review document IDs and rating stats (count, sum, min, max, mean, a
+    histogram of star ratings) plus the most common review summaries.
+
+    `metadata_filter(query)` turns product mentions and rating constraints in a
+    search query into a metadata filter for the vector store, so only the
+    matching products' reviews are searched. Product mentions are matched on the
+    distinctive tokens of each name (weighted by their rarity across names);
+    generic words and tokens most names share are ignored, and a bare number only
+    counts alongside another token of the same name.
+    """
+
+    def __init__(self, products: Dict[str, dict], top_rated: int = 3, key_field: str = "product_id"):
+        self.products = products
+        self.top_rated = top_rated
+        self.key_field = key_field  # metadata field the product keys refer to
+        name_counts = Counter(token for product in products.values() for token in product["name_tokens"])
+        num_products = max(len(products), 1)
+        self._idf = {
+            token: math.log(num_products / count) + 1e-6
+            for token, count in name_counts.items()
+            if token not in GENERIC_NAME_TOKENS and (count / num_products <= MAX_NAME_SHARE or num_products == 1)
+        }
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def match_products(self, query: str) -> List[str]:
+        """Product IDs the query names; ties (e.g. only the brand is mentioned) are all returned."""
+        query_tokens = set(tokenize(query))
+        scores = {}
+        for product_id, product in self.products.items():
+            matched = [token for token in product["name_tokens"] if token in query_tokens and token in self._idf]
+            if not any(not token.isdigit() for token in matched):
+                continue
+            scores[product_id] = sum(self._idf[token] for token in matched)
+        if not scores:
+            return []
+        best = max(scores.values())
+        tied = sorted(product_id for product_id, score in scores.items() if score >= best - 1e-9)
+        if len(tied) > 1:
+            # Single characters only break ties: "realme buds q" means the Buds Q, not every realme Buds
+            short = {product_id: sum(token in query_tokens for token in set(tokenize(self.products[product_id]["name"]))
+                                     if len(token) == 1)
+                     for product_id in tied}
+            if max(short.values()) > 0:
+                tied = [product_id for product_id in tied if short[product_id] == max(short.values())]
+        return tied
+
+    def rating_bounds(self, query: str) -> dict:
+        """Review star-rating constraints stated in the query, as filter operators."""
+        normalized = query.lower()
+        bounds = {}
+        for patterns in (MIN_STARS_PATTERNS, MAX_STARS_PATTERNS):
+            for pattern, operator in patterns:
+                match = pattern.search(normalized)
+                if match:
+                    bounds[operator] = int(match.group(1))
+                    break
+        if not bounds:
+            match = EXACT_STARS_PATTERN.search(normalized)
+            if match:
+                bounds["$eq"] = int(match.group(1))
+        return bounds
+
+    def rank_by_rating(self, product_ids: Iterable[str], highest: bool = True) -> List[str]:
+        rated = [product_id for product_id in product_ids if self.products[product_id]["rating_count"]]
+        return sorted(rated, key=lambda product_id: (self.products[product_id]["mean_rating"],
+                                                     self.products[product_id]["rating_count"]),
+                      reverse=highest)
+
+    def resolve_products(self, query: str) -> List[str]:
+        """Products the query is about: the ones it names, or the top/bottom rated for "best/worst rated"."""
+        normalized = query.lower()
+        product_ids = self.match_products(query)
+        best = TOP_RATED_PATTERN.search(normalized)
+        if best or LOW_RATED_PATTERN.search(normalized):
+            ranked = self.rank_by_rating(product_ids or self.products, highest=bool(best))
+            product_ids = ranked[: self.top_rated]
+        return product_ids
+
+    def metadata_filter(self, query: str) -> Optional[dict]:
+        """Metadata filter implied by the query, or None when it names no product or rating constraint."""
+        product_ids = self.resolve_products(query)
+        filter = {}
+        if product_ids and len(product_ids) < len(self.products):
+            filter[self.key_field] = product_ids[0] if len(product_ids) == 1 else {"$in": product_ids}
+        bounds = self.rating_bounds(query)
+        if bounds:
+            filter["product_rating"] = bounds
+        return filter or None
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"key_field": self.key_field, "products": self.products}, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str, top_rated: int = 3) -> "ProductIndex":
+        with open(path, "r") as f:
+            data = json.load(f)
+        logger.info(f"Loaded product index: {len(data['products'])} products from {path}")
+        return cls(data["products"], top_rated=top_rated, key_field=data.get("key_field", "product_id"))
+
+
+class ProductIndexBuilder:
+    """Accumulates review documents (e.g. from a streaming transform) into a ProductIndex."""
+
+    def __init__(self):
+        self._products: Dict[str, dict] = {}
+        self._summaries: Dict[str, Counter] = {}  # product -> normalized summary counts
+        self._summary_text: Dict[str, str] = {}   # normalized summary -> first spelling seen
+        self._key_field = "product_id"
+
+    def add(self, doc: Document):
+        if "product_id" not in doc.metadata:
+            self._key_field = "product_name"  # the CSV has no product_id column
+        product_id = str(doc.metadata.get(self._key_field, ""))
+        product = self._products.get(product_id)
+        if product is None:
+            name = str(doc.metadata.get("product_name", ""))
+            product = self._products[product_id] = {
+                "name": name,
+                "name_tokens": _name_tokens(name),
+                "doc_ids": [],
+                "rating_count": 0,
+                "rating_sum": 0.0,
+                "rating_min": None,
+                "rating_max": None,
+                "rating_histogram": {},
+            }
+            self._summaries[product_id] = Counter()
+        product["doc_ids"].append(doc.id)
+        rating = doc.metadata.get("product_rating")
+        if isinstance(rating, (int, float)) and not isinstance(rating, bool):
+            product["rating_count"] += 1
+            product["rating_sum"] += float(rating)
+            product["rating_min"] = rating if product["rating_min"] is None else min(product["rating_min"], rating)
+            product["rating_max"] = rating if product["rating_max"] is None else max(product["rating_max"], rating)
+            star = str(int(rating)) if float(rating).is_integer() else str(rating)
+            product["rating_histogram"][star] = product["rating_histogram"].get(star, 0) + 1
+        summary = str(doc.metadata.get("product_summary", "")).strip()
+        key = summary.lower().rstrip(" .!")
+        if key:
+            self._summaries[product_id][key] += 1
+            self._summary_text.setdefault(key, summary.rstrip(" .!"))
+
+    def consume(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """Index documents as they stream past, yielding each one unchanged."""
+        for doc in documents:
+            self.add(doc)
+            yield doc
+
+    def build(self, top_rated: int = 3, top_summaries: int = 5) -> ProductIndex:
+        for product_id, product in self._products.items():
+            count = product["rating_count"]
+            product["mean_rating"] = round(product["rating_sum"] / count, 3) if count else None
+            product["top_summaries"] = [[self._summary_text[key], n]
+                                        for key, n in self._summaries[product_id].most_common(top_summaries)]
+        return ProductIndex(self._products, top_rated=top_rated, key_field=self._key_field)
@@ -1,6 +1,11 @@
+import re
+import time
+import hashlib
 import logging
+from collections import OrderedDict
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from utils.coalescing import SingleFlight
 
 logger = logging.getLogger(__name__)
 
@@ -24,16 +29,133 @@ USER QUESTION: {question}
 REWRITTEN SEARCH QUERY:"""
 
 
+NO_HISTORY = "No previous conversation."
+
+# Words that usually point back at something said earlier in the conversation
+REFERENCE_WORDS = {
+    "it", "its", "it's", "that", "this", "these", "those", "they", "them", "their",
+    "he", "she", "one", "ones", "same", "other", "another", "former", "latter",
+    "previous", "above", "mentioned", "both", "either", "neither", "compare", "compared",
+}
+FOLLOW_UP_PREFIXES = ("what about", "how about", "and ", "also ", "what else", "anything else")
+
+
+def is_self_contained(question: str, history: str = NO_HISTORY, product_index=None) -> bool:
+    """
+    Cheap check for queries an LLM rewrite cannot improve: no pronouns or
+    follow-up phrasing to resolve, and, if there is history, a product named in
+    the question itself (via `product_index`). Without that, a follow-up such as
+    "How long does the battery last?" is about the product discussed earlier,
+    so it always goes to the LLM.
+    """
+    normalized = question.strip().lower()
+    words = re.findall(r"[a-z0-9']+", normalized)
+    if not words:
+        return False
+    if any(word in REFERENCE_WORDS for word in words):
+        return False
+    if normalized.startswith(FOLLOW_UP_PREFIXES):
+        return False
+    has_history = bool(history.strip()) and history.strip() != NO_HISTORY
+    if not has_history:
+        return True
+    return product_index is not None and bool(product_index.match_products(question))
+
+
 class QueryRewriter:
-    def __init__(self, llm):
+    """
+    LLM query rewriter with a fast path and a memoized rewrite cache.
+
+    Self-contained queries skip the LLM and are used as the search query
+    directly; with history, that needs a product named in `product_index`.
+    Other rewrites are memoized on (question, history digest), and with
+    `single_flight` identical rewrites already in flight share one LLM call.
+    """
+
+    def __init__(self, llm, fast_path: bool = True, cache_size: int = 1024, single_flight: bool = False,
+                 product_index=None):
         self.chain = (
             ChatPromptTemplate.from_template(REWRITE_PROMPT)
             | llm
             | StrOutputParser()
         )
+        self.fast_path = fast_path
+        self.product_index = product_index
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple, str] = OrderedDict()
+        self.requests = 0
+        self.llm_calls = 0
+        self.fast_path_skips = 0
+        self.cache_hits = 0
+        self.llm_seconds = 0.0
+        self._inflight = SingleFlight() if single_flight else None
+
+    def _cache_key(self, question: str, history: str) -> tuple:
+        digest = hashlib.sha1(history.encode("utf-8")).hexdigest()
+        return " ".join(question.lower().split()), digest
 
-    def rewrite(self, question: str, history: str = "No previous conversation.") -> str:
+    def _try_skip(self, question: str, history: str):
+        """Return a rewrite without calling the LLM, or None if the LLM is needed."""
+        self.requests += 1
+        if self.fast_path and is_self_contained(question, history, self.product_index):
+            self.fast_path_skips += 1
+            logger.info(f"Query rewrite skipped (self-contained): '{question}'")
+            return question.strip()
+
+        key = self._cache_key(question, history)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            rewritten = self._cache[key]
+            logger.info(f"Query rewrite (cached): '{question}' → '{rewritten}'")
+            return rewritten
+        return None
+
+    def _remember(self, question: str, history: str, rewritten: str, elapsed: float):
+        self.llm_calls += 1
+        self.llm_seconds += elapsed
+        self._cache[self._cache_key(question, history)] = rewritten
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        logger.info(f"Query rewrite: '{question}' → '{rewritten}' ({elapsed:.3f}s)")
+
+    def rewrite(self, question: str, history: str = NO_HISTORY) -> str:
+        rewritten = self._try_skip(question, history)
+        if rewritten is not None:
+            return rewritten
+        start = time.perf_counter()
         rewritten = self.chain.invoke({"question": question, "history": history})
         rewritten = rewritten.strip()
-        logger.info(f"Query rewrite: '{question}' → '{rewritten}'")
-        return rewritten
\ No newline at end of file
+        self._remember(question, history, rewritten, time.perf_counter() - start)
+        return rewritten
+
+    async def arewrite(self, question: str, history: str = NO_HISTORY) -> str:
+        rewritten = self._try_skip(question, history)
+        if rewritten is not None:
+            return rewritten
+        if self._inflight is not None:
+            return await self._inflight.run(self._cache_key(question, history),
+                                            lambda: self._allm_rewrite(question, history))
+        return await self._allm_rewrite(question, history)
+
+    async def _allm_rewrite(self, question: str, history: str) -> str:
+        start = time.perf_counter()
+        rewritten = await self.chain.ainvoke({"question": question, "history": history})
+        rewritten = rewritten.strip()
+        self._remember(question, history, rewritten, time.perf_counter() - start)
+        return rewritten
+
+    def stats(self) -> dict:
+        saved = self.fast_path_skips + self.cache_hits
+        avg_llm_latency = self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+        return {
+            "requests": self.requests,
+            "llm_calls": self.llm_calls,
+            "llm_calls_saved": saved,
+            "fast_path_skips": self.fast_path_skips,
+            "cache_hits": self.cache_hits,
+            "coalesced": self._inflight.shared if self._inflight else 0,
+            "avg_llm_latency_s": round(avg_llm_latency, 4),
+            # Estimated rewrite latency removed from the average request
+            "avg_latency_saved_per_request_s": round(saved * avg_llm_latency / self.requests, 4) if self.requests else 0.0,
+        }
@@ -1,47 +1,52 @@
 import os
+import re
+import time
+import asyncio
 import logging
-from langchain_astradb import AstraDBVectorStore
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from langchain_core.documents import Document
-from utils.config_loader import load_config
+from Retriever.bm25 import MIN_SCORE, BM25Index
+from Retriever.product_index import ProductIndex
+from utils.config_loader import load_config, resolve_path
 from utils.model_loader import ModelLoader
+from utils.metadata_filter import MetadataColumns
+from utils.vector_store_loader import BACKEND_ENV_VARS, fetch_documents, get_backend, load_vector_store
+from utils.tracing import annotate, span
+from utils.coalescing import SingleFlight
 from dotenv import load_dotenv
 
 logger = logging.getLogger(__name__)
 
 RELEVANCE_THRESHOLD = 0.3
+LEXICAL_FILTER_DEPTH = 5  # with a metadata filter, BM25 candidate pools looked up before giving up
 
 
 class Retriever:
 
-    def __init__(self):
-        self.model_loader = ModelLoader()
+    def __init__(self, model_loader: ModelLoader = None):
+        self.model_loader = model_loader or ModelLoader.shared()
         self.config = load_config()
         self._load_env_variables()
         self.vstore = None
         self.retriever = None
+        self._lexical_index = None
+        self._lexical_index_checked = False
+        self._product_index = None
+        self._product_index_checked = False
+        self.filter_counts = {"searches": 0, "filtered": 0, "fallbacks": 0}
+        self.search_flights = SingleFlight() if self.config.get("coalescing", {}).get("single_flight", False) else None
 
     def _load_env_variables(self):
         load_dotenv()
-        required_vars = ["GOOGLE_API_KEY", "ASTRA_DB_API_ENDPOINT", "ASTRA_DB_APPLICATION_TOKEN", "ASTRA_DB_KEYSPACE"]
+        required_vars = ["GOOGLE_API_KEY"] + BACKEND_ENV_VARS[get_backend(self.config)]
         missing_vars = [var for var in required_vars if os.getenv(var) is None]
         if missing_vars:
             raise EnvironmentError(f"Missing environment variables: {missing_vars}")
 
-        self.db_api_endpoint = os.getenv("ASTRA_DB_API_ENDPOINT")
-        self.db_application_token = os.getenv("ASTRA_DB_APPLICATION_TOKEN")
-        self.db_namespace = os.getenv("ASTRA_DB_KEYSPACE")
-
     def _ensure_vstore(self):
         if not self.vstore:
-            collection_name = self.config["astra_db"]["collection_name"]
-            self.vstore = AstraDBVectorStore(
-                embedding=self.model_loader.load_embeddings(),
-                collection_name=collection_name,
-                api_endpoint=self.db_api_endpoint,
-                token=self.db_application_token,
-                namespace=self.db_namespace,
-            )
+            self.vstore = load_vector_store(self.config, self.model_loader.load_embeddings(),
+                                            clients=self.model_loader.clients)
 
     def load_retriever(self):
         if self.retriever:
@@ -53,6 +58,29 @@ class Retriever:
         logger.info("Retriever loaded successfully.")
         return self.retriever
 
+    def use_snapshot(self, path: str = None, quantized: bool = False):
+        """
+        Search an exported embedding snapshot (memory-mapped, in process) instead of the
+        configured vector store, e.g. for offline evaluation. Call before load_retriever().
+        """
+        from data_ingestion.snapshot import EmbeddingSnapshot
+        root = resolve_path(path or self.config.get("snapshot", {}).get("path", "data/snapshots"))
+        snapshot = EmbeddingSnapshot.open(root, quantized=quantized)
+        model_name = self.config["embedding_model"]["model_name"]
+        if snapshot.model != model_name:
+            raise ValueError(f"Snapshot {snapshot.version} holds {snapshot.model} embeddings, "
+                             f"but queries are embedded with {model_name}")
+        local_config = self.config.get("vector_store", {}).get("local", {})
+        self.vstore = snapshot.to_vector_store(
+            self.model_loader.load_embeddings(),
+            index_type=local_config.get("index_type", "exact"),
+            nlist=local_config.get("nlist", 64),
+            nprobe=local_config.get("nprobe", 8),
+        )
+        self.retriever = None
+        logger.info(f"Searching embedding snapshot {snapshot.version}: {snapshot.stats()}")
+        return snapshot
+
     def call_retriever(self, query: str) -> List[Document]:
         retriever = self.load_retriever()
         return retriever.invoke(query)
@@ -60,23 +88,231 @@ class Retriever:
     def call_retriever_with_scores(self, query: str) -> Tuple[List[Document], float]:
         """Retrieve documents with similarity scores and filter by relevance threshold."""
         self._ensure_vstore()
-        top_k = self.config.get("retriever", {}).get("top_k", 3)
-        results = self.vstore.similarity_search_with_score(query, k=top_k)
+        k = self._candidate_k()
+        filter = self.metadata_filter(query)
+        results = self.vstore.similarity_search_with_score(query, k=k, **_filter_kwargs(filter))
+        if filter and not results:
+            filter = None
+            results = self.vstore.similarity_search_with_score(query, k=k)
+        return self.filter_by_relevance(self._fuse_lexical(query, results, filter))
+
+    async def aembed_query(self, query: str) -> List[float]:
+        with span("embed"):
+            return await self.model_loader.load_embeddings().aembed_query(query)
+
+    async def asearch_with_scores(self, query: str, embedding: List[float] = None) -> List[Tuple[Document, Optional[float]]]:
+        """
+        Unfiltered top-k (document, similarity) pairs; pass `embedding` to skip re-embedding the query.
+        With hybrid retrieval enabled, BM25 matches are fused in by reciprocal rank; documents
+        found only lexically carry a similarity of None. With coalescing.single_flight, concurrent
+        searches for the same query share one vector store call. Products and star ratings the
+        query names narrow both searches through a metadata filter (see metadata_filter).
+        """
+        self._ensure_vstore()
+        k = self._candidate_k()
+        if self.search_flights is not None:
+            key = (query, k, self.config.get("retriever", {}).get("top_k", 3))
+            return list(await self.search_flights.run(key, lambda: self._asearch(query, embedding, k)))
+        return await self._asearch(query, embedding, k)
+
+    async def _asearch(self, query: str, embedding: Optional[List[float]], k: int) -> List[Tuple[Document, Optional[float]]]:
+        filter = self.metadata_filter(query)
+        self.filter_counts["searches"] += 1
+        if embedding is None:
+            embedding = await self.aembed_query(query)
+        with span("vector_search"):
+            results = await self._avector_search(query, embedding, k, filter)
+            if filter:
+                self.filter_counts["filtered"] += 1
+                annotate(metadata_filter=filter)
+                if not results:
+                    # Nothing matches (e.g. no 1-star review of that product): answer from the whole catalogue
+                    self.filter_counts["fallbacks"] += 1
+                    filter = None
+                    results = await self._avector_search(query, embedding, k, None)
+        with span("lexical_search"):
+            # BM25 matches the vector search did not return are read from the vector store
+            return await asyncio.to_thread(self._fuse_lexical, query, results, filter)
+
+    async def _avector_search(self, query: str, embedding: List[float], k: int,
+                              filter: Optional[dict]) -> List[Tuple[Document, float]]:
+        kwargs = _filter_kwargs(filter)
+        if hasattr(self.vstore, "asimilarity_search_with_score_by_vector"):
+            return await self.vstore.asimilarity_search_with_score_by_vector(embedding, k=k, **kwargs)
+        return await asyncio.to_thread(self.vstore.similarity_search_with_score_by_vector, embedding, k=k, **kwargs)
+
+    async def acall_retriever_with_scores(self, query: str, embedding: List[float] = None) -> Tuple[List[Document], float]:
+        """
+        Async variant of call_retriever_with_scores; does not block the event loop.
+        Pass a precomputed query `embedding` to skip re-embedding the query.
+        """
+        results = await self.asearch_with_scores(query, embedding=embedding)
+        return self.filter_by_relevance(results)
+
+    def _candidate_k(self) -> int:
+        """Vector results to fetch: top_k, or a deeper candidate pool when fusing with BM25."""
+        retriever_config = self.config.get("retriever", {})
+        top_k = retriever_config.get("top_k", 3)
+        if self._get_lexical_index() is None:
+            return top_k
+        return max(top_k, retriever_config.get("candidate_k", 10))
+
+    def _get_lexical_index(self) -> Optional[BM25Index]:
+        if self._lexical_index is None and not self._lexical_index_checked:
+            self._lexical_index_checked = True
+            retriever_config = self.config.get("retriever", {})
+            if retriever_config.get("hybrid", False):
+                path = resolve_path(retriever_config.get("bm25_path", "data/bm25_index"))
+                if os.path.exists(path):
+                    self._lexical_index = BM25Index.load(path)
+                else:
+                    logger.warning(f"Hybrid retrieval enabled but no BM25 index at {path}; using vector search only. "
+                                   "Run the ingestion pipeline to build it.")
+        return self._lexical_index
+
+    def get_product_index(self) -> Optional[ProductIndex]:
+        """The product catalogue index built at ingestion (product filters, aggregate answers), if there is one."""
+        if self._product_index is None and not self._product_index_checked:
+            self._product_index_checked = True
+            retriever_config = self.config.get("retriever", {})
+            path = resolve_path(retriever_config.get("product_index_path", "data/product_index.json"))
+            if os.path.exists(path):
+                self._product_index = ProductIndex.load(path, top_rated=retriever_config.get("top_rated_products", 3))
+            else:
+                logger.warning(f"No product index at {path}; searching unfiltered and without product aggregates. "
+                               "Run the ingestion pipeline to build it.")
+        return self._product_index
+
+    def metadata_filter(self, query: str) -> Optional[dict]:
+        """Metadata filter for the products / star ratings the query names, or None (retriever.product_filter)."""
+        if not self.config.get("retriever", {}).get("product_filter", False):
+            return None
+        product_index = self.get_product_index()
+        return product_index.metadata_filter(query) if product_index is not None else None
 
+    def _fuse_lexical(self, query: str, vector_results: List[Tuple[Document, float]],
+                      filter: Optional[dict] = None) -> List[Tuple[Document, Optional[float]]]:
+        retriever_config = self.config.get("retriever", {})
+        top_k = retriever_config.get("top_k", 3)
+        lexical_index = self._get_lexical_index()
+        if lexical_index is None:
+            return vector_results[:top_k]
+
+        start = time.perf_counter()
+        lexical_results = self._lexical_results(lexical_index, query, vector_results, filter)
+        fused = reciprocal_rank_fusion(
+            [vector_results, [(doc, None) for doc in lexical_results]],
+            rrf_k=retriever_config.get("rrf_k", 60),
+        )[:top_k]
+        logger.info(f"BM25 search + fusion: {len(lexical_results)} lexical hits in "
+                    f"{(time.perf_counter() - start) * 1000:.1f}ms")
+        return fused
+
+    def _lexical_results(self, lexical_index: BM25Index, query: str, vector_results: List[Tuple[Document, float]],
+                         filter: Optional[dict] = None) -> List[Document]:
+        """
+        BM25 matches as Documents, best first. The index only holds document IDs: matches the vector
+        search already returned are reused, the rest are read from the vector store. A metadata filter
+        is checked on the documents read, so with one the ranking is walked a candidate pool at a time
+        (at most LEXICAL_FILTER_DEPTH pools) until a pool's worth of documents match.
+        """
+        k = self._candidate_k()
+        ranked = lexical_index.search(query, k=k * (LEXICAL_FILTER_DEPTH if filter else 1),
+                                      min_score=self.config.get("retriever", {}).get("bm25_min_score", MIN_SCORE))
+        known = {doc.id: doc for doc, _ in vector_results if doc.id is not None}
+        matches = []
+        for start in range(0, len(ranked), k):
+            pool = [doc_id for doc_id, _ in ranked[start:start + k]]
+            missing = [doc_id for doc_id in pool if doc_id not in known]
+            if missing:
+                known.update(fetch_documents(self.vstore, missing))
+            documents = [known[doc_id] for doc_id in pool if doc_id in known]
+            if filter:
+                selected = MetadataColumns([doc.metadata for doc in documents]).mask(filter)
+                documents = [doc for doc, keep in zip(documents, selected) if keep]
+            matches.extend(documents)
+            if len(matches) >= k:
+                break
+        return matches[:k]
+
+    def merge_results(self, *result_lists: List[Tuple[Document, Optional[float]]]) -> List[Tuple[Document, Optional[float]]]:
+        """Fuse several ranked result lists by reciprocal rank and keep the overall top-k."""
+        retriever_config = self.config.get("retriever", {})
+        fused = reciprocal_rank_fusion(list(result_lists), rrf_k=retriever_config.get("rrf_k", 60))
+        return fused[:retriever_config.get("top_k", 3)]
+
+    def filter_by_relevance(self, results: List[Tuple[Document, Optional[float]]],
+                            threshold: float = None) -> Tuple[List[Document], float]:
+        """
+        Drop documents whose vector similarity is below the threshold (retriever.relevance_threshold,
+        default RELEVANCE_THRESHOLD). Lexical-only matches (similarity None) are kept only when at
+        least one vector hit clears the threshold: an exact term match backs up a relevant result
+        set, but on its own (e.g. "world cup" matching a review) it does not make a question in scope.
+        """
+        if threshold is None:
+            threshold = self.config.get("retriever", {}).get("relevance_threshold", RELEVANCE_THRESHOLD)
         if not results:
             return [], 0.0
 
-        scores = [score for doc, score in results]
-        avg_score = sum(scores) / len(scores)
+        scores = [score for doc, score in results if score is not None]
+        avg_score = sum(scores) / len(scores) if scores else 0.0
 
         logger.info(f"Retrieved {len(results)} docs, avg similarity: {avg_score:.3f}")
 
-        relevant_docs = [doc for doc, score in results if score >= RELEVANCE_THRESHOLD]
+        in_scope = any(score is not None and score >= threshold for _, score in results)
+        relevant_docs = [doc for doc, score in results
+                         if (score is None and in_scope) or (score is not None and score >= threshold)]
         if len(relevant_docs) < len(results):
-            logger.info(f"Filtered to {len(relevant_docs)} relevant docs (threshold={RELEVANCE_THRESHOLD})")
+            logger.info(f"Filtered to {len(relevant_docs)} relevant docs (threshold={threshold})")
 
         return relevant_docs, avg_score
 
+    def stats(self) -> dict:
+        product_index = self._product_index
+        return {
+            "product_index": len(product_index) if product_index is not None else None,
+            "lexical_index": len(self._lexical_index) if self._lexical_index is not None else None,
+            **self.filter_counts,
+        }
+
+
+def _filter_kwargs(filter: Optional[dict]) -> dict:
+    # Only pass filter= when there is one, so stores without filter support keep working unfiltered
+    return {"filter": filter} if filter else {}
+
+
+def doc_key(doc: Document) -> tuple:
+    """Backend-independent identity for a review document."""
+    return doc.metadata.get("product_name"), doc.page_content
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Tuple[Document, Optional[float]]]],
+                           rrf_k: int = 60) -> List[Tuple[Document, Optional[float]]]:
+    """
+    Fuse ranked lists with RRF: each document scores sum(1 / (rrf_k + rank)) over the
+    lists it appears in. Returns (document, best vector similarity or None) in fused order.
+    """
+    fused: dict = {}
+    for results in result_lists:
+        for rank, (doc, score) in enumerate(results, 1):
+            key = doc_key(doc)
+            entry = fused.setdefault(key, {"doc": doc, "score": None, "rrf": 0.0})
+            entry["rrf"] += 1.0 / (rrf_k + rank)
+            if score is not None and (entry["score"] is None or score > entry["score"]):
+                entry["score"] = score
+    ordered = sorted(fused.values(), key=lambda entry: entry["rrf"], reverse=True)
+    return [(entry["doc"], entry["score"]) for entry in ordered]
+
+
+def queries_match(original: str, rewritten: str, min_overlap: float = 0.8) -> bool:
+    """True when two queries share enough terms (Jaccard) to retrieve the same documents."""
+    original_terms = set(re.findall(r"[a-z0-9]+", original.lower()))
+    rewritten_terms = set(re.findall(r"[a-z0-9]+", rewritten.lower()))
+    if not original_terms or not rewritten_terms:
+        return original.strip().lower() == rewritten.strip().lower()
+    overlap = len(original_terms & rewritten_terms) / len(original_terms | rewritten_terms)
+    return overlap >= min_overlap
+
 
 if __name__ == "__main__":
     retriever_obj = Retriever()
@@ -0,0 +1,214 @@
+"""
+Deterministic offline stand-ins for Groq, Google embeddings and the vector store,
+with configurable injected latency, so the app can be benchmarked without network
+access or API quota. Outputs depend only on their inputs, and latency jitter is
+derived from a hash of the input, so repeated runs do the same work.
+Each stand-in charges `connect_latency` once, on its first call, as a stand-in
+for the TCP + TLS setup a fresh connection pool pays, and with `max_concurrency`
+serves at most that many calls at a time, like a provider's concurrency limit.
+"""
+
+import os
+import re
+import sys
+import time
+import zlib
+import asyncio
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Retriever.bm25 import BM25Builder
+from Retriever.product_index import ProductIndexBuilder
+from utils.local_vector_store import LocalVectorStore
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _jittered(base: float, jitter: float, key: str) -> float:
+    """base scaled by a factor in [1 - jitter, 1 + jitter] fixed by the hash of `key`."""
+    if not base:
+        return 0.0
+    unit = zlib.crc32(key.encode("utf-8")) / 0xFFFFFFFF
+    return base * (1.0 + jitter * (2.0 * unit - 1.0))
+
+
+class _Upstream:
+    """Charges `connect_latency` on the first call only; admits `max_concurrency` calls at once (0 = unlimited)."""
+
+    # Set by each subclass: connect_latency, max_concurrency, _connected = False, _slots = None
+
+    def _connect_delay(self) -> float:
+        if self._connected:
+            return 0.0
+        self._connected = True
+        return self.connect_latency
+
+    @asynccontextmanager
+    async def _slot(self):
+        if not self.max_concurrency:
+            yield
+            return
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        async with self._slots:
+            yield
+
+
+class FakeChatModel(_Upstream, BaseChatModel):
+    """
+    Chat model that answers from its prompt: rewrite prompts get the question back,
+    summary prompts a short summary, and product_bot prompts an answer quoting the
+    first retrieved review. Latency = latency + token_latency per output word.
+    """
+
+    latency: float = 0.3
+    token_latency: float = 0.01
+    jitter: float = 0.2
+    connect_latency: float = 0.0
+    max_concurrency: int = 0
+    _connected: bool = PrivateAttr(default=False)
+    _slots: Optional[asyncio.Semaphore] = PrivateAttr(default=None)
+
+    @property
+    def _llm_type(self) -> str:
+        return "offline-fake-chat"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        prompt = messages[-1].content if messages else ""
+        if "REWRITTEN SEARCH QUERY:" in prompt:
+            match = re.search(r"USER QUESTION: (.*)", prompt)
+            return match.group(1).strip() if match else prompt[-80:]
+        if "UPDATED SUMMARY:" in prompt:
+            return "The customer is comparing products discussed earlier and asked about their reviews."
+        match = re.search(r"RETRIEVED PRODUCT REVIEWS:\s*(.*?)\n\n", prompt, re.S)
+        evidence = " ".join((match.group(1) if match else "").split()[:30])
+        return f"Based on customer reviews, {evidence} Overall, buyers are mostly satisfied with it."
+
+    def _delays(self, messages: List[BaseMessage], reply: str):
+        key = messages[-1].content if messages else ""
+        return (self._connect_delay() + _jittered(self.latency, self.jitter, key),
+                _jittered(self.token_latency, self.jitter, key))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        reply = self._reply(messages)
+        first, per_token = self._delays(messages, reply)
+        time.sleep(first + per_token * len(reply.split()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        reply = self._reply(messages)
+        async with self._slot():
+            first, per_token = self._delays(messages, reply)
+            await asyncio.sleep(first + per_token * len(reply.split()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        reply = self._reply(messages)
+        async with self._slot():
+            first, per_token = self._delays(messages, reply)
+            await asyncio.sleep(first)
+            for word in reply.split(" "):
+                await asyncio.sleep(per_token)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+
+class FakeEmbeddings(_Upstream, Embeddings):
+    """
+    Hashed bag-of-words embeddings: texts sharing words get similar vectors, so
+    retrieval over the real catalogue still returns plausible reviews.
+    Each call costs `latency` plus `per_text_latency` per text.
+    """
+
+    def __init__(self, size: int = 256, latency: float = 0.05, per_text_latency: float = 0.0, jitter: float = 0.2,
+                 connect_latency: float = 0.0, max_concurrency: int = 0):
+        self.size = size
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.jitter = jitter
+        self.connect_latency = connect_latency
+        self.max_concurrency = max_concurrency
+        self._connected = False
+        self._slots = None
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            vector[zlib.crc32(token.encode("utf-8")) % self.size] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _delay(self, texts: List[str]) -> float:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        return (self._connect_delay() + _jittered(self.latency, self.jitter, texts[0] if texts else "")
+                + self.per_text_latency * len(texts))
+
+    # **kwargs absorbs provider options such as Gemini's task_type
+    def embed_documents(self, texts: List[str], **kwargs: Any) -> List[List[float]]:
+        time.sleep(self._delay(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str], **kwargs: Any) -> List[List[float]]:
+        async with self._slot():
+            await asyncio.sleep(self._delay(texts))
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeVectorStore(_Upstream, LocalVectorStore):
+    """The local NumPy index with `latency` seconds of simulated network round trip per search."""
+
+    def __init__(self, embedding: Embeddings, latency: float = 0.02, jitter: float = 0.2,
+                 connect_latency: float = 0.0, **kwargs: Any):
+        super().__init__(embedding, **kwargs)
+        self.latency = latency
+        self.jitter = jitter
+        self.connect_latency = connect_latency
+        self.max_concurrency = 0
+        self._connected = False
+        self._slots = None
+
+    async def asimilarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                                      filter: Optional[dict] = None, **kwargs: Any):
+        await asyncio.sleep(self._connect_delay() + _jittered(self.latency, self.jitter, str(embedding[:4])))
+        return await super().asimilarity_search_with_score_by_vector(embedding, k, filter, **kwargs)
+
+
+def build_catalogue(documents, embeddings: FakeEmbeddings, search_latency: float = 0.02,
+                    jitter: float = 0.2, path: str = None, connect_latency: float = 0.0):
+    """
+    Index `documents` into a FakeVectorStore (embedding them with no injected latency)
+    plus the BM25 and product indexes ingestion builds. Returns (vector_store, bm25_index, product_index).
+    """
+    documents = list({doc.id: doc for doc in documents}.values())  # identical rows share an ID
+    store = FakeVectorStore(embeddings, latency=search_latency, jitter=jitter, connect_latency=connect_latency,
+                            path=path or tempfile.mkdtemp(prefix="offline_index_"))
+    texts = [doc.page_content for doc in documents]
+    store.add_embeddings(texts, [embeddings._vector(text) for text in texts],
+                         [doc.metadata for doc in documents], [doc.id for doc in documents])
+    builder = BM25Builder()
+    product_builder = ProductIndexBuilder()
+    for doc in documents:
+        builder.add(doc)
+        product_builder.add(doc)
+    return store, builder.build(), product_builder.build()
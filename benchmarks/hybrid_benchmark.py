@@ -0,0 +1,71 @@
+"""
+Compare vector-only and hybrid (BM25 + vector, reciprocal rank fusion) retrieval.
+For each query, reports search latency and whether the expected product appears
+in the top_k results, so lexical matches on titles and model numbers can be
+weighed against the extra fusion cost.
+
+Usage:
+    python data_ingestion/ingestion_pipeline.py   # builds the BM25 index
+    python benchmarks/hybrid_benchmark.py --repeats 5
+"""
+
+import sys
+import os
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Retriever.retrieval import Retriever
+
+# (query, substring expected in a retrieved product_name)
+QUERIES = [
+    ("Rockerz 235v2", "Rockerz 235v2"),
+    ("BoAt Rockerz 235v2 battery backup", "Rockerz 235v2"),
+    ("Airdopes 131 sound quality", "Airdopes 131"),
+    ("good budget headphones with deep bass", "Headset"),
+    ("neckband for running", "Neckband"),
+]
+
+
+def set_hybrid(retriever_obj: Retriever, enabled: bool):
+    retriever_obj.config.setdefault("retriever", {})["hybrid"] = enabled
+    retriever_obj._lexical_index = None
+    retriever_obj._lexical_index_checked = False
+
+
+def run_mode(retriever_obj: Retriever, repeats: int) -> dict:
+    latencies = []
+    hits = 0
+    for query, expected in QUERIES:
+        for attempt in range(repeats):
+            start = time.perf_counter()
+            docs, _ = retriever_obj.call_retriever_with_scores(query)
+            latencies.append(time.perf_counter() - start)
+            if attempt == 0:
+                hits += any(expected.lower() in str(doc.metadata.get("product_name", "")).lower() for doc in docs)
+    return {
+        "hit_rate": hits / len(QUERIES),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark vector-only vs hybrid retrieval.")
+    parser.add_argument("--repeats", type=int, default=5, help="timed searches per query")
+    args = parser.parse_args()
+
+    retriever_obj = Retriever()
+    # Warm up the vector store connection and embedding cache before timing
+    retriever_obj.call_retriever_with_scores(QUERIES[0][0])
+
+    for label, enabled in (("vector-only", False), ("hybrid     ", True)):
+        set_hybrid(retriever_obj, enabled)
+        result = run_mode(retriever_obj, args.repeats)
+        print(
+            f"{label}  expected-product hit rate={result['hit_rate']:.2f}  "
+            f"p50={result['p50_ms']:.1f}ms  mean={result['mean_ms']:.1f}ms  max={result['max_ms']:.1f}ms"
+        )
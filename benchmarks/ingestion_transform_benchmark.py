@@ -0,0 +1,150 @@
+"""
+Benchmark the ingestion transform: the original iterrows() two-pass version
+against the chunked streaming iter_documents() generator, and against the full
+transform chain of run_pipeline (ID dedup, ProductIndexBuilder, BM25Builder and,
+with snapshot.enabled, SnapshotBuilder, then building the indexes).
+Each mode runs in its own process so peak RSS is measured independently;
+the streaming modes consume documents in upsert-sized batches and drop them,
+as store_in_vector_db does.
+
+Only the bare "streaming" mode runs in memory independent of the catalogue
+size. The builders of the "pipeline" mode keep per-document state until the
+run ends (postings and document IDs for BM25, document IDs per product, the
+seen-ID map, and document IDs for the snapshot, whose texts and metadata are
+spilled to disk), so its peak RSS still grows linearly with the row count.
+
+Usage:
+    python benchmarks/ingestion_transform_benchmark.py --rows 200000 --chunksize 10000
+"""
+
+import sys
+import os
+import time
+import argparse
+import itertools
+import resource
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from langchain_core.documents import Document
+from data_ingestion.ingestion_pipeline import BATCH_SIZE, iter_documents
+from data_ingestion.snapshot import SnapshotBuilder
+from Retriever.bm25 import BM25Builder
+from Retriever.product_index import ProductIndexBuilder
+
+SOURCE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "data.csv")
+
+
+def make_csv(rows: int) -> str:
+    """
+    Repeat the sample catalogue until it has `rows` rows. Each copy gets its own product IDs
+    and review suffix, so rows stay distinct documents rather than collapsing onto one ID.
+    """
+    sample = pd.read_csv(SOURCE_CSV)
+    path = os.path.join(tempfile.mkdtemp(), "catalogue.csv")
+    written = 0
+    with open(path, "w", newline="") as f:
+        for copy in itertools.count():
+            if written >= rows:
+                break
+            part = sample.head(rows - written).copy()
+            if copy:
+                part["product_id"] = part["product_id"].astype(str) + f"-{copy}"
+                part["review"] = part["review"].astype(str) + f" ({copy})"
+            part.to_csv(f, index=False, header=written == 0)
+            written += len(part)
+    return path
+
+
+def iterrows_transform(csv_path: str) -> int:
+    """The pre-streaming transform: full DataFrame, iterrows(), intermediate dicts, then Documents."""
+    product_data = pd.read_csv(csv_path)
+    product_list = []
+    for _, row in product_data.iterrows():
+        product_list.append({
+            "product_name": row["product_title"],
+            "product_rating": row["rating"],
+            "product_summary": row["summary"],
+            "product_review": row["review"],
+        })
+    documents = []
+    for entry in product_list:
+        metadata = {
+            "product_name": entry["product_name"],
+            "product_rating": entry["product_rating"],
+            "product_summary": entry["product_summary"],
+        }
+        documents.append(Document(page_content=entry["product_review"], metadata=metadata))
+    return len(documents)
+
+
+def streaming_transform(csv_path: str, chunksize: int) -> int:
+    count = 0
+    documents = iter_documents(csv_path, chunksize=chunksize)
+    for batch in iter(lambda: list(itertools.islice(documents, BATCH_SIZE)), []):
+        count += len(batch)
+    return count
+
+
+def pipeline_transform(csv_path: str, chunksize: int) -> int:
+    """The transform chain of run_pipeline, up to (not including) embedding and upsert."""
+    current = {}
+    lexical_builder = BM25Builder()
+    product_builder = ProductIndexBuilder()
+    snapshot_builder = SnapshotBuilder(spill_dir=tempfile.mkdtemp())
+
+    def unique_documents():
+        for doc in iter_documents(csv_path, chunksize=chunksize):
+            if doc.id not in current:
+                current[doc.id] = doc.metadata.get("product_id")
+                yield doc
+
+    documents = snapshot_builder.consume(lexical_builder.consume(product_builder.consume(unique_documents())))
+    count = 0
+    for batch in iter(lambda: list(itertools.islice(documents, BATCH_SIZE)), []):
+        count += len(batch)
+    lexical_builder.build()
+    product_builder.build()
+    snapshot_builder.close()
+    return count
+
+
+MODES = {"iterrows": iterrows_transform, "streaming": streaming_transform, "pipeline": pipeline_transform}
+
+
+def run_mode(mode: str, csv_path: str, chunksize: int, queue):
+    start = time.perf_counter()
+    if mode == "iterrows":
+        rows = iterrows_transform(csv_path)
+    else:
+        rows = MODES[mode](csv_path, chunksize)
+    elapsed = time.perf_counter() - start
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    queue.put({"mode": mode, "rows": rows, "seconds": elapsed, "peak_rss_mb": peak_rss_mb})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion transform.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--chunksize", type=int, default=10_000)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    csv_path = make_csv(args.rows)
+    print(f"Synthetic catalogue: {args.rows} rows at {csv_path}")
+    context = multiprocessing.get_context("spawn")
+    for mode in args.modes:
+        queue = context.Queue()
+        process = context.Process(target=run_mode, args=(mode, csv_path, args.chunksize, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        print(
+            f"{result['mode']:<10} rows={result['rows']}  "
+            f"rows/sec={result['rows'] / result['seconds']:,.0f}  "
+            f"time={result['seconds']:.2f}s  peak RSS={result['peak_rss_mb']:.1f} MB"
+        )
+    os.remove(csv_path)
@@ -0,0 +1,111 @@
+"""
+Concurrent load test for the /get chat endpoint.
+Sends a fixed number of requests at increasing concurrency levels against a
+single running server and reports throughput and latency per level. With a
+non-blocking request path, throughput should grow with concurrency instead of
+flat-lining at 1 / (per-request latency). Each concurrent simulated user keeps
+its own session cookie, so users never share (or lengthen) one conversation.
+
+Usage:
+    uvicorn main:app --port 8000 --workers 1
+    python benchmarks/load_test.py --url http://localhost:8000 --requests 32 --concurrency 1 2 4 8 16
+"""
+
+import os
+import sys
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from utils.metrics import percentile
+
+QUESTIONS = [
+    "Can you suggest good budget laptops?",
+    "What do customers say about battery life of phones?",
+    "Tell me about the best rated headphones",
+    "Are there any complaints about delivery?",
+    "Is the BoAt Rockerz 235v2 good for gaming?",
+]
+
+
+async def run_level(transport: httpx.AsyncBaseTransport, url: str, num_requests: int, concurrency: int,
+                    timeout: float) -> dict:
+    """
+    `concurrency` simulated users send `num_requests` requests between them, each user one at a
+    time. Every user has its own client, so its own session cookie and conversation history, while
+    all of them share the transport's connection pool.
+    """
+    latencies = []
+    errors = 0
+    request_numbers = iter(range(num_requests))
+
+    async def user():
+        nonlocal errors
+        # Not closed: closing a client closes the shared transport
+        client = httpx.AsyncClient(transport=transport, timeout=timeout)
+        for i in request_numbers:
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{url}/get", data={"msg": QUESTIONS[i % len(QUESTIONS)]})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except httpx.HTTPError:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": num_requests,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_p50_s": round(percentile(latencies, 50), 3),
+        "latency_p95_s": round(percentile(latencies, 95), 3),
+        "latency_mean_s": round(statistics.mean(latencies), 3) if latencies else 0.0,
+    }
+
+
+async def main(url: str, num_requests: int, levels: list, timeout: float) -> list:
+    results = []
+    async with httpx.AsyncHTTPTransport() as transport:
+        for concurrency in levels:
+            result = await run_level(transport, url, num_requests, concurrency, timeout)
+            results.append(result)
+            print(
+                f"concurrency={result['concurrency']:>3}  "
+                f"rps={result['throughput_rps']:>7}  "
+                f"p50={result['latency_p50_s']:>6}s  "
+                f"p95={result['latency_p95_s']:>6}s  "
+                f"errors={result['errors']}"
+            )
+
+    baseline = results[0]["throughput_rps"] if results else 0.0
+    if baseline:
+        print("\nThroughput scaling vs. concurrency=%d:" % results[0]["concurrency"])
+        for result in results:
+            print(f"  concurrency={result['concurrency']:>3}  x{result['throughput_rps'] / baseline:.2f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the /get endpoint.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=32, help="requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="optional path to write results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args.url, args.requests, args.concurrency, args.timeout))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,263 @@
+"""
+Offline load benchmark for the chat app.
+Runs main.app under an in-process uvicorn server with the LLM, embeddings and
+vector store replaced by the deterministic stand-ins in benchmarks/fakes.py
+(configurable injected latency), drives it with concurrent multi-turn chat
+sessions generated from data/data.csv, and reports throughput, client-side
+p50/p95/p99 latency and the per-stage breakdown recorded by the app's tracing.
+
+Coalescing (micro-batched query embeddings, single-flight rewrite/search/generation)
+follows config.yaml; --no-coalescing turns it off for an A/B run. --llm-concurrency
+and --embed-concurrency cap how many calls the stand-ins serve at once, like a
+provider's concurrency limit, which is where coalescing pays off.
+
+With --warmup, the app's startup warm-up probes run before load starts; the
+report includes the warm-up timings and the first request's latency per endpoint.
+
+With --baseline, exits non-zero if p95 latency or throughput regressed by more
+than --max-regression against a previous --output file.
+
+Usage:
+    python benchmarks/offline_benchmark.py --sessions 40 --turns 4 --concurrency 8
+    python benchmarks/offline_benchmark.py --endpoint stream --llm-latency 0.5 --output bench.json
+    python benchmarks/offline_benchmark.py --baseline bench.json --max-regression 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# No external service is contacted: every client is replaced by a stand-in below
+for var in ("GOOGLE_API_KEY", "GROQ_API_KEY", "ASTRA_DB_API_ENDPOINT", "ASTRA_DB_APPLICATION_TOKEN",
+            "ASTRA_DB_KEYSPACE", "PINECONE_API_KEY"):
+    os.environ.setdefault(var, "offline")
+
+import httpx
+import uvicorn
+
+import main
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings, build_catalogue
+from utils.coalescing import MicroBatchEmbeddings
+from utils.metrics import percentile
+from data_ingestion.ingestion_pipeline import iter_documents
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "data.csv")
+
+OPENERS = [
+    "What do customers say about the {name}?",
+    "Is the {name} worth buying?",
+    "How is the sound quality of the {name}?",
+    "Tell me about the {name}",
+]
+FOLLOW_UPS = [
+    "What about its battery life?",
+    "Any complaints about it?",
+    "Is it good for {use}?",
+    "How does it compare to the {other}?",
+    "Is the bass good on that one?",
+]
+USES = ["gaming", "running", "calls", "music", "travel", "the gym"]
+
+
+def synthetic_sessions(documents: list, sessions: int, turns: int, seed: int) -> list:
+    """One opener about a catalogue product, then follow-ups that need the conversation history."""
+    names = sorted({" ".join(str(doc.metadata["product_name"]).split()[:4]) for doc in documents})
+    rng = random.Random(seed)
+    result = []
+    for _ in range(sessions):
+        name = rng.choice(names)
+        questions = [rng.choice(OPENERS).format(name=name)]
+        for _ in range(turns - 1):
+            questions.append(rng.choice(FOLLOW_UPS).format(use=rng.choice(USES), other=rng.choice(names)))
+        result.append(questions)
+    return result
+
+
+def install_fakes(args, documents: list):
+    embeddings = FakeEmbeddings(latency=args.embed_latency, jitter=args.jitter, connect_latency=args.connect_latency,
+                                max_concurrency=args.embed_concurrency)
+    vector_store, bm25_index, product_index = build_catalogue(documents, embeddings, args.search_latency, args.jitter,
+                                               connect_latency=args.connect_latency)
+    llm = FakeChatModel(latency=args.llm_latency, token_latency=args.llm_token_latency, jitter=args.jitter,
+                        connect_latency=args.connect_latency, max_concurrency=args.llm_concurrency)
+
+    config = main.retriever_obj.config
+    coalescing_config = config.setdefault("coalescing", {})
+    if not args.coalescing:
+        coalescing_config.update(batch_query_embeddings=False, single_flight=False)
+        main.retriever_obj.search_flights = None
+    query_embeddings = embeddings
+    if coalescing_config.get("batch_query_embeddings", False):
+        query_embeddings = MicroBatchEmbeddings.from_config(embeddings, config)
+    main.model_loader._llm = llm
+    main.model_loader._embeddings = query_embeddings
+    vector_store.embedding = query_embeddings
+    main.retriever_obj.vstore = vector_store
+    main.retriever_obj._lexical_index = bm25_index if args.hybrid else None
+    main.retriever_obj._lexical_index_checked = True
+    main.retriever_obj._product_index = product_index
+    main.retriever_obj._product_index_checked = True
+    main.retriever_obj.config.setdefault("retriever", {})["hybrid"] = args.hybrid
+    main.retriever_obj.config["retriever"]["product_filter"] = args.product_filter
+    main.retriever_obj.config.setdefault("warmup", {})["enabled"] = args.warmup
+    main.startup()
+    if args.no_semantic_cache:
+        main.semantic_cache = None
+    return embeddings
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_load(args, sessions: list) -> dict:
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port,
+                                           log_level="warning", lifespan="off"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    await main.warmup()  # lifespan is off, so run the startup warm-up here, on the serving loop
+
+    path = "/stream" if args.endpoint == "stream" else "/get"
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = 0
+
+    async def run_session(client: httpx.AsyncClient, session_num: int, questions: list):
+        nonlocal errors
+        async with semaphore:
+            headers = {"X-Session-ID": f"offline-bench-session-{session_num:06d}"}
+            for question in questions:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(path, data={"msg": question}, headers=headers)
+                    response.raise_for_status()
+                    if path == "/stream" and "event: error" in response.text:
+                        raise httpx.HTTPError("stream error event")
+                    latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError:
+                    errors += 1
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    start = time.perf_counter()
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout, limits=limits) as client:
+        await asyncio.gather(*(run_session(client, i, questions) for i, questions in enumerate(sessions)))
+    elapsed = time.perf_counter() - start
+
+    server.should_exit = True
+    await server_task
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency": {
+            "p50_s": round(percentile(latencies, 50), 4),
+            "p95_s": round(percentile(latencies, 95), 4),
+            "p99_s": round(percentile(latencies, 99), 4),
+            "mean_s": round(statistics.mean(latencies), 4) if latencies else 0.0,
+        },
+    }
+
+
+def print_report(args, result: dict):
+    print(f"\nOffline benchmark: {args.sessions} sessions x {args.turns} turns, "
+          f"concurrency {args.concurrency}, endpoint /{args.endpoint}")
+    print(f"  injected latency: llm {args.llm_latency}s + {args.llm_token_latency}s/word, "
+          f"embed {args.embed_latency}s, search {args.search_latency}s (±{args.jitter:.0%}), "
+          f"connect {args.connect_latency}s once")
+    latency = result["latency"]
+    print(f"  requests={result['requests']}  errors={result['errors']}  elapsed={result['elapsed_s']}s  rps={result['rps']}")
+    print(f"  latency  p50={latency['p50_s']:.3f}s  p95={latency['p95_s']:.3f}s  "
+          f"p99={latency['p99_s']:.3f}s  mean={latency['mean_s']:.3f}s")
+    print(f"\n  {'stage':<28}{'count':>7}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, stats in sorted(result["stages"].items(), key=lambda item: -item[1]["mean_s"]):
+        print(f"  {name:<28}{stats['count']:>7}{stats['mean_s']:>9.4f}{stats['p50_s']:>9.4f}"
+              f"{stats['p95_s']:>9.4f}{stats['p99_s']:>9.4f}")
+    first = ", ".join(f"{endpoint} {seconds:.3f}s" for endpoint, seconds in result["first_request_s"].items())
+    print(f"\n  first request: {first}  warm-up: {result['warmup_s'] or 'off'}")
+    print(f"  embedding calls: {result['embedding_calls']}  "
+          f"rewrite LLM calls: {result['query_rewriter']['llm_calls']}/{result['query_rewriter']['requests']}")
+    coalescing = result["coalescing"]
+    if coalescing["query_embeddings"]:
+        print(f"  query embedding batches: {coalescing['query_embeddings']}")
+    for name in ("search", "generation"):
+        if coalescing[name]:
+            print(f"  single-flight {name}: {coalescing[name]['shared']}/{coalescing[name]['calls']} calls shared")
+
+
+def check_regression(result: dict, baseline_path: str, max_regression: float) -> bool:
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    p95, base_p95 = result["latency"]["p95_s"], baseline["latency"]["p95_s"]
+    rps, base_rps = result["rps"], baseline["rps"]
+    ok = p95 <= base_p95 * (1 + max_regression) and rps >= base_rps * (1 - max_regression)
+    print(f"\nvs. baseline {baseline_path}: p95 {base_p95:.3f}s → {p95:.3f}s, rps {base_rps} → {rps}  "
+          f"[{'OK' if ok else f'REGRESSION beyond {max_regression:.0%}'}]")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load benchmark with fake LLM/embeddings/vector store.")
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--turns", type=int, default=4, help="questions per session")
+    parser.add_argument("--concurrency", type=int, default=8, help="sessions in flight at once")
+    parser.add_argument("--endpoint", choices=["get", "stream"], default="get")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--llm-token-latency", type=float, default=0.01, help="seconds per generated word")
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.02)
+    parser.add_argument("--connect-latency", type=float, default=0.15,
+                        help="one-time connection setup cost charged on each stand-in's first call")
+    parser.add_argument("--jitter", type=float, default=0.2, help="± fraction applied to every injected latency")
+    parser.add_argument("--no-hybrid", dest="hybrid", action="store_false", help="vector search only")
+    parser.add_argument("--no-product-filter", dest="product_filter", action="store_false",
+                        help="search the whole catalogue even when a question names a product")
+    parser.add_argument("--no-semantic-cache", action="store_true")
+    parser.add_argument("--no-coalescing", dest="coalescing", action="store_false",
+                        help="disable query-embedding micro-batching and single-flight dedup")
+    parser.add_argument("--llm-concurrency", type=int, default=0, help="LLM calls served at once (0 = unlimited)")
+    parser.add_argument("--embed-concurrency", type=int, default=0, help="embedding calls served at once (0 = unlimited)")
+    parser.add_argument("--warmup", action="store_true", help="run the startup warm-up probes before the load")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from a previous --output run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    documents = list(iter_documents(CSV_PATH))
+    embeddings = install_fakes(args, documents)
+    sessions = synthetic_sessions(documents, args.sessions, args.turns, args.seed)
+    result = asyncio.run(run_load(args, sessions))
+    result["stages"] = main.request_metrics.stage_summary()
+    result["query_rewriter"] = main.query_rewriter.stats()
+    result["embedding_calls"] = embeddings.calls
+    result["coalescing"] = {
+        "query_embeddings": main.model_loader._embeddings.stats()
+        if isinstance(main.model_loader._embeddings, MicroBatchEmbeddings) else None,
+        "search": main.retriever_obj.search_flights.stats() if main.retriever_obj.search_flights else None,
+        "generation": main.generation_flights.stats() if main.generation_flights else None,
+    }
+    result["first_request_s"] = {endpoint: round(seconds, 4)
+                                 for endpoint, seconds in main.request_metrics.first_requests.items()}
+    result["warmup_s"] = main.warmup_timings
+    result["config"] = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    print_report(args, result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline and not check_regression(result, args.baseline, args.max_regression):
+        sys.exit(1)
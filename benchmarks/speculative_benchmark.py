@@ -0,0 +1,68 @@
+"""
+Benchmark speculative retrieval against the sequential rewrite → search path.
+Runs follow-up questions (which always need an LLM rewrite) through
+main.prepare_chain_input with retriever.speculative off and on, and reports
+p50/p95 latency of the retrieval stage for each mode.
+
+Usage:
+    python benchmarks/speculative_benchmark.py --rounds 5
+"""
+
+import sys
+import os
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from utils.metrics import percentile
+
+SEED_TURN = {
+    "user": "Can you suggest good budget headphones?",
+    "bot": "Customers like the BoAt Rockerz 235v2 for its bass and battery life at a low price.",
+}
+FOLLOW_UPS = [
+    "Is it good for gaming?",
+    "What about its battery life?",
+    "How does that one compare on sound quality?",
+    "Any complaints about it?",
+]
+
+
+async def run_mode(speculative: bool, rounds: int) -> list:
+    main.retriever_obj.config.setdefault("retriever", {})["speculative"] = speculative
+    latencies = []
+    for round_num in range(rounds):
+        for i, question in enumerate(FOLLOW_UPS):
+            session_id = f"bench-{speculative}-{round_num}-{i}"
+            await main.session_store.aappend(session_id, SEED_TURN, main.MAX_HISTORY_TURNS)
+            # Vary the wording per round so the rewrite memo cache cannot short-circuit the LLM call
+            start = time.perf_counter()
+            await main.prepare_chain_input(f"{question} (round {round_num})", session_id)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run_benchmark(rounds: int):
+    main.startup()
+    main.semantic_cache = None  # measure the retrieval path itself
+
+    for speculative in (False, True):
+        latencies = await run_mode(speculative, rounds)
+        label = "speculative" if speculative else "sequential "
+        print(
+            f"{label}  n={len(latencies)}  "
+            f"p50={statistics.median(latencies):.3f}s  "
+            f"p95={percentile(latencies, 95):.3f}s  "
+            f"mean={statistics.mean(latencies):.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare sequential and speculative retrieval latency.")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.rounds))
@@ -0,0 +1,165 @@
+"""
+Cold-start cost of the API process, as paid by every new container.
+
+Each run is a fresh interpreter that imports main.py and then runs its startup
+hook (vector store, embedding model and LLM clients, caches). The vector store
+backend is switched to the local index (an empty temporary one), so no network
+call is made; dummy API keys are set where none are configured. --store-latency
+adds a sleep to the vector store connection, standing in for the collection
+lookup round-trips AstraDB or Pinecone make when their client is created. Reports the
+median interpreter, import and startup time, which optional SDKs importing
+main already loaded, and main's slowest direct imports (from -X importtime).
+
+With --baseline, exits non-zero if median import + startup time regressed by
+more than --max-regression against a previous --output file.
+
+Usage:
+    python benchmarks/startup_benchmark.py --runs 7
+    python benchmarks/startup_benchmark.py --runs 7 --store-latency 0.5 --output startup.json
+    python benchmarks/startup_benchmark.py --baseline startup.json --max-regression 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DUMMY_ENV = ("GOOGLE_API_KEY", "GROQ_API_KEY", "ASTRA_DB_API_ENDPOINT", "ASTRA_DB_APPLICATION_TOKEN",
+             "ASTRA_DB_KEYSPACE", "PINECONE_API_KEY")
+# Optional or backend-specific SDKs; the fewer of these `import main` loads, the cheaper a cold start
+HEAVY_MODULES = ("langchain_google_genai", "google.genai", "langchain_groq", "groq", "langchain_astradb",
+                 "astrapy", "langchain_pinecone", "pinecone", "pandas")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+loaded = [name for name in %r if name in sys.modules]
+import Retriever.retrieval as retrieval
+connect = retrieval.load_vector_store
+def load_vector_store(*args, **kwargs):
+    time.sleep(float(sys.argv[2]))
+    return connect(*args, **kwargs)
+retrieval.load_vector_store = load_vector_store
+config = main.retriever_obj.config
+config.setdefault("vector_store", {})["backend"] = "local"
+config["vector_store"].setdefault("local", {})["path"] = sys.argv[1]
+main.startup()
+ready = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "startup_s": ready - imported, "loaded_after_import": loaded}))
+""" % (HEAVY_MODULES,)
+
+
+def probe_env() -> dict:
+    env = dict(os.environ)
+    for var in DUMMY_ENV:
+        env.setdefault(var, "offline")
+    return env
+
+
+def run_probe(index_path: str, store_latency: float, importtime: bool = False) -> tuple:
+    """One cold start in a fresh interpreter. Returns (probe result, wall seconds, stderr)."""
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", PROBE, index_path,
+                                                                                str(store_latency)]
+    start = time.perf_counter()
+    completed = subprocess.run(command, cwd=ROOT, env=probe_env(), capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"Startup probe failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1]), wall, completed.stderr
+
+
+def slowest_imports(importtime_log: str, limit: int) -> list:
+    """main's direct imports by cumulative import time (microseconds in the -X importtime log)."""
+    entries = []
+    inside_main = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            cumulative_us = int(cumulative)
+        except ValueError:
+            continue  # the header line
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            inside_main.append((name.strip(), cumulative_us))
+        elif depth == 0 and name.strip() == "main":
+            entries = inside_main  # children are logged before their parent
+        if depth == 0:
+            inside_main = []
+    return [{"module": module, "cumulative_ms": round(us / 1000, 1)}
+            for module, us in sorted(entries, key=lambda entry: -entry[1])[:limit]]
+
+
+def run(runs: int, top: int, store_latency: float) -> dict:
+    imports, startups, walls = [], [], []
+    loaded = []
+    with tempfile.TemporaryDirectory(prefix="startup_bench_") as index_dir:
+        for _ in range(runs):
+            result, wall, _ = run_probe(index_dir, store_latency)
+            imports.append(result["import_s"])
+            startups.append(result["startup_s"])
+            walls.append(wall)
+            loaded = result["loaded_after_import"]
+        _, _, importtime_log = run_probe(index_dir, store_latency, importtime=True)
+    return {
+        "runs": runs,
+        "store_latency_s": store_latency,
+        "import_s": round(statistics.median(imports), 4),
+        "startup_s": round(statistics.median(startups), 4),
+        "ready_s": round(statistics.median(i + s for i, s in zip(imports, startups)), 4),
+        "process_wall_s": round(statistics.median(walls), 4),
+        "loaded_after_import": loaded,
+        "slowest_imports": slowest_imports(importtime_log, top),
+    }
+
+
+def print_report(result: dict):
+    print(f"\nStartup benchmark: median of {result['runs']} cold starts "
+          f"(vector store connection +{result['store_latency_s']}s)")
+    print(f"  import main     {result['import_s']:.3f}s")
+    print(f"  startup hook    {result['startup_s']:.3f}s")
+    print(f"  ready           {result['ready_s']:.3f}s  (process wall incl. interpreter and exit: "
+          f"{result['process_wall_s']:.3f}s)")
+    print(f"  SDKs loaded by import: {', '.join(result['loaded_after_import']) or 'none'}")
+    print("\n  slowest direct imports of main (cumulative):")
+    for entry in result["slowest_imports"]:
+        print(f"    {entry['cumulative_ms']:>8.1f} ms  {entry['module']}")
+
+
+def check_regression(result: dict, baseline_path: str, max_regression: float) -> bool:
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    ready, base_ready = result["ready_s"], baseline["ready_s"]
+    ok = ready <= base_ready * (1 + max_regression)
+    print(f"\nvs. baseline {baseline_path}: ready {base_ready:.3f}s → {ready:.3f}s  "
+          f"[{'OK' if ok else f'REGRESSION beyond {max_regression:.0%}'}]")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold import/startup time of the API process.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    parser.add_argument("--store-latency", type=float, default=0.0,
+                        help="seconds added to connecting the vector store (a remote store's setup round-trips)")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from a previous --output run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    result = run(args.runs, args.top, args.store_latency)
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline and not check_regression(result, args.baseline, args.max_regression):
+        sys.exit(1)
@@ -0,0 +1,81 @@
+import os
+import json
+from typing import Dict, List, Set
+
+
+class IngestionCheckpoint:
+    """
+    Append-only JSONL log of batch outcomes for one ingestion run, so a crashed or
+    partially failed run can be resumed without re-embedding finished batches.
+
+    The first line is a header with the run fingerprint (CSV, target store, batch
+    size, mode); a resume is only honoured when the fingerprint matches. Every
+    following line records one batch by its offset in the upsert stream:
+    {"offset": 40, "status": "done", "ids": [...]} or {"offset": 60, "status": "failed"}.
+    The last record for an offset wins, so a failed batch that later succeeds is done.
+    """
+
+    def __init__(self, path: str, fingerprint: dict):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.completed: Dict[int, List[str]] = {}
+        self.failed: Set[int] = set()
+        self._file = None
+
+    def open(self, resume: bool = False) -> bool:
+        """
+        Start logging. With resume=True, previous progress is loaded if the checkpoint
+        belongs to the same run; otherwise the file is started afresh.
+        Returns True if previous progress was resumed.
+        """
+        resumed = resume and self._load()
+        if resume and not resumed and os.path.exists(self.path):
+            print(f"Checkpoint at {self.path} belongs to a different run; starting from scratch.")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if resumed:
+            self._file = open(self.path, "a")
+        else:
+            self.completed, self.failed = {}, set()
+            self._file = open(self.path, "w")
+            self._write({"fingerprint": self.fingerprint})
+        return resumed
+
+    def _load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r") as f:
+            lines = f.read().splitlines()
+        if not lines or json.loads(lines[0]).get("fingerprint") != self.fingerprint:
+            return False
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break  # torn final line from a crash mid-write
+            if record["status"] == "done":
+                self.completed[record["offset"]] = record["ids"]
+                self.failed.discard(record["offset"])
+            else:
+                self.failed.add(record["offset"])
+        return True
+
+    def _write(self, record: dict):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def mark_done(self, offset: int, ids: List[str]):
+        self.completed[offset] = list(ids)
+        self.failed.discard(offset)
+        self._write({"offset": offset, "status": "done", "ids": list(ids)})
+
+    def mark_failed(self, offset: int):
+        self.failed.add(offset)
+        self._write({"offset": offset, "status": "failed"})
+
+    def close(self, remove: bool = False):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
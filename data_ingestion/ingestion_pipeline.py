@@ -1,34 +1,94 @@
 import os
 import time
+import asyncio
+import argparse
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from typing import List
+from typing import Iterable, Iterator, List
+from itertools import islice
 from langchain_core.documents import Document
-from langchain_astradb import AstraDBVectorStore
 from utils.model_loader import ModelLoader
-from utils.config_loader import load_config
-from langchain_pinecone import PineconeVectorStore
-from pinecone import ServerlessSpec,Pinecone
-from uuid import uuid4
+from utils.embedding_cache import CachedEmbeddings
+from utils.config_loader import load_config, resolve_path
+from Retriever.bm25 import BM25Builder
+from Retriever.product_index import ProductIndexBuilder
+from utils.vector_store_loader import (
+    BACKEND_ENV_VARS, clear_vector_store, fetch_vectors, get_backend, load_vector_store, store_has_documents,
+    store_key,
+)
+from utils.local_vector_store import LocalVectorStore
+from utils.semantic_cache import bump_collection_version
+from data_ingestion.manifest import IngestionManifest, document_id
+from data_ingestion.checkpoint import IngestionCheckpoint
+from data_ingestion.snapshot import EmbeddingSnapshot, SnapshotBuilder, current_version
+from data_ingestion.rate_limiter import RateLimiter, backoff_delay, estimate_tokens, is_rate_limit_error
 
-BATCH_SIZE = 20        # documents per batch (well under the 100/min free-tier limit)
-BATCH_DELAY = 65       # seconds to wait between batches for quota reset
+BATCH_SIZE = 20        # documents per batch (overridable via ingestion.batch_size)
 MAX_RETRIES = 5        # max retries per batch on rate-limit errors
+DEFAULT_CHUNKSIZE = 10_000   # CSV rows read per pandas chunk
+SNAPSHOT_CHUNK = 1000        # snapshot rows loaded into (or looked up in) a local store / embedding cache per call
+
+# Document field -> CSV column; override per field under ingestion.column_mapping in config.yaml
+DEFAULT_COLUMN_MAPPING = {
+    "product_id": "product_id",
+    "product_name": "product_title",
+    "product_rating": "rating",
+    "product_summary": "summary",
+    "product_review": "review",
+}
+REQUIRED_FIELDS = ("product_name", "product_rating", "product_summary", "product_review")
+
+
+def iter_documents(csv_path: str, column_mapping: dict = None, chunksize: int = DEFAULT_CHUNKSIZE) -> Iterator[Document]:
+    """
+    Read the CSV in chunks and yield one Document per review. Each chunk is
+    cleaned column-wise and converted to plain Python lists once, instead of
+    materializing a Series per row.
+    """
+    mapping = dict(column_mapping or DEFAULT_COLUMN_MAPPING)
+    header = set(pd.read_csv(csv_path, nrows=0).columns)
+    if mapping.get("product_id") not in header:
+        mapping.pop("product_id", None)  # optional column
+    fields = list(mapping)
+
+    for chunk in pd.read_csv(csv_path, usecols=list(mapping.values()), chunksize=chunksize):
+        columns = {}
+        for field in fields:
+            series = chunk[mapping[field]]
+            if field == "product_rating":
+                series = pd.to_numeric(series, errors="coerce")
+                columns[field] = series.astype(object).where(series.notna(), None).tolist()
+            else:
+                columns[field] = series.fillna("").astype(str).tolist()
+
+        reviews = columns.pop("product_review")
+        metadata_fields = list(columns)
+        for review, *values in zip(reviews, *columns.values()):
+            doc = Document(page_content=review, metadata=dict(zip(metadata_fields, values)))
+            doc.id = document_id(doc)
+            yield doc
+
+
 class DataIngestion:
     """
     Class to handle data transformation and ingestion into AstraDB vector store.
     """
 
-    def __init__(self):
+    def __init__(self, model_loader: ModelLoader = None):
         """
         Initialize environment variables, embedding model, and set CSV file path.
         """
         print("Initializing DataIngestion pipeline...")
-        self.model_loader=ModelLoader()
+        self.model_loader = model_loader or ModelLoader.shared()
+        self.config=load_config()
+        self.backend = get_backend(self.config)
         self._load_env_variables()
+        ingestion_config = self.config.get("ingestion", {})
+        self.column_mapping = {**DEFAULT_COLUMN_MAPPING, **ingestion_config.get("column_mapping", {})}
+        self.chunksize = ingestion_config.get("chunksize", DEFAULT_CHUNKSIZE)
         self.csv_path = self._get_csv_path()
-        self.product_data = self._load_csv()
-        self.config=load_config()
+        self._validate_csv()
 
     def _load_env_variables(self):
         """
@@ -36,17 +96,13 @@ class DataIngestion:
         """
         load_dotenv()
         
-        required_vars = ["GOOGLE_API_KEY", "ASTRA_DB_API_ENDPOINT", "ASTRA_DB_APPLICATION_TOKEN", "ASTRA_DB_KEYSPACE","PINECONE_API_KEY"]
+        required_vars = ["GOOGLE_API_KEY"] + BACKEND_ENV_VARS[self.backend]
         
         missing_vars = [var for var in required_vars if os.getenv(var) is None]
         if missing_vars:
             raise EnvironmentError(f"Missing environment variables: {missing_vars}")
         
         self.google_api_key = os.getenv("GOOGLE_API_KEY")
-        self.db_api_endpoint = os.getenv("ASTRA_DB_API_ENDPOINT")
-        self.db_application_token = os.getenv("ASTRA_DB_APPLICATION_TOKEN")
-        self.db_keyspace = os.getenv("ASTRA_DB_KEYSPACE")
-        self.pine_cone_api_key = os.getenv("PINECONE_API_KEY")
 
        
 
@@ -63,115 +119,505 @@ class DataIngestion:
 
         return csv_path
 
-    def _load_csv(self):
+    def _validate_csv(self):
         """
-        Load product data from CSV.
+        Check the CSV header against the configured column mapping without loading the rows.
         """
-        df = pd.read_csv(self.csv_path)
-        expected_columns = {'product_title', 'rating', 'summary', 'review'}
+        columns = set(pd.read_csv(self.csv_path, nrows=0).columns)
+        expected_columns = {self.column_mapping[field] for field in REQUIRED_FIELDS}
 
-        if not expected_columns.issubset(set(df.columns)):
+        if not expected_columns.issubset(columns):
             raise ValueError(f"CSV must contain columns: {expected_columns}")
 
-        return df
-
-    def transform_data(self):
+    def transform_data(self) -> Iterator[Document]:
         """
-        Transform product data into list of LangChain Document objects.
+        Stream product data from the CSV as LangChain Document objects, chunk by chunk.
         """
-        product_list = []
-
-        for _, row in self.product_data.iterrows():
-            product_entry = {
-                "product_name": row['product_title'],
-                "product_rating": row['rating'],
-                "product_summary": row['summary'],
-                "product_review": row['review']
-            }
-            product_list.append(product_entry)
-
-        documents = []
-        for entry in product_list:
-            metadata = {
-                "product_name": entry["product_name"],
-                "product_rating": entry["product_rating"],
-                "product_summary": entry["product_summary"]
-            }
-            doc = Document(page_content=entry["product_review"], metadata=metadata)
-            documents.append(doc)
+        return iter_documents(self.csv_path, self.column_mapping, self.chunksize)
 
-        print(f"Transformed {len(documents)} documents.")
-        return documents
-
-    def store_in_vector_db(self, documents: List[Document]):
+    def open_vector_store(self):
         """
-        Store documents into AstraDB vector store in batches to avoid rate limits.
+        Connect to the configured vector store, falling back to Pinecone if AstraDB is unreachable
+        and PINECONE_API_KEY is set; the Pinecone client is only imported for the fallback.
+        Sets self.active_backend to the backend actually in use.
         """
         try:
-            collection_name=self.config["astra_db"]["collection_name"]
-            vstore = AstraDBVectorStore(
-                embedding=self.model_loader.load_embeddings(),
-                collection_name=collection_name,
-                api_endpoint=self.db_api_endpoint,
-                token=self.db_application_token,
-                namespace=self.db_keyspace,
-            )
+            vstore = load_vector_store(self.config, self.model_loader.load_embeddings(), self.backend,
+                                       clients=self.model_loader.clients)
+            self.active_backend = self.backend
         except Exception as e:
+            if self.backend != "astradb" or not all(os.getenv(var) for var in BACKEND_ENV_VARS["pinecone"]):
+                raise
             # Fallback to Pinecone if AstraDB connection fails
             print(f"AstraDB connection failed with error: {e}. Falling back to Pinecone.")
-            pinecone = Pinecone(api_key=self.pine_cone_api_key)
-            index_name=self.config["pinecone"]["index_name"]
-            if index_name not in pinecone.list_indexes():
-                pinecone.create_index(
-                    name=index_name,
-                    dimension=768,  
-                    serverless_spec=ServerlessSpec(min_nodes=1, max_nodes=3)
-                )
-            vstore = PineconeVectorStore(
-                index_name=index_name,
-                embedding=self.model_loader.load_embeddings(),
-            )
+            vstore = load_vector_store(self.config, self.model_loader.load_embeddings(), "pinecone",
+                                       clients=self.model_loader.clients)
+            self.active_backend = "pinecone"
+        return vstore
 
-        # --- Batch insertion with retry to respect free-tier rate limits ---
-        all_inserted_ids = []
-        total = len(documents)
-        total_batches = (total + BATCH_SIZE - 1) // BATCH_SIZE
+    def store_in_vector_db(self, documents: Iterable[Document], vstore=None, checkpoint: IngestionCheckpoint = None):
+        """
+        Store documents into the configured vector store in batches to avoid rate limits.
+        """
+        return asyncio.run(self.astore_in_vector_db(documents, vstore, checkpoint))
+
+    async def astore_in_vector_db(self, documents: Iterable[Document], vstore=None,
+                                  checkpoint: IngestionCheckpoint = None):
+        """
+        Embed and upsert batches concurrently (up to ingestion.max_concurrency in flight),
+        admitting each batch through requests-per-minute and tokens-per-minute token buckets.
+        Rate-limit errors are retried with jittered exponential backoff. Documents carry
+        deterministic IDs, so re-sending an existing document overwrites it.
+
+        Batches that still fail go to a retry queue that is drained after the main pass
+        (ingestion.retry_passes times, ingestion.retry_cooldown_seconds apart). With a
+        checkpoint, each batch outcome is logged by its offset in the document stream and
+        batches already completed in a resumed checkpoint are skipped without re-embedding.
+        Any other error stops the run: batches still in flight are cancelled, completed ones
+        are recorded, the failing batch is marked failed, and the error is re-raised.
+        """
+        if vstore is None:
+            vstore = self.open_vector_store()
 
-        for i in range(0, total, BATCH_SIZE):
-            batch = documents[i : i + BATCH_SIZE]
-            batch_num = i // BATCH_SIZE + 1
+        ingestion_config = self.config.get("ingestion", {})
+        batch_size = ingestion_config.get("batch_size", BATCH_SIZE)
+        max_retries = ingestion_config.get("max_retries", MAX_RETRIES)
+        backoff_base = ingestion_config.get("backoff_base_seconds", 2)
+        backoff_max = ingestion_config.get("backoff_max_seconds", 120)
+        retry_passes = ingestion_config.get("retry_passes", 1)
+        retry_cooldown = ingestion_config.get("retry_cooldown_seconds", 30)
+        limiter = RateLimiter(
+            ingestion_config.get("requests_per_minute", 100),
+            ingestion_config.get("tokens_per_minute", 30000),
+        )
+        in_flight = asyncio.Semaphore(ingestion_config.get("max_concurrency", 4))
+        embeddings = self.model_loader.load_embeddings()
+        # The local store is only durable once persisted, so its checkpoint records wait for persist()
+        durable_on_insert = not isinstance(vstore, LocalVectorStore)
 
-            for attempt in range(1, MAX_RETRIES + 1):
+        inserted_by_offset = {}
+        retry_queue = []  # (offset, batch) that exhausted their retries
+        errors = []  # (offset, exception) for batches that failed with a non-rate-limit error
+        tasks = []
+        retries = 0
+
+        async def insert_batch(offset: int, batch: List[Document]) -> bool:
+            nonlocal retries
+            batch_num = offset // batch_size + 1
+            # Batches whose embeddings are all cached locally use no embedding quota
+            texts = [doc.page_content for doc in batch]
+            uses_quota = not (isinstance(embeddings, CachedEmbeddings) and await embeddings.ais_cached(texts))
+
+            for attempt in range(1, max_retries + 1):
+                if uses_quota:
+                    # Each document counts as one embedding request against the quota, on every attempt
+                    await limiter.acquire(len(batch), sum(estimate_tokens(text) for text in texts))
                 try:
-                    print(f"Inserting batch {batch_num}/{total_batches}  ({len(batch)} docs)  [attempt {attempt}]...")
-                    inserted_ids = vstore.add_documents(batch)
-                    all_inserted_ids.extend(inserted_ids)
-                    break  # success — exit retry loop
+                    print(f"Inserting batch {batch_num}  ({len(batch)} docs)  [attempt {attempt}]...")
+                    inserted_by_offset[offset] = await vstore.aadd_documents(batch)
+                    if checkpoint and durable_on_insert:
+                        checkpoint.mark_done(offset, inserted_by_offset[offset])
+                    return True
                 except Exception as e:
-                    if "429" in str(e) or "ResourceExhausted" in str(e) or "quota" in str(e).lower():
-                        wait = BATCH_DELAY * attempt  # exponential-ish backoff
-                        print(f"  ⚠ Rate limited on batch {batch_num}. Waiting {wait}s before retry {attempt}/{MAX_RETRIES}...")
-                        time.sleep(wait)
-                    else:
+                    if not is_rate_limit_error(e):
                         raise  # re-raise non-rate-limit errors
-            else:
-                # All retries exhausted for this batch
-                print(f"  ✗ Failed to insert batch {batch_num} after {MAX_RETRIES} retries. Skipping.")
+                    limiter.record_rate_limit_error()
+                    retries += 1
+                    wait = backoff_delay(attempt, backoff_base, backoff_max)
+                    print(f"  ⚠ Rate limited on batch {batch_num}. Waiting {wait:.1f}s before retry {attempt}/{max_retries}...")
+                    await asyncio.sleep(wait)
+
+            # All retries exhausted for this batch
+            print(f"  ✗ Failed to insert batch {batch_num} after {max_retries} retries. Queued for retry.")
+            return False
+
+        async def run_batch(offset: int, batch: List[Document]):
+            try:
+                if not await insert_batch(offset, batch):
+                    retry_queue.append((offset, batch))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"  ✗ Batch {offset // batch_size + 1} failed with {e!r}. Cancelling the remaining batches.")
+                errors.append((offset, e))
+                for task in tasks:
+                    if task is not asyncio.current_task():
+                        task.cancel()
+            finally:
+                in_flight.release()
 
-            # Wait between batches (skip wait after the last batch)
-            if i + BATCH_SIZE < total:
-                print(f"Waiting {BATCH_DELAY}s to respect rate limits...")
-                time.sleep(BATCH_DELAY)
+        start = time.perf_counter()
+        total = 0
+        resumed = 0
+        document_stream = iter(documents)
+        batches = iter(lambda: list(islice(document_stream, batch_size)), [])
+        for batch_num, batch in enumerate(batches):
+            offset = batch_num * batch_size
+            total += len(batch)
+            if checkpoint and offset in checkpoint.completed:
+                inserted_by_offset[offset] = checkpoint.completed[offset]
+                resumed += len(batch)
+                continue
+            await in_flight.acquire()  # bounds batches in flight, and so documents held in memory
+            if errors:
+                break  # stop scheduling once a batch has failed for good
+            tasks.append(asyncio.create_task(run_batch(offset, batch)))
+        await asyncio.gather(*tasks, return_exceptions=True)
 
+        for retry_pass in range(1, retry_passes + 1):
+            if not retry_queue or errors:
+                break
+            print(f"Retry pass {retry_pass}/{retry_passes}: {len(retry_queue)} failed batches, "
+                  f"cooling down {retry_cooldown}s first...")
+            await asyncio.sleep(retry_cooldown)
+            queued, retry_queue[:] = list(retry_queue), []
+            for offset, batch in queued:
+                if not await insert_batch(offset, batch):
+                    retry_queue.append((offset, batch))
+        failed_offsets = sorted([offset for offset, _ in retry_queue] + [offset for offset, _ in errors])
+        elapsed = time.perf_counter() - start
+
+        if isinstance(vstore, LocalVectorStore):
+            vstore.persist()
+        if checkpoint:
+            if not durable_on_insert:
+                for offset in sorted(inserted_by_offset):
+                    if offset not in checkpoint.completed:
+                        checkpoint.mark_done(offset, inserted_by_offset[offset])
+            for offset in failed_offsets:
+                checkpoint.mark_failed(offset)
+        if errors:
+            print(f"Stopped after {len(inserted_by_offset)} batches were stored; rerun with --resume to continue.")
+            raise errors[0][1]
+
+        all_inserted_ids = [doc_id for offset in sorted(inserted_by_offset) for doc_id in inserted_by_offset[offset]]
+        print(f"Sent {total} new or changed documents for upsert"
+              + (f" ({resumed} already stored by the resumed run)." if resumed else "."))
         print(f"Successfully inserted {len(all_inserted_ids)} documents into vector store.")
-        return vstore, all_inserted_ids
+        print(
+            f"Throughput: {(len(all_inserted_ids) - resumed) / elapsed if elapsed else 0.0:.1f} docs/s over {elapsed:.1f}s  |  "
+            f"throttled {limiter.throttle_events} times ({limiter.throttled_seconds:.1f}s waiting)  |  "
+            f"rate-limit errors: {limiter.rate_limit_errors}, retries: {retries}, failed batches: {len(failed_offsets)}"
+        )
+        if failed_offsets:
+            print(f"  ✗ Batches at offsets {failed_offsets} still failed; rerun with --resume to retry only those.")
+        if isinstance(embeddings, CachedEmbeddings):
+            print(f"Embedding cache stats: {embeddings.stats()}")
+        return vstore, all_inserted_ids, failed_offsets
+
+    def save_lexical_index(self, builder: BM25Builder):
+        """
+        Freeze and save the BM25 index over product title, summary and review used for hybrid retrieval.
+        """
+        index = builder.build()
+        index_path = resolve_path(self.config.get("retriever", {}).get("bm25_path", "data/bm25_index"))
+        index.save(index_path)
+        print(f"Built BM25 index: {len(index)} documents, {len(index.vocab)} terms -> {index_path}")
+        return index
 
-    def run_pipeline(self):
+    def save_product_index(self, builder: ProductIndexBuilder):
         """
-        Run the full data ingestion pipeline: transform data and store into vector DB.
+        Freeze and save the product catalogue the retriever turns product and rating mentions
+        into metadata filters with. Its per-product aggregates (review count, rating histogram,
+        mean rating, most common summaries) also answer statistics questions in chat.
         """
-        documents = self.transform_data()
-        vstore, inserted_ids = self.store_in_vector_db(documents)
+        retriever_config = self.config.get("retriever", {})
+        index = builder.build(top_rated=retriever_config.get("top_rated_products", 3))
+        index_path = resolve_path(retriever_config.get("product_index_path", "data/product_index.json"))
+        index.save(index_path)
+        print(f"Built product index: {len(index)} products -> {index_path}")
+        return index
+
+    def _open_previous_snapshot(self, root: str, model_name: str):
+        if current_version(root) is None:
+            return None
+        try:
+            snapshot = EmbeddingSnapshot.open(root)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable snapshot under {root}: {e}")
+            return None
+        return snapshot if snapshot.model == model_name else None
+
+    def export_snapshot(self, builder: SnapshotBuilder, vstore, source: str = None):
+        """
+        Write the embedded corpus to a new snapshot version (see data_ingestion/snapshot.py), so
+        another environment can be rebuilt without re-embedding. Vectors are taken from the
+        previous snapshot, then the embedding cache, then read back from the vector store that
+        the run has just brought up to date. Nothing is ever embedded a second time: if a
+        document's vector is found in none of them, the export is refused.
+        """
+        snapshot_config = self.config.get("snapshot", {})
+        root = resolve_path(snapshot_config.get("path", "data/snapshots"))
+        model_name = self.config["embedding_model"]["model_name"]
+        previous = self._open_previous_snapshot(root, model_name)
+        if previous is not None and previous.ids == builder.ids:
+            print(f"Embedding snapshot {previous.version} is up to date ({len(previous)} documents).")
+            return previous
+
+        vectors = [None] * len(builder)
+        if previous is not None:
+            previous_rows = {doc_id: row for row, doc_id in enumerate(previous.ids)}
+            reused = [(position, previous_rows[doc_id]) for position, doc_id in enumerate(builder.ids)
+                      if doc_id in previous_rows]
+            if reused:
+                dense = previous.dense(np.array([row for _, row in reused]))
+                for (position, _), vector in zip(reused, dense):
+                    vectors[position] = vector
+        embeddings = self.model_loader.load_embeddings()
+        missing = [position for position, vector in enumerate(vectors) if vector is None]
+        if missing and isinstance(embeddings, CachedEmbeddings):
+            wanted = set(missing)
+            texts = {}
+            for position, text in enumerate(builder.texts()):
+                if position in wanted:
+                    texts[position] = text
+                if len(texts) == SNAPSHOT_CHUNK or position == len(builder) - 1:
+                    cached = embeddings.cached_vectors(list(texts.values()))
+                    for looked_up, text in texts.items():
+                        vectors[looked_up] = cached.get(text)
+                    texts = {}
+            missing = [position for position in missing if vectors[position] is None]
+        if missing:
+            print(f"Reading {len(missing)} vectors back from the vector store...")
+            stored = fetch_vectors(vstore, [builder.ids[position] for position in missing])
+            for position in missing:
+                vectors[position] = stored.get(builder.ids[position])
+            missing = [position for position in missing if vectors[position] is None]
+        if missing:
+            raise ValueError(f"{len(missing)} documents have no vector in the previous snapshot, the embedding cache "
+                             f"or the vector store (e.g. {builder.ids[missing[0]]}); not re-embedding them")
+
+        snapshot = builder.build(
+            root, np.asarray(vectors, dtype=np.float32), model_name, source=source,
+            quantize=snapshot_config.get("quantize", True), keep=snapshot_config.get("keep", 2),
+        )
+        size = f"{snapshot.stats()['vector_bytes'] / 2**20:.1f} MiB float32"
+        if snapshot.manifest["quantized"]:
+            int8_bytes = EmbeddingSnapshot.open(snapshot.path, quantized=True).stats()["vector_bytes"]
+            size += f", {int8_bytes / 2**20:.1f} MiB int8 + scales"
+        print(f"Exported embedding snapshot {snapshot.version}: {len(snapshot)} x {snapshot.dimension} "
+              f"({size}) -> {snapshot.path}")
+        return snapshot
+
+    def clear_store(self, vstore, manifest: IngestionManifest):
+        """Delete every document in the store and forget them in the manifest (--rebuild)."""
+        print(f"Clearing {manifest.store_key} before re-ingesting...")
+        clear_vector_store(vstore)
+        if isinstance(vstore, LocalVectorStore):
+            vstore.persist()
+        manifest.update({})
+        manifest.save()
+
+    def check_store_tracked(self, vstore, manifest: IngestionManifest, checkpoint_path: str = None):
+        """
+        Refuse to upsert into a non-empty store the manifest knows nothing about. Such a store was
+        most likely filled before document IDs became deterministic (random UUIDs), so upserting
+        would store every review a second time. If a checkpoint exists at `checkpoint_path`, the
+        documents are more likely a failed first run's batches, and --resume is suggested.
+        """
+        if not manifest.documents and store_has_documents(vstore):
+            if checkpoint_path and os.path.exists(checkpoint_path):
+                raise RuntimeError(
+                    f"{manifest.store_key} holds documents that {manifest.path} does not record yet, and "
+                    f"{checkpoint_path} records an unfinished run. Rerun with --resume to finish that run, "
+                    f"or with --rebuild to clear the store and ingest from scratch."
+                )
+            raise RuntimeError(
+                f"{manifest.store_key} already holds documents that {manifest.path} does not record "
+                f"(e.g. ingested before document IDs were deterministic); ingesting now would duplicate them. "
+                f"Rerun with --rebuild to clear the store and ingest from scratch."
+            )
+
+    def restore_snapshot(self, path: str = None, version: str = None, rebuild: bool = False):
+        """
+        Bulk-load an exported snapshot into the configured vector store instead of embedding the CSV.
+        The local store takes the vectors directly; for AstraDB and Pinecone they are seeded into the
+        embedding cache, so the usual batched upsert makes no embedding calls. The BM25 and product
+        indexes are rebuilt from the snapshot, and the manifest afterwards matches its documents.
+        rebuild=True empties the store first; otherwise an untracked non-empty store is refused.
+        """
+        root = resolve_path(path or self.config.get("snapshot", {}).get("path", "data/snapshots"))
+        snapshot = EmbeddingSnapshot.open(root, version)
+        model_name = self.config["embedding_model"]["model_name"]
+        if snapshot.model != model_name:
+            raise ValueError(f"Snapshot {snapshot.version} holds {snapshot.model} embeddings, "
+                             f"but the configured embedding model is {model_name}")
+        vstore = self.open_vector_store()
+        manifest = IngestionManifest(
+            resolve_path(self.config.get("ingestion", {}).get("manifest_path", "data/ingestion_manifest.json")),
+            store_key(self.config, self.active_backend),
+        )
+        if rebuild:
+            self.clear_store(vstore, manifest)
+        self.check_store_tracked(vstore, manifest)
+        previously_ingested = manifest.documents
+        print(f"Restoring snapshot {snapshot.version} ({len(snapshot)} documents) into {manifest.store_key}...")
+
+        lexical_builder = BM25Builder()
+        product_builder = ProductIndexBuilder()
+        restored = {}  # document ID -> product_id, for the manifest
+
+        def snapshot_documents():
+            for doc in snapshot.documents():
+                restored[doc.id] = doc.metadata.get("product_id")
+                yield doc
+
+        documents = lexical_builder.consume(product_builder.consume(snapshot_documents()))
+        if isinstance(vstore, LocalVectorStore):
+            documents = list(documents)
+            for start in range(0, len(documents), SNAPSHOT_CHUNK):
+                chunk = documents[start:start + SNAPSHOT_CHUNK]
+                vstore.add_embeddings([doc.page_content for doc in chunk], snapshot.dense(slice(start, start + len(chunk))),
+                                      metadatas=[doc.metadata for doc in chunk], ids=[doc.id for doc in chunk])
+            vstore.persist()
+            inserted_ids, failed_offsets = [doc.id for doc in documents], []
+        else:
+            embeddings = self.model_loader.load_embeddings()
+            if not isinstance(embeddings, CachedEmbeddings):
+                raise ValueError(f"Restoring into {self.active_backend} needs embedding_cache.enabled: "
+                                 f"the store embeds documents itself, and the cache is what hands it the snapshot's vectors")
+            for start in range(0, len(snapshot), SNAPSHOT_CHUNK):
+                end = min(start + SNAPSHOT_CHUNK, len(snapshot))
+                embeddings.seed([snapshot.text(row) for row in range(start, end)], snapshot.dense(slice(start, end)))
+            vstore, inserted_ids, failed_offsets = self.store_in_vector_db(documents, vstore)
+        self.save_lexical_index(lexical_builder)
+        self.save_product_index(product_builder)
+
+        removed_ids = [doc_id for doc_id in previously_ingested if doc_id not in restored]
+        if removed_ids:
+            vstore.delete(ids=removed_ids)
+            if isinstance(vstore, LocalVectorStore):
+                vstore.persist()
+            print(f"Deleted {len(removed_ids)} documents not in the snapshot.")
+        if failed_offsets:
+            print(f"Manifest left unchanged: {len(failed_offsets)} batches failed; rerun the restore to retry them.")
+        else:
+            manifest.update(restored)
+            manifest.save()
+            print(f"Manifest: {len(restored)} documents from snapshot {snapshot.version}, {len(removed_ids)} removed.")
+        if inserted_ids or removed_ids:
+            bump_collection_version(self.config)
+        return vstore
+
+    def checkpoint_path(self) -> str:
+        return resolve_path(self.config.get("ingestion", {}).get("checkpoint_path", "data/ingestion_checkpoint.jsonl"))
+
+    def open_checkpoint(self, manifest: IngestionManifest, full: bool, resume: bool) -> IngestionCheckpoint:
+        """
+        Open the batch checkpoint for this run. Batch offsets are only meaningful for the same
+        CSV, target store, batch size, mode and manifest, so those make up its fingerprint.
+        """
+        ingestion_config = self.config.get("ingestion", {})
+        csv_stat = os.stat(self.csv_path)
+        fingerprint = {
+            "store": manifest.store_key,
+            "csv": os.path.abspath(self.csv_path),
+            "csv_size": csv_stat.st_size,
+            "csv_mtime_ns": csv_stat.st_mtime_ns,
+            "column_mapping": self.column_mapping,
+            "batch_size": ingestion_config.get("batch_size", BATCH_SIZE),
+            "full": full,
+            "manifest_mtime_ns": os.stat(manifest.path).st_mtime_ns if os.path.exists(manifest.path) else None,
+        }
+        checkpoint = IngestionCheckpoint(self.checkpoint_path(), fingerprint)
+        if checkpoint.open(resume=resume):
+            print(f"Resuming from {checkpoint.path}: {len(checkpoint.completed)} batches already stored, "
+                  f"{len(checkpoint.failed)} to retry.")
+        return checkpoint
+
+    def run_pipeline(self, full: bool = False, resume: bool = False, rebuild: bool = False):
+        """
+        Run the full data ingestion pipeline: stream documents from the CSV straight into the vector DB.
+
+        By default only documents whose deterministic ID is not in the local manifest are
+        embedded and upserted, and documents that disappeared from the CSV are deleted.
+        With full=True every document is re-sent (upserted in place, never duplicated).
+
+        Batch outcomes are checkpointed as they complete. The manifest is only updated once
+        every batch has been stored; until then, resume=True continues from the checkpoint,
+        skipping completed batches and retrying failed or never-attempted ones.
+
+        A non-empty store with no manifest entries is refused (see check_store_tracked);
+        rebuild=True empties the store and ingests from scratch.
+        """
+        vstore = self.open_vector_store()
+        manifest = IngestionManifest(
+            resolve_path(self.config.get("ingestion", {}).get("manifest_path", "data/ingestion_manifest.json")),
+            store_key(self.config, self.active_backend),
+        )
+        if rebuild:
+            self.clear_store(vstore, manifest)
+        previously_ingested = manifest.documents
+        current = {}  # document ID -> product_id for every row in this CSV
+
+        lexical_builder = BM25Builder()
+        product_builder = ProductIndexBuilder()
+        snapshot_config = self.config.get("snapshot", {})
+        snapshot_builder = None
+        if snapshot_config.get("enabled", False):
+            snapshot_builder = SnapshotBuilder(spill_dir=resolve_path(snapshot_config.get("path", "data/snapshots")))
+
+        def unique_documents():
+            for doc in self.transform_data():
+                if doc.id not in current:  # identical rows collapse onto one ID
+                    current[doc.id] = doc.metadata.get("product_id")
+                    yield doc
+
+        def documents_to_upsert():
+            documents = lexical_builder.consume(product_builder.consume(unique_documents()))
+            if snapshot_builder is not None:
+                documents = snapshot_builder.consume(documents)
+            for doc in documents:
+                if full or doc.id not in previously_ingested:
+                    yield doc
+
+        if not resume:
+            # Checked before open_checkpoint starts the file afresh: a leftover one means --resume
+            self.check_store_tracked(vstore, manifest, self.checkpoint_path())
+        checkpoint = self.open_checkpoint(manifest, full, resume)
+        try:
+            if resume and not checkpoint.completed:  # a resumed run's own batches are expected in the store
+                self.check_store_tracked(vstore, manifest)
+            vstore, inserted_ids, failed_offsets = self.store_in_vector_db(documents_to_upsert(), vstore, checkpoint)
+        finally:
+            checkpoint.close()
+        self.save_lexical_index(lexical_builder)
+        self.save_product_index(product_builder)
+
+        # Rows that disappeared from the CSV are only known once it has been fully streamed
+        removed_ids = [doc_id for doc_id in previously_ingested if doc_id not in current]
+        if removed_ids:
+            vstore.delete(ids=removed_ids)
+            if isinstance(vstore, LocalVectorStore):
+                vstore.persist()
+            print(f"Deleted {len(removed_ids)} documents no longer in the catalogue.")
+
+        if failed_offsets:
+            # Keep the manifest (and so the checkpoint's batch offsets) as they were for --resume
+            print(f"Manifest left unchanged: {len(failed_offsets)} batches failed. "
+                  f"Progress is checkpointed in {checkpoint.path}.")
+        else:
+            inserted = set(inserted_ids)
+            ingested = {doc_id: product_id for doc_id, product_id in current.items()
+                        if doc_id in previously_ingested or doc_id in inserted}
+            manifest.update(ingested)
+            manifest.save()
+            checkpoint.close(remove=True)
+            print(f"Manifest: {len(ingested)}/{len(current)} documents ingested, "
+                  f"{len(inserted_ids)} upserted this run, {len(removed_ids)} removed.")
+
+        if inserted_ids or removed_ids:
+            # Invalidate cached answers served from the previous collection contents
+            bump_collection_version(self.config)
+
+        if snapshot_builder is not None:
+            if not failed_offsets and len(snapshot_builder):
+                # The store is already up to date; a failed export only leaves the previous snapshot current
+                try:
+                    self.export_snapshot(snapshot_builder, vstore, source=manifest.store_key)
+                except Exception as e:
+                    print(f"  ✗ Embedding snapshot export failed: {e!r}. The previous snapshot stays current.")
+            snapshot_builder.close()
 
         # Optionally do a quick search
         query = "Can you tell me the low budget headphone?"
@@ -183,5 +629,22 @@ class DataIngestion:
 
 # Run if this file is executed directly
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest the product review CSV into the vector store.")
+    parser.add_argument("--full", action="store_true",
+                        help="re-send every document instead of only new/changed ones")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted or partially failed run from its checkpoint")
+    parser.add_argument("--from-snapshot", nargs="?", const="", metavar="PATH",
+                        help="load an exported embedding snapshot (default: snapshot.path) into the vector store "
+                             "instead of embedding the CSV")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="delete every document in the vector store first, e.g. to migrate a collection "
+                             "ingested with random document IDs")
+    parser.add_argument("--snapshot-version", help="with --from-snapshot, the version to load (default: the current one)")
+    args = parser.parse_args()
+
     ingestion = DataIngestion()
-    ingestion.run_pipeline()
\ No newline at end of file
+    if args.from_snapshot is not None:
+        ingestion.restore_snapshot(args.from_snapshot or None, args.snapshot_version, rebuild=args.rebuild)
+    else:
+        ingestion.run_pipeline(full=args.full, resume=args.resume, rebuild=args.rebuild)
\ No newline at end of file
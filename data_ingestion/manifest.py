@@ -0,0 +1,50 @@
+import os
+import json
+import uuid
+import hashlib
+
+from langchain_core.documents import Document
+
+# Fixed namespace so document IDs are stable across runs and machines
+DOCUMENT_ID_NAMESPACE = uuid.UUID("6f1c2a52-3d0b-4f7e-9a51-0c8e2b7d4a10")
+
+
+def content_hash(doc: Document) -> str:
+    """SHA-256 over the review text and its metadata, so any field change yields a new hash."""
+    payload = json.dumps({"text": doc.page_content, "metadata": doc.metadata}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def document_id(doc: Document) -> str:
+    """Deterministic ID from product_id + content hash: re-ingesting an unchanged review upserts in place."""
+    product_id = doc.metadata.get("product_id") or doc.metadata.get("product_name", "")
+    return str(uuid.uuid5(DOCUMENT_ID_NAMESPACE, f"{product_id}:{content_hash(doc)}"))
+
+
+class IngestionManifest:
+    """
+    Local record of which document IDs are already in a vector store, keyed
+    by store (backend + collection) so switching backends starts clean.
+    """
+
+    def __init__(self, path: str, store_key: str):
+        self.path = path
+        self.store_key = store_key
+        self._stores = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self._stores = json.load(f).get("stores", {})
+
+    @property
+    def documents(self) -> dict:
+        """document ID -> product_id for everything ingested into this store."""
+        return self._stores.setdefault(self.store_key, {})
+
+    def update(self, documents: dict):
+        self._stores[self.store_key] = dict(documents)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"version": 1, "stores": self._stores}, f)
+        os.replace(self.path + ".tmp", self.path)
@@ -0,0 +1,75 @@
+import time
+import random
+import asyncio
+
+
+class TokenBucket:
+    """
+    Async token bucket: holds up to `capacity` tokens and refills at
+    `capacity / period` tokens per second.
+    """
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float) -> float:
+        """Take `amount` tokens, sleeping until they are available. Returns seconds waited."""
+        amount = min(amount, self.capacity)  # a single oversized request still gets through
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budgets for the embedding API,
+    plus counters for how often and how long callers were throttled.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.throttle_events = 0
+        self.throttled_seconds = 0.0
+        self.rate_limit_errors = 0
+
+    async def acquire(self, requests: int, tokens: int):
+        waited = await self.requests.acquire(requests)
+        waited += await self.tokens.acquire(tokens)
+        if waited > 0:
+            self.throttle_events += 1
+            self.throttled_seconds += waited
+
+    def record_rate_limit_error(self):
+        self.rate_limit_errors += 1
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for the TPM budget."""
+    return len(text) // 4 + 1
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter: uniform in [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    message = str(error)
+    return "429" in message or "ResourceExhausted" in message or "quota" in message.lower()
@@ -0,0 +1,414 @@
+import os
+import json
+import shutil
+import logging
+import tempfile
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"             # under the snapshot root: name of the latest complete version
+VECTORS_FILE = "vectors_f32.npy"     # (count, dimension) float32, L2-normalized rows
+QUANTIZED_FILE = "vectors_i8.npy"    # (count, dimension) int8
+SCALES_FILE = "scales_f32.npy"       # (count,) float32: row ≈ int8 row * scale
+COLUMNS_DIR = "columns"
+ID_COLUMN = "_id"
+TEXT_COLUMN = "_text"
+QUANTIZE_BLOCK_ROWS = 4096           # rows widened at a time while quantizing
+
+_MISSING = object()  # metadata field absent from a document (as opposed to None)
+
+
+class StringColumn:
+    """UTF-8 strings stored back to back in one byte array; row i is data[offsets[i]:offsets[i + 1]]."""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+    def tolist(self) -> List[str]:
+        return [self[row] for row in range(len(self))]
+
+
+def _column_type(values: list) -> str:
+    """str / int / float when every row has a value of that type (numbers may be None), else json."""
+    if any(value is _MISSING for value in values):
+        return "json"
+    if all(isinstance(value, str) for value in values):
+        return "str"
+    present = [value for value in values if value is not None]
+    for kind, python_type in (("int", int), ("float", float)):
+        if all(isinstance(value, python_type) and not isinstance(value, bool) for value in present):
+            return kind
+    return "json"
+
+
+def _save_column(directory: str, position: int, name: str, values: list) -> dict:
+    kind = _column_type(values)
+    if kind in ("int", "float"):
+        # float64 holds every rating-sized int exactly; NaN marks None
+        column = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        file = f"{position}.npy"
+        np.save(os.path.join(directory, file), column)
+        return {"name": name, "type": kind, "files": [file]}
+    if kind == "json":
+        # "" (never valid JSON) marks rows without the field
+        values = ["" if value is _MISSING else json.dumps(value, default=_json_default) for value in values]
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded], dtype=np.int64)
+    files = [f"{position}.utf8.npy", f"{position}.offsets.npy"]
+    np.save(os.path.join(directory, files[0]), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    np.save(os.path.join(directory, files[1]), offsets)
+    return {"name": name, "type": kind, "files": files}
+
+
+def quantize_rows(vectors: np.ndarray) -> tuple:
+    """Symmetric per-row int8 quantization: row ≈ quantized row * scale, with scale = max |row| / 127."""
+    quantized = np.empty(vectors.shape, dtype=np.int8)
+    scales = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), QUANTIZE_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + QUANTIZE_BLOCK_ROWS], dtype=np.float32)
+        block_scales = np.abs(block).max(axis=1) / 127.0 if block.shape[1] else np.zeros(len(block))
+        block_scales[block_scales == 0] = 1.0
+        quantized[start:start + len(block)] = np.clip(np.rint(block / block_scales[:, None]), -127, 127)
+        scales[start:start + len(block)] = block_scales
+    return quantized, scales
+
+
+def current_version(root: str) -> Optional[str]:
+    """Name of the latest complete snapshot under `root`, or None before the first export."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def list_versions(root: str) -> List[str]:
+    """Complete snapshot versions under `root`, oldest first (version names sort by creation time)."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root)
+                  if not name.startswith(".") and os.path.exists(os.path.join(root, name, MANIFEST_FILE)))
+
+
+def prune_snapshots(root: str, keep: int) -> List[str]:
+    """Delete all but the newest `keep` versions; the current one is always kept."""
+    current = current_version(root)
+    versions = list_versions(root)
+    removed = [version for version in versions[: max(len(versions) - max(keep, 1), 0)] if version != current]
+    for version in removed:
+        shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+    return removed
+
+
+def write_snapshot(root: str, ids: List[str], texts: List[str], metadatas: List[dict], vectors: np.ndarray,
+                   model: str, source: str = None, quantize: bool = True, keep: int = 2) -> "EmbeddingSnapshot":
+    """
+    Write a new snapshot version under `root` and make it current. The version is
+    assembled in a hidden directory and renamed into place before CURRENT is
+    swapped, so readers only ever see complete snapshots.
+    """
+    def write_columns(directory: str) -> List[dict]:
+        fields = list(dict.fromkeys(key for metadata in metadatas for key in metadata))
+        columns = [_save_column(directory, 0, ID_COLUMN, list(ids)), _save_column(directory, 1, TEXT_COLUMN, list(texts))]
+        for position, field in enumerate(fields, 2):
+            columns.append(_save_column(directory, position, field,
+                                        [metadata.get(field, _MISSING) for metadata in metadatas]))
+        return columns
+
+    return _write_version(root, len(ids), vectors, write_columns, model, source, quantize, keep)
+
+
+def _write_version(root: str, count: int, vectors: np.ndarray, write_columns: Callable[[str], List[dict]],
+                   model: str, source: Optional[str], quantize: bool, keep: int) -> "EmbeddingSnapshot":
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) != count:
+        raise ValueError(f"Snapshot has {count} documents but {len(vectors)} vectors")
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = np.ascontiguousarray(vectors / norms, dtype=np.float32)
+
+    os.makedirs(root, exist_ok=True)
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    suffix = 1
+    while os.path.exists(os.path.join(root, version)):
+        version = f"{version.split('-')[0]}-{suffix}"
+        suffix += 1
+    staging = os.path.join(root, f".{version}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(os.path.join(staging, COLUMNS_DIR))
+
+    np.save(os.path.join(staging, VECTORS_FILE), vectors)
+    quantization = None
+    if quantize:
+        quantized, scales = quantize_rows(vectors)
+        np.save(os.path.join(staging, QUANTIZED_FILE), quantized)
+        np.save(os.path.join(staging, SCALES_FILE), scales)
+        quantization = {"file": QUANTIZED_FILE, "scales": SCALES_FILE, "dtype": "int8", "scheme": "symmetric-per-row"}
+
+    columns = write_columns(os.path.join(staging, COLUMNS_DIR))
+
+    manifest = {
+        "format": "embedding-snapshot",
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "model": model,
+        "source": source,
+        "count": count,
+        "dimension": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        "normalized": True,
+        "vectors": {"file": VECTORS_FILE, "dtype": "float32"},
+        "quantized": quantization,
+        "columns": columns,
+    }
+    with open(os.path.join(staging, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.rename(staging, os.path.join(root, version))
+
+    current_path = os.path.join(root, CURRENT_FILE)
+    with open(current_path + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(current_path + ".tmp", current_path)
+    prune_snapshots(root, keep)
+    return EmbeddingSnapshot.open(root, version)
+
+
+class EmbeddingSnapshot:
+    """
+    A versioned, portable copy of the embedded corpus: L2-normalized float32
+    vectors, optionally an int8 copy with one float32 scale per row, and the
+    document IDs, texts and metadata fields stored column by column. Every
+    file is a .npy array memory-mapped on open, so loading costs no copy and
+    only the pages a reader touches are read; the int8 variant needs a quarter
+    of the float32 variant's memory.
+
+    Vectors are stored normalized, which leaves cosine similarity (the metric
+    AstraDB, Pinecone and the local index use) unchanged.
+    """
+
+    def __init__(self, path: str, manifest: dict, vectors: np.ndarray, scales: Optional[np.ndarray],
+                 columns: Dict[str, dict]):
+        self.path = path
+        self.manifest = manifest
+        self.vectors = vectors
+        self.scales = scales  # None unless the int8 vectors were loaded
+        self._columns = columns
+        self._ids = None
+
+    @classmethod
+    def open(cls, root: str, version: str = None, quantized: bool = False) -> "EmbeddingSnapshot":
+        """Memory-map a snapshot: `version` under `root` (default: the current one), or `root` itself if it is a version."""
+        if os.path.exists(os.path.join(root, MANIFEST_FILE)):
+            path = root
+        else:
+            version = version or current_version(root)
+            if version is None:
+                raise FileNotFoundError(f"No embedding snapshot found under {root}")
+            path = os.path.join(root, version)
+        with open(os.path.join(path, MANIFEST_FILE), "r") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version", 0) > FORMAT_VERSION:
+            raise ValueError(f"Snapshot {path} has format version {manifest['format_version']}; "
+                             f"this code reads up to {FORMAT_VERSION}")
+
+        def load(*parts: str) -> np.ndarray:
+            return np.load(os.path.join(path, *parts), mmap_mode="r")
+
+        if quantized:
+            if not manifest.get("quantized"):
+                raise ValueError(f"Snapshot {path} was written without int8 vectors")
+            vectors, scales = load(manifest["quantized"]["file"]), load(manifest["quantized"]["scales"])
+        else:
+            vectors, scales = load(manifest["vectors"]["file"]), None
+        columns = {}
+        for column in manifest["columns"]:
+            arrays = [load(COLUMNS_DIR, file) for file in column["files"]]
+            columns[column["name"]] = {
+                "type": column["type"],
+                "values": arrays[0] if column["type"] in ("int", "float") else StringColumn(*arrays),
+            }
+        logger.info(f"Opened embedding snapshot {manifest['version']}: {manifest['count']} vectors "
+                    f"({'int8' if quantized else 'float32'}) from {path}")
+        return cls(path, manifest, vectors, scales, columns)
+
+    def __len__(self) -> int:
+        return self.manifest["count"]
+
+    @property
+    def version(self) -> str:
+        return self.manifest["version"]
+
+    @property
+    def model(self) -> str:
+        return self.manifest["model"]
+
+    @property
+    def dimension(self) -> int:
+        return self.manifest["dimension"]
+
+    @property
+    def ids(self) -> List[str]:
+        if self._ids is None:
+            self._ids = self._columns[ID_COLUMN]["values"].tolist()
+        return self._ids
+
+    def text(self, row: int) -> str:
+        return self._columns[TEXT_COLUMN]["values"][row]
+
+    def metadata(self, row: int) -> dict:
+        metadata = {}
+        for name, column in self._columns.items():
+            if name in (ID_COLUMN, TEXT_COLUMN):
+                continue
+            value = column["values"][row]
+            if column["type"] == "json":
+                if value == "":
+                    continue  # the document has no such field
+                value = json.loads(value)
+            elif column["type"] in ("int", "float"):
+                value = None if np.isnan(value) else (int(value) if column["type"] == "int" else float(value))
+            metadata[name] = value
+        return metadata
+
+    def documents(self) -> Iterator[Document]:
+        for row, doc_id in enumerate(self.ids):
+            yield Document(id=doc_id, page_content=self.text(row), metadata=self.metadata(row))
+
+    def dense(self, rows=slice(None)) -> np.ndarray:
+        """float32 vectors of `rows`: a view of the mapped file, or dequantized from the int8 rows."""
+        if self.scales is None:
+            return self.vectors[rows]
+        return self.vectors[rows].astype(np.float32) * self.scales[rows, None]
+
+    def to_vector_store(self, embedding, index_type: str = "exact", nlist: int = 64, nprobe: int = 8):
+        """
+        A read-only LocalVectorStore over the mapped files: vectors are searched in place
+        (int8 ones widened a block at a time), and IDs, texts and metadata are decoded from
+        their columns only for the rows a search returns.
+        """
+        from utils.local_vector_store import LocalVectorStore
+        return LocalVectorStore.from_arrays(
+            embedding, self.vectors, self._columns[ID_COLUMN]["values"], self._columns[TEXT_COLUMN]["values"],
+            MetadataRows(self), scales=self.scales, index_type=index_type, nlist=nlist, nprobe=nprobe,
+        )
+
+    def stats(self) -> dict:
+        float32_bytes = len(self) * self.dimension * 4
+        vector_bytes = self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+        return {
+            "version": self.version,
+            "model": self.model,
+            "count": len(self),
+            "dimension": self.dimension,
+            "quantized": self.scales is not None,
+            "vector_bytes": int(vector_bytes),
+            "float32_bytes": float32_bytes,
+        }
+
+
+class MetadataRows:
+    """Read-only sequence of a snapshot's metadata dicts, each decoded from the columns when accessed."""
+
+    def __init__(self, snapshot: EmbeddingSnapshot):
+        self.snapshot = snapshot
+
+    def __len__(self) -> int:
+        return len(self.snapshot)
+
+    def __getitem__(self, row: int) -> dict:
+        if not -len(self) <= row < len(self):
+            raise IndexError(row)
+        return self.snapshot.metadata(row % len(self))
+
+    def __iter__(self) -> Iterator[dict]:
+        return (self.snapshot.metadata(row) for row in range(len(self)))
+
+
+class SnapshotBuilder:
+    """
+    Collects the documents of an ingestion run (e.g. from a streaming transform) for a snapshot.
+    Only the IDs stay in memory: the text and each metadata field are appended, one JSON value
+    per line, to their own file in a temporary directory (under `spill_dir` if given) as rows
+    arrive, and read back one column at a time when the snapshot is written.
+    """
+
+    def __init__(self, spill_dir: str = None):
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._spill = tempfile.TemporaryDirectory(prefix=".rows-", dir=spill_dir)
+        self._files: Dict[str, tuple] = {}  # column -> (spill file, row its first line belongs to)
+        self._encoder = json.JSONEncoder(default=_json_default)  # json.dumps would build one per value
+        self.ids: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, doc: Document):
+        row = len(self.ids)
+        values = {TEXT_COLUMN: doc.page_content, **doc.metadata}
+        for name in [name for name in values if name not in self._files]:
+            path = os.path.join(self._spill.name, f"{len(self._files)}.jsonl")
+            self._files[name] = (open(path, "w", encoding="utf-8"), row)
+        for name, (file, _) in self._files.items():
+            # a blank line marks a row without the field
+            file.write(self._encoder.encode(values[name]) + "\n" if name in values else "\n")
+        self.ids.append(doc.id)
+
+    def consume(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """Record documents as they stream past, yielding each one unchanged."""
+        for doc in documents:
+            self.add(doc)
+            yield doc
+
+    def _read_column(self, name: str) -> Iterator:
+        file, first_row = self._files[name]
+        file.flush()
+        for _ in range(first_row):
+            yield _MISSING
+        with open(file.name, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line) if line != "\n" else _MISSING
+
+    def texts(self) -> Iterator[str]:
+        """The documents' texts in order, read back from disk."""
+        return self._read_column(TEXT_COLUMN) if self._files else iter(())
+
+    def build(self, root: str, vectors: np.ndarray, model: str, source: str = None, quantize: bool = True,
+              keep: int = 2) -> EmbeddingSnapshot:
+        def write_columns(directory: str) -> List[dict]:
+            columns = [_save_column(directory, 0, ID_COLUMN, self.ids)]
+            names = [TEXT_COLUMN] + [name for name in self._files if name != TEXT_COLUMN]
+            for position, name in enumerate(names, 1):
+                columns.append(_save_column(directory, position, name, list(self._read_column(name))))
+            return columns
+
+        return _write_version(root, len(self.ids), vectors, write_columns, model, source, quantize, keep)
+
+    def close(self):
+        """Delete the spilled rows."""
+        for file, _ in self._files.values():
+            file.close()
+        self._files = {}
+        self._spill.cleanup()
+
+
+def _json_default(value):
+    # pandas hands us numpy scalars in metadata
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
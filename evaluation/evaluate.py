@@ -1,22 +1,32 @@
 """
 Offline evaluation of RAG pipeline quality.
-Measures retrieval relevance and answer faithfulness.
+Measures retrieval relevance and answer faithfulness, plus per-stage latency.
+
+Each test case is retrieved once and the same documents are scored and passed
+to the generator. Cases run concurrently, at most --workers at a time.
 
 Usage:
     python evaluation/evaluate.py
+    python evaluation/evaluate.py --cases evaluation/test_cases.json --workers 8
+    python evaluation/evaluate.py --snapshot data/snapshots --quantized
 """
 
 import sys
 import os
 import json
+import time
+import asyncio
 import logging
+import argparse
 from datetime import datetime
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from dotenv import load_dotenv
 from Retriever.retrieval import Retriever
-from utils.model_loader import ModelLoader
+from utils.context_builder import ContextBuilder
+from utils.metrics import LatencyTracker
+from utils.tracing import span, start_trace
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
@@ -24,41 +34,29 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-
-# --- Test cases: questions with expected traits ---
-TEST_CASES = [
-    {
-        "question": "Can you suggest good budget laptops?",
-        "expected_keywords": ["laptop", "budget", "price", "affordable"],
-        "should_have_product_name": True,
-    },
-    {
-        "question": "What do customers say about battery life of phones?",
-        "expected_keywords": ["battery", "phone", "hours", "charge"],
-        "should_have_product_name": True,
-    },
-    {
-        "question": "Tell me about the best rated headphones",
-        "expected_keywords": ["headphone", "sound", "quality", "rating"],
-        "should_have_product_name": True,
-    },
-    {
-        "question": "What is the capital of France?",
-        "expected_keywords": [],
-        "should_have_product_name": False,
-        "expect_redirect": True,  # Bot should say this is outside scope
-    },
-    {
-        "question": "Are there any complaints about delivery?",
-        "expected_keywords": ["delivery", "shipping", "late", "delay"],
-        "should_have_product_name": False,
-    },
-]
-
-
-def evaluate_retrieval(retriever_obj: Retriever, question: str, expected_keywords: list) -> dict:
-    """Check if retrieved documents are relevant to the question."""
-    docs = retriever_obj.call_retriever(question)
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CASES_PATH = os.path.join(EVAL_DIR, "test_cases.json")
+DEFAULT_OUTPUT_PATH = os.path.join(EVAL_DIR, "eval_results.json")
+
+
+def load_test_cases(path: str) -> list:
+    """
+    Test cases from a JSON list or a JSONL file (one case per line). Each case has a
+    "question" and "expected_keywords"; "should_have_product_name" and "expect_redirect"
+    are optional.
+    """
+    with open(path, "r") as f:
+        if path.endswith(".jsonl"):
+            cases = [json.loads(line) for line in f if line.strip()]
+        else:
+            cases = json.load(f)
+    for case in cases:
+        case.setdefault("expected_keywords", [])
+    return cases
+
+
+def evaluate_retrieval(docs: list, expected_keywords: list) -> dict:
+    """Check if the retrieved documents are relevant to the question."""
     combined_text = " ".join([doc.page_content.lower() for doc in docs])
 
     keyword_hits = sum(1 for kw in expected_keywords if kw.lower() in combined_text)
@@ -104,81 +102,108 @@ def evaluate_answer(answer: str, test_case: dict) -> dict:
     }
 
 
-def run_evaluation():
-    logger.info("Starting evaluation...")
+async def evaluate_case(retriever_obj: Retriever, chain, context_builder: ContextBuilder, test_case: dict) -> dict:
+    """Retrieve once, score the documents, and generate from the same documents."""
+    question = test_case["question"]
+    trace = start_trace("eval")
+    embedding = await retriever_obj.aembed_query(question)
+    results = await retriever_obj.asearch_with_scores(question, embedding=embedding)
+    docs, avg_score = retriever_obj.filter_by_relevance(results)
+    retrieval_result = evaluate_retrieval(docs, test_case["expected_keywords"])
+    retrieval_result["avg_similarity"] = round(avg_score, 4)
+
+    context, _ = context_builder.build_context(docs)
+    with span("generation"):
+        answer = await chain.ainvoke({"context": context, "question": question, "history": "No previous conversation."})
+    trace.stages["total"] = trace.elapsed()
+
+    return {
+        "question": question,
+        "retrieval": retrieval_result,
+        "answer": evaluate_answer(answer, test_case),
+        "raw_answer": answer,
+        "latency_s": {stage: round(seconds, 4) for stage, seconds in trace.stages.items()},
+    }
+
+
+async def arun_evaluation(cases_path: str = DEFAULT_CASES_PATH, workers: int = 4,
+                          output_path: str = DEFAULT_OUTPUT_PATH, snapshot: str = None,
+                          quantized: bool = False) -> dict:
+    test_cases = load_test_cases(cases_path)
+    logger.info(f"Starting evaluation: {len(test_cases)} cases from {cases_path}, {workers} workers...")
     retriever_obj = Retriever()
-    model_loader = ModelLoader()
-    llm = model_loader.load_llm()
-    retriever = retriever_obj.load_retriever()
+    llm = retriever_obj.model_loader.load_llm()
+    if snapshot is not None:
+        retriever_obj.use_snapshot(snapshot or None, quantized=quantized)
+    retriever_obj.load_retriever()
+    context_builder = ContextBuilder.from_config(retriever_obj.config)
 
     from prompt_library.prompt import PROMPT_TEMPLATES
-    prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATES["product_bot"])
-
-    chain = (
-        {
-            "context": lambda x: retriever.invoke(x["question"]),
-            "question": lambda x: x["question"],
-            "history": lambda x: "No previous conversation.",
-        }
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
-
-    results = []
-    total_retrieval_score = 0
-    total_answer_score = 0
-
-    for i, test_case in enumerate(TEST_CASES, 1):
-        question = test_case["question"]
-        logger.info(f"\n[Test {i}/{len(TEST_CASES)}] {question}")
-
-        # Evaluate retrieval
-        retrieval_result = evaluate_retrieval(retriever_obj, question, test_case["expected_keywords"])
-        logger.info(f"  Retrieval score: {retrieval_result['keyword_overlap_score']}")
-
-        # Evaluate answer
-        answer = chain.invoke({"question": question})
-        answer_result = evaluate_answer(answer, test_case)
-        logger.info(f"  Answer score: {answer_result['answer_keyword_score']}")
-        logger.info(f"  Answer preview: {answer[:100]}...")
-
-        total_retrieval_score += retrieval_result["keyword_overlap_score"]
-        total_answer_score += answer_result["answer_keyword_score"]
-
-        results.append({
-            "question": question,
-            "retrieval": retrieval_result,
-            "answer": answer_result,
-            "raw_answer": answer,
-        })
+    chain = ChatPromptTemplate.from_template(PROMPT_TEMPLATES["product_bot"]) | llm | StrOutputParser()
+
+    semaphore = asyncio.Semaphore(workers)
+
+    async def run_case(i: int, test_case: dict) -> dict:
+        async with semaphore:
+            result = await evaluate_case(retriever_obj, chain, context_builder, test_case)
+        logger.info(f"[Test {i}/{len(test_cases)}] {result['question']}  "
+                    f"retrieval={result['retrieval']['keyword_overlap_score']}  "
+                    f"answer={result['answer']['answer_keyword_score']}  "
+                    f"total={result['latency_s']['total']:.2f}s")
+        return result
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_case(i, case) for i, case in enumerate(test_cases, 1)))
+    elapsed = time.perf_counter() - start
+
+    latency = LatencyTracker(window=len(results) or 1)
+    for result in results:
+        for stage, seconds in result["latency_s"].items():
+            latency.record(stage, seconds)
 
     # Summary
-    n = len(TEST_CASES)
+    n = len(results)
     summary = {
         "timestamp": datetime.now().isoformat(),
         "num_tests": n,
-        "avg_retrieval_score": round(total_retrieval_score / n, 2),
-        "avg_answer_score": round(total_answer_score / n, 2),
+        "workers": workers,
+        "wall_time_s": round(elapsed, 3),
+        "avg_retrieval_score": round(sum(r["retrieval"]["keyword_overlap_score"] for r in results) / n, 2) if n else 0.0,
+        "avg_answer_score": round(sum(r["answer"]["answer_keyword_score"] for r in results) / n, 2) if n else 0.0,
+        "latency": latency.summary(),
         "results": results,
     }
 
     # Save results
-    os.makedirs("evaluation", exist_ok=True)
-    output_path = "evaluation/eval_results.json"
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
     with open(output_path, "w") as f:
         json.dump(summary, f, indent=2, default=str)
 
     logger.info(f"\n{'='*50}")
     logger.info(f"EVALUATION SUMMARY")
     logger.info(f"{'='*50}")
-    logger.info(f"Tests run:            {n}")
+    logger.info(f"Tests run:            {n} in {elapsed:.1f}s ({workers} workers)")
     logger.info(f"Avg retrieval score:  {summary['avg_retrieval_score']}")
     logger.info(f"Avg answer score:     {summary['avg_answer_score']}")
+    for stage, stats in summary["latency"].items():
+        logger.info(f"  {stage:<16} p50={stats['p50_s']:.3f}s  p95={stats['p95_s']:.3f}s")
     logger.info(f"Results saved to:     {output_path}")
 
     return summary
 
 
+def run_evaluation(cases_path: str = DEFAULT_CASES_PATH, workers: int = 4, output_path: str = DEFAULT_OUTPUT_PATH,
+                   snapshot: str = None, quantized: bool = False) -> dict:
+    return asyncio.run(arun_evaluation(cases_path, workers, output_path, snapshot, quantized))
+
+
 if __name__ == "__main__":
-    run_evaluation()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Evaluate retrieval relevance and answer quality.")
+    parser.add_argument("--cases", default=DEFAULT_CASES_PATH, help="JSON list or JSONL file of test cases")
+    parser.add_argument("--workers", type=int, default=4, help="test cases evaluated concurrently")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_PATH)
+    parser.add_argument("--snapshot", nargs="?", const="",
+                        help="search an exported embedding snapshot (default: snapshot.path) instead of the vector store")
+    parser.add_argument("--quantized", action="store_true", help="with --snapshot, search its int8 vectors")
+    args = parser.parse_args()
+    run_evaluation(args.cases, args.workers, args.output, args.snapshot, args.quantized)
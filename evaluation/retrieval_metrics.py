@@ -0,0 +1,197 @@
+"""
+Retrieval quality against labelled relevant product IDs, swept over top_k and
+the relevance threshold.
+
+A retrieved review counts as relevant when its product_id is one of the
+question's labelled products. For every (top_k, threshold) setting this reports:
+    recall@k   share of labelled products with at least one review in the results
+    MRR        reciprocal rank of the first relevant review
+    nDCG@k     binary relevance; the ideal ranking fills all k slots with relevant
+               reviews, as far as the catalogue (data.csv) holds them
+plus the reviews kept after thresholding and their token count (prompt size),
+and search latency at that top_k. It then recommends the cheapest setting whose
+recall and nDCG stay within --tolerance of the best-quality setting.
+
+Usage:
+    python evaluation/retrieval_metrics.py
+    python evaluation/retrieval_metrics.py --top-k 1 2 3 5 8 --thresholds 0 0.3 0.5 --repeats 3
+    python evaluation/retrieval_metrics.py --snapshot --quantized   # int8 vectors of the current snapshot
+
+With --snapshot, the vectors of an exported embedding snapshot are searched in
+process instead of the configured vector store; run it with and without
+--quantized to see what int8 vectors cost in recall.
+"""
+
+import sys
+import os
+import json
+import math
+import time
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from Retriever.retrieval import Retriever
+from data_ingestion.ingestion_pipeline import iter_documents
+from utils.context_builder import count_tokens
+from utils.metrics import percentile
+
+load_dotenv()
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CASES_PATH = os.path.join(EVAL_DIR, "retrieval_cases.json")
+DEFAULT_OUTPUT_PATH = os.path.join(EVAL_DIR, "retrieval_sweep.json")
+DEFAULT_CSV_PATH = os.path.join(os.path.dirname(EVAL_DIR), "data", "data.csv")
+
+
+def load_labelled_cases(path: str) -> list:
+    """JSON list of {"question": ..., "relevant_product_ids": [...]}."""
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def relevant_doc_counts(csv_path: str) -> Counter:
+    """Ground truth from the catalogue itself: distinct reviews per product_id."""
+    seen = set()
+    counts = Counter()
+    for doc in iter_documents(csv_path):
+        if doc.id not in seen:
+            seen.add(doc.id)
+            counts[doc.metadata.get("product_id")] += 1
+    return counts
+
+
+def recall_at_k(retrieved: list, relevant: set) -> float:
+    return len(set(retrieved) & relevant) / len(relevant) if relevant else 0.0
+
+
+def reciprocal_rank(retrieved: list, relevant: set) -> float:
+    for rank, product_id in enumerate(retrieved, 1):
+        if product_id in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(retrieved: list, relevant: set, k: int, relevant_docs: int) -> float:
+    dcg = sum(1.0 / math.log2(rank + 2) for rank, product_id in enumerate(retrieved[:k]) if product_id in relevant)
+    ideal = sum(1.0 / math.log2(rank + 2) for rank in range(min(k, relevant_docs)))
+    return dcg / ideal if ideal else 0.0
+
+
+async def run_sweep(retriever_obj: Retriever, cases: list, top_ks: list, thresholds: list,
+                    doc_counts: Counter, repeats: int) -> list:
+    retriever_config = retriever_obj.config.setdefault("retriever", {})
+    original_top_k = retriever_config.get("top_k", 3)
+    # The query embedding does not depend on the setting, so embed each question once
+    embeddings = [await retriever_obj.aembed_query(case["question"]) for case in cases]
+
+    rows = []
+    try:
+        for top_k in top_ks:
+            retriever_config["top_k"] = top_k
+            results, latencies = [], []
+            for case, embedding in zip(cases, embeddings):
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    case_results = await retriever_obj.asearch_with_scores(case["question"], embedding=embedding)
+                    latencies.append(time.perf_counter() - start)
+                results.append(case_results)
+            latencies.sort()
+
+            for threshold in thresholds:
+                recall = mrr = ndcg = docs_kept = context_tokens = 0.0
+                for case, case_results in zip(cases, results):
+                    relevant = set(case["relevant_product_ids"])
+                    docs, _ = retriever_obj.filter_by_relevance(case_results, threshold=threshold)
+                    retrieved = [doc.metadata.get("product_id") for doc in docs]
+                    recall += recall_at_k(retrieved, relevant)
+                    mrr += reciprocal_rank(retrieved, relevant)
+                    ndcg += ndcg_at_k(retrieved, relevant, top_k, sum(doc_counts[pid] for pid in relevant))
+                    docs_kept += len(docs)
+                    context_tokens += sum(count_tokens(doc.page_content) for doc in docs)
+                n = len(cases)
+                rows.append({
+                    "top_k": top_k,
+                    "threshold": threshold,
+                    "recall_at_k": round(recall / n, 4),
+                    "mrr": round(mrr / n, 4),
+                    "ndcg_at_k": round(ndcg / n, 4),
+                    "avg_docs": round(docs_kept / n, 2),
+                    "avg_context_tokens": round(context_tokens / n, 1),
+                    "search_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                    "search_p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                })
+    finally:
+        retriever_config["top_k"] = original_top_k
+    return rows
+
+
+def recommend(rows: list, tolerance: float) -> dict:
+    """
+    Cheapest setting (fewest context tokens, then smallest k) whose recall and nDCG
+    are within `tolerance` of the best-quality setting. Recall ranks first: a
+    product missing from the context cannot be answered about, however well the
+    rest is ordered.
+    """
+    best = max(rows, key=lambda row: (row["recall_at_k"], row["ndcg_at_k"]))
+    eligible = [row for row in rows
+                if row["recall_at_k"] >= best["recall_at_k"] - tolerance
+                and row["ndcg_at_k"] >= best["ndcg_at_k"] - tolerance]
+    return min(eligible, key=lambda row: (row["avg_context_tokens"], row["top_k"], -row["threshold"]))
+
+
+def print_table(rows: list, choice: dict):
+    print(f"\n{'top_k':>5} {'thresh':>6} {'recall@k':>9} {'MRR':>6} {'nDCG@k':>7} "
+          f"{'docs':>5} {'tokens':>7} {'p50 ms':>7} {'p95 ms':>7}")
+    for row in rows:
+        marker = "  <- recommended" if row is choice else ""
+        print(f"{row['top_k']:>5} {row['threshold']:>6} {row['recall_at_k']:>9.3f} {row['mrr']:>6.3f} "
+              f"{row['ndcg_at_k']:>7.3f} {row['avg_docs']:>5} {row['avg_context_tokens']:>7} "
+              f"{row['search_p50_ms']:>7} {row['search_p95_ms']:>7}{marker}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval recall@k / MRR / nDCG sweep over top_k and threshold.")
+    parser.add_argument("--cases", default=DEFAULT_CASES_PATH, help="labelled questions (JSON)")
+    parser.add_argument("--csv", default=DEFAULT_CSV_PATH, help="catalogue used to count relevant reviews")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 2, 3, 5, 8])
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.0, 0.3, 0.5, 0.6])
+    parser.add_argument("--repeats", type=int, default=3, help="timed searches per question and top_k")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="allowed drop in recall/nDCG vs. the best")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_PATH)
+    parser.add_argument("--snapshot", nargs="?", const="",
+                        help="search an exported embedding snapshot (default: snapshot.path) instead of the vector store")
+    parser.add_argument("--quantized", action="store_true", help="with --snapshot, search its int8 vectors")
+    args = parser.parse_args()
+
+    cases = load_labelled_cases(args.cases)
+    retriever_obj = Retriever()
+    snapshot_stats = None
+    if args.snapshot is not None:
+        snapshot_stats = retriever_obj.use_snapshot(args.snapshot or None, quantized=args.quantized).stats()
+    retriever_obj.load_retriever()
+    rows = asyncio.run(run_sweep(retriever_obj, cases, args.top_k, args.thresholds,
+                                 relevant_doc_counts(args.csv), args.repeats))
+    choice = recommend(rows, args.tolerance)
+    print_table(rows, choice)
+    print(f"\nRecommended: top_k={choice['top_k']}, relevance_threshold={choice['threshold']} "
+          f"(recall@k {choice['recall_at_k']:.3f}, nDCG@k {choice['ndcg_at_k']:.3f}, "
+          f"~{choice['avg_context_tokens']:.0f} context tokens)")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "timestamp": datetime.now().isoformat(),
+            "num_cases": len(cases),
+            "tolerance": args.tolerance,
+            "snapshot": snapshot_stats,
+            "recommended": choice,
+            "settings": rows,
+        }, f, indent=2)
+    print(f"Results saved to: {args.output}")
@@ -1,19 +1,32 @@
 import os
+import json
+import asyncio
+import time
 import logging
 import uvicorn
-from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, Request, Response, Form, HTTPException, BackgroundTasks
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from Retriever.retrieval import Retriever
+from Retriever.retrieval import Retriever, queries_match
 from Retriever.query_rewriter import QueryRewriter
-from utils.model_loader import ModelLoader
+from Retriever.aggregate_answers import AggregateAnswerer
+from utils.metrics import LatencyTracker
+from utils.semantic_cache import SemanticCache
+from utils.embedding_cache import CachedEmbeddings
+from utils.session_store import is_valid_session_id, load_session_store, new_session_id
+from utils.context_builder import NO_CONTEXT, ContextBuilder, count_tokens
+from utils.conversation_summarizer import ConversationSummarizer
+from utils.tracing import RequestMetrics, annotate, span, start_trace
+from utils.client_registry import WARMUP_QUERY, warm_up
+from utils.coalescing import MicroBatchEmbeddings, SingleFlight
 from prompt_library.prompt import PROMPT_TEMPLATES
-from collections import defaultdict
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
@@ -35,34 +48,85 @@ app.add_middleware(
 
 # --- Globals initialized at startup ---
 retriever_obj = Retriever()
-model_loader = ModelLoader()
+model_loader = retriever_obj.model_loader  # one set of model clients and connection pools
 query_rewriter = None
 llm = None
 prompt = None
+semantic_cache = None
+session_store = None
+context_builder = None
+conversation_summarizer = None
+request_metrics = None
+prompt_overhead_tokens = 0  # template text around the placeholders
+startup_seconds = None
+warmup_timings = None
+generation_flights = None  # identical in-flight /get generations share one LLM call
+aggregate_answerer = None
 
 MAX_HISTORY_TURNS = 5
-conversation_store: dict[str, list[dict]] = defaultdict(list)
-
-
-def format_history(history: list[dict]) -> str:
-    if not history:
-        return "No previous conversation."
-    lines = []
-    for turn in history[-MAX_HISTORY_TURNS:]:
-        lines.append(f"Customer: {turn['user']}")
-        lines.append(f"Assistant: {turn['bot']}")
-    return "\n".join(lines)
+latency = LatencyTracker()
 
 
 @app.on_event("startup")
 def startup():
-    global query_rewriter, llm, prompt
+    global llm, startup_seconds
     logger.info("Loading components...")
-    retriever_obj.load_retriever()
-    llm = model_loader.load_llm()
-    query_rewriter = QueryRewriter(llm)
+    start = time.perf_counter()
+    # Connecting to the vector store is mostly network round-trips (collection lookup, a probe
+    # embedding), so it runs in a thread while the LLM and the rest are built. SDK imports hold
+    # the GIL, so the embedding model is loaded first: only the I/O should overlap.
+    model_loader.load_embeddings()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        retriever_ready = pool.submit(retriever_obj.load_retriever)
+        llm = model_loader.load_llm()
+        _build_components()
+        retriever_ready.result()
+    startup_seconds = time.perf_counter() - start
+    logger.info(f"All components ready in {startup_seconds:.2f}s.")
+
+
+def _build_components():
+    global query_rewriter, prompt, semantic_cache, session_store, context_builder, prompt_overhead_tokens
+    global conversation_summarizer, request_metrics, generation_flights, aggregate_answerer
+    rewriter_config = retriever_obj.config.get("query_rewriter", {})
+    single_flight = retriever_obj.config.get("coalescing", {}).get("single_flight", False)
+    product_index = retriever_obj.get_product_index()
+    query_rewriter = QueryRewriter(
+        llm,
+        fast_path=rewriter_config.get("fast_path", True),
+        cache_size=rewriter_config.get("cache_size", 1024),
+        single_flight=single_flight,
+        product_index=product_index,
+    )
     prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATES["product_bot"])
-    logger.info("All components ready.")
+    prompt_overhead_tokens = count_tokens(PROMPT_TEMPLATES["product_bot"])
+    context_builder = ContextBuilder.from_config(retriever_obj.config)
+    if retriever_obj.config.get("semantic_cache", {}).get("enabled", False):
+        semantic_cache = SemanticCache.from_config(retriever_obj.config)
+    session_store = load_session_store(retriever_obj.config)
+    request_metrics = RequestMetrics.from_config(retriever_obj.config)
+    generation_flights = SingleFlight() if single_flight else None
+    if retriever_obj.config.get("aggregates", {}).get("enabled", False) and product_index is not None:
+        aggregate_answerer = AggregateAnswerer.from_config(product_index, retriever_obj.config)
+    if retriever_obj.config.get("conversation_summary", {}).get("enabled", False):
+        conversation_summarizer = ConversationSummarizer.from_config(llm, session_store, retriever_obj.config)
+
+
+@app.on_event("startup")
+async def warmup():
+    """
+    Optional probe embedding/search/completion, run on the serving event loop (after
+    startup) so the async connection pools it opens are the ones requests reuse.
+    """
+    global warmup_timings
+    warmup_config = retriever_obj.config.get("warmup", {})
+    if warmup_config.get("enabled", False):
+        warmup_timings = await warm_up(retriever_obj, llm, warmup_config.get("query", WARMUP_QUERY))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await model_loader.clients.aclose()
 
 
 @app.get("/favicon.ico", include_in_schema=False)
@@ -75,47 +139,311 @@ async def index(request: Request):
     return templates.TemplateResponse("chat.html", {"request": request})
 
 
-@app.post("/get", response_class=HTMLResponse)
-async def chat(request: Request, msg: str = Form(...)):
-    if not msg.strip():
-        raise HTTPException(status_code=400, detail="Empty message")
+async def embed_and_search(query: str) -> tuple[list[float], list]:
+    query_embedding = await retriever_obj.aembed_query(query)
+    results = await retriever_obj.asearch_with_scores(query, embedding=query_embedding)
+    return query_embedding, results
+
+
+async def speculative_outcome(task: asyncio.Task, session_id: str) -> tuple[list[float], list] | None:
+    """The speculative search's (embedding, results), or None if it failed: it is only ever a shortcut."""
     try:
-        session_id = request.client.host
-        history_str = format_history(conversation_store[session_id])
+        return await task
+    except Exception as e:
+        logger.warning(f"[{session_id}] Speculative search failed, continuing without it: {e!r}")
+        return None
 
-        # Step 1: Rewrite query using LLM
-        rewritten_query = query_rewriter.rewrite(msg, history_str)
 
-        # Step 2: Retrieve with confidence scoring
-        docs, avg_score = retriever_obj.call_retriever_with_scores(rewritten_query)
+async def prepare_chain_input(msg: str, session_id: str) -> tuple[dict, str | None, list[float] | None]:
+    """
+    Rewrite the query, retrieve supporting reviews and build the product_bot input.
 
-        # Step 3: Build context
-        if not docs:
-            context_str = "No relevant product reviews found for this query."
-        else:
-            context_str = "\n\n".join([doc.page_content for doc in docs])
+    Returns (chain_input, cached_answer, query_embedding). Questions about
+    review statistics ("average rating of X") are answered from the product
+    aggregates built at ingestion. For history-free questions the rewritten
+    query is embedded and looked up in the semantic cache. Either way
+    `cached_answer` is set and retrieval and generation are skipped. The
+    embedding is returned so the caller can cache the generated answer.
 
-        # Step 4: Generate response
-        chain_input = {
-            "context": context_str,
-            "question": msg,
-            "history": history_str,
-        }
-        result = (prompt | llm | StrOutputParser()).invoke(chain_input)
+    In speculative mode a search on the raw message runs concurrently with
+    the rewrite; its results are reused if the rewrite barely changed the
+    query, and merged with the rewritten-query results otherwise. A failed
+    speculative search is logged and ignored; one left unused is cancelled.
+    """
+    session = await session_store.aget_state(session_id)
+    history = session["turns"]
+    history_str = context_builder.build_history(history, session["summary"])
+    retriever_config = retriever_obj.config.get("retriever", {})
+    use_semantic_cache = semantic_cache is not None and not history and not session["summary"]
 
-        # Store conversation turn
-        conversation_store[session_id].append({"user": msg, "bot": result})
-        if len(conversation_store[session_id]) > MAX_HISTORY_TURNS:
-            conversation_store[session_id] = conversation_store[session_id][-MAX_HISTORY_TURNS:]
+    speculative_task = None
+    if retriever_config.get("speculative", False):
+        speculative_task = asyncio.create_task(embed_and_search(msg))
 
+    try:
+        # Step 1: Rewrite query using LLM
+        with span("rewrite"):
+            rewritten_query = await query_rewriter.arewrite(msg, history_str)
         logger.info(f"[{session_id}] User: {msg}")
         logger.info(f"[{session_id}] Rewritten: {rewritten_query}")
-        logger.info(f"[{session_id}] Docs: {len(docs)}, Avg score: {avg_score:.3f}")
+
+        if aggregate_answerer is not None:
+            aggregate_answer = aggregate_answerer.answer(msg, rewritten_query)
+            annotate(aggregate_answer=aggregate_answer is not None)
+            if aggregate_answer is not None:
+                return {}, aggregate_answer, None
+
+        query_embedding, results = None, None
+        if speculative_task is not None and queries_match(
+            msg, rewritten_query, retriever_config.get("speculative_min_overlap", 0.8)
+        ):
+            # The rewrite is effectively the raw message: its search is already in flight
+            speculated = await speculative_outcome(speculative_task, session_id)
+            speculative_task = None
+            if speculated is not None:
+                query_embedding, results = speculated
+        if results is None and use_semantic_cache:
+            query_embedding = await retriever_obj.aembed_query(rewritten_query)
+
+        # Step 2: Check the semantic cache (only answers without conversation context are reusable)
+        if use_semantic_cache:
+            with span("semantic_cache"):
+                cached_answer = semantic_cache.lookup(query_embedding)
+            annotate(semantic_cache_hit=cached_answer is not None)
+            if cached_answer is not None:
+                return {}, cached_answer, None
+        else:
+            query_embedding = None
+
+        # Step 3: Retrieve with confidence scoring
+        if results is None:
+            results = await retriever_obj.asearch_with_scores(rewritten_query, embedding=query_embedding)
+        if speculative_task is not None:
+            speculated = await speculative_outcome(speculative_task, session_id)
+            speculative_task = None
+            if speculated is not None:
+                results = retriever_obj.merge_results(results, speculated[1])
+                logger.info(f"[{session_id}] Merged speculative results for raw query")
+    finally:
+        # Any early return or failure above leaves the speculative search unused
+        if speculative_task is not None:
+            speculative_task.cancel()
+            speculative_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+    docs, avg_score = retriever_obj.filter_by_relevance(results)
+
+    # Step 4: Build context within the token budget
+    with span("context"):
+        context_str, context_stats = context_builder.build_context(docs)
+        aggregates_str = aggregate_answerer.context(msg, rewritten_query) if aggregate_answerer else ""
+        if aggregates_str:
+            # Catalogue-wide figures, so the answer does not extrapolate from a few reviews
+            context_str = aggregates_str if context_str == NO_CONTEXT else f"{aggregates_str}\n\n{context_str}"
+            context_stats["context_tokens"] = count_tokens(context_str)
+
+    logger.info(f"[{session_id}] Docs: {len(docs)}, Avg score: {avg_score:.3f}")
+    history_tokens = count_tokens(history_str)
+    question_tokens = count_tokens(msg)
+    prompt_tokens = prompt_overhead_tokens + context_stats["context_tokens"] + history_tokens + question_tokens
+    raw_history_tokens = sum(count_tokens(turn["user"]) + count_tokens(turn["bot"]) for turn in history)
+    context_builder.record(
+        prompt_tokens,
+        prompt_overhead_tokens + context_stats["raw_tokens"] + raw_history_tokens + question_tokens,
+    )
+    logger.info(
+        f"[{session_id}] Prompt tokens: {prompt_tokens} (context {context_stats['context_tokens']}, "
+        f"history {history_tokens}, question {question_tokens}); docs kept {context_stats['docs_kept']}/"
+        f"{context_stats['docs_in']}, {context_stats['duplicates']} duplicates, {context_stats['truncated']} truncated"
+    )
+    annotate(docs=len(docs), avg_score=round(avg_score, 4), prompt_tokens=prompt_tokens)
+    chain_input = {
+        "context": context_str,
+        "question": msg,
+        "history": history_str,
+    }
+    return chain_input, None, query_embedding
+
+
+async def generate_answer(chain_input: dict) -> str:
+    chain = prompt | llm | StrOutputParser()
+    if generation_flights is None:
+        return await chain.ainvoke(chain_input)
+    key = (chain_input["context"], chain_input["question"], chain_input["history"])
+    return await generation_flights.run(key, lambda: chain.ainvoke(chain_input))
+
+
+async def record_turn(session_id: str, msg: str, result: str, query_embedding: list[float] = None):
+    await session_store.aappend(session_id, {"user": msg, "bot": result}, MAX_HISTORY_TURNS)
+    if semantic_cache and query_embedding is not None:
+        semantic_cache.store(msg, query_embedding, result)
+
+
+def resolve_session(request: Request) -> tuple[str, bool]:
+    """
+    Session ID from the session header (API clients) or cookie (browser),
+    or a freshly issued one. Returns (session_id, is_new).
+    """
+    store_config = retriever_obj.config.get("session_store", {})
+    session_id = (request.headers.get(store_config.get("header_name", "X-Session-ID"))
+                  or request.cookies.get(store_config.get("cookie_name", "session_id")))
+    if is_valid_session_id(session_id):
+        return session_id, False
+    return new_session_id(), True
+
+
+def set_session_cookie(response: Response, session_id: str):
+    store_config = retriever_obj.config.get("session_store", {})
+    response.set_cookie(
+        store_config.get("cookie_name", "session_id"),
+        session_id,
+        max_age=int(store_config.get("ttl_seconds", 86400)),
+        httponly=True,
+        samesite="lax",
+    )
+
+
+@app.post("/get", response_class=HTMLResponse)
+async def chat(request: Request, response: Response, background_tasks: BackgroundTasks, msg: str = Form(...)):
+    if not msg.strip():
+        raise HTTPException(status_code=400, detail="Empty message")
+    session_id, is_new_session = resolve_session(request)
+    if is_new_session:
+        set_session_cookie(response, session_id)
+    trace = start_trace("/get", session_id)
+    try:
+        start = time.perf_counter()
+        chain_input, cached_answer, query_embedding = await prepare_chain_input(msg, session_id)
+
+        # Step 5: Generate response (unless served from the semantic cache)
+        if cached_answer is not None:
+            result = cached_answer
+        else:
+            with span("generation"):
+                result = await generate_answer(chain_input)
+
+        # Store conversation turn; older turns are summarized after the response is sent
+        await record_turn(session_id, msg, result, query_embedding)
+        if conversation_summarizer:
+            background_tasks.add_task(conversation_summarizer.asummarize, session_id)
+        latency.record("total", time.perf_counter() - start)
+        request_metrics.finish(trace)
         return result
     except Exception as e:
         logger.error(f"Chain invocation failed: {e}", exc_info=True)
+        request_metrics.finish(trace, status="error")
+        raise HTTPException(status_code=500, detail="Sorry, something went wrong. Please try again.")
+
+
+def sse_event(data: dict, event: str = None) -> str:
+    payload = f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\n{payload}" if event else payload
+
+
+@app.post("/stream")
+async def chat_stream(request: Request, msg: str = Form(...)):
+    """Same pipeline as /get, but streams generated tokens as server-sent events."""
+    if not msg.strip():
+        raise HTTPException(status_code=400, detail="Empty message")
+    start = time.perf_counter()
+    session_id, is_new_session = resolve_session(request)
+    trace = start_trace("/stream", session_id)
+    try:
+        chain_input, cached_answer, query_embedding = await prepare_chain_input(msg, session_id)
+    except Exception as e:
+        logger.error(f"Chain invocation failed: {e}", exc_info=True)
+        request_metrics.finish(trace, status="error")
         raise HTTPException(status_code=500, detail="Sorry, something went wrong. Please try again.")
 
+    async def generate():
+        if cached_answer is not None:
+            yield cached_answer
+            return
+        async for chunk in (prompt | llm | StrOutputParser()).astream(chain_input):
+            yield chunk
+
+    async def token_stream():
+        chunks = []
+        ttft = None
+        # Until the stream completes, an exit here means the client went away mid-stream
+        status = "disconnected"
+        # The generator runs outside the endpoint's context, so spans are added to the trace directly
+        generation_start = time.perf_counter()
+        try:
+            try:
+                async for chunk in generate():
+                    if not chunk:
+                        continue
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                        latency.record("ttft", ttft)
+                        trace.add("ttft", ttft)
+                    chunks.append(chunk)
+                    yield sse_event({"token": chunk})
+            except Exception as e:
+                logger.error(f"Streaming generation failed: {e}", exc_info=True)
+                status = "error"
+                yield sse_event({"detail": "Sorry, something went wrong. Please try again."}, event="error")
+                return
+            trace.add("generation", time.perf_counter() - generation_start)
+
+            result = "".join(chunks)
+            await record_turn(session_id, msg, result, query_embedding)
+            total = time.perf_counter() - start
+            latency.record("stream_total", total)
+            logger.info(f"[{session_id}] Streamed {len(chunks)} chunks, TTFT: {ttft or total:.3f}s, total: {total:.3f}s")
+            status = "ok"
+            yield sse_event({"ttft_s": round(ttft or total, 3), "total_s": round(total, 3)}, event="done")
+        finally:
+            request_metrics.finish(trace, status=status)
+
+    response = StreamingResponse(
+        token_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Runs once the last event has been sent
+        background=BackgroundTask(conversation_summarizer.asummarize, session_id) if conversation_summarizer else None,
+    )
+    if is_new_session:
+        set_session_cookie(response, session_id)
+    return response
+
+
+@app.get("/stats")
+async def stats():
+    embeddings = retriever_obj.model_loader.load_embeddings()
+    embedding_batcher = embeddings.embeddings if isinstance(embeddings, CachedEmbeddings) else embeddings
+    if not isinstance(embedding_batcher, MicroBatchEmbeddings):
+        embedding_batcher = None
+    return {
+        "latency": latency.summary(),
+        "stages": request_metrics.stage_summary() if request_metrics else None,
+        "query_rewriter": query_rewriter.stats() if query_rewriter else None,
+        "semantic_cache": semantic_cache.stats() if semantic_cache else None,
+        "embedding_cache": embeddings.stats() if isinstance(embeddings, CachedEmbeddings) else None,
+        "session_store": await asyncio.to_thread(session_store.stats) if session_store else None,
+        "context_builder": context_builder.stats() if context_builder else None,
+        "conversation_summary": conversation_summarizer.stats() if conversation_summarizer else None,
+        "retriever": retriever_obj.stats(),
+        "aggregates": aggregate_answerer.stats() if aggregate_answerer else None,
+        "coalescing": {
+            "query_embeddings": embedding_batcher.stats() if embedding_batcher else None,
+            "search": retriever_obj.search_flights.stats() if retriever_obj.search_flights else None,
+            "generation": generation_flights.stats() if generation_flights else None,
+        },
+        "startup": {
+            "startup_s": round(startup_seconds, 4) if startup_seconds is not None else None,
+            "warmup_s": warmup_timings,
+            "first_request_s": ({endpoint: round(seconds, 4) for endpoint, seconds in request_metrics.first_requests.items()}
+                                if request_metrics else None),
+            "http_clients": model_loader.clients.stats(),
+        },
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per-stage latency histograms and request counters in Prometheus text format."""
+    return PlainTextResponse(request_metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,113 @@
+import time
+import logging
+from typing import Dict
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+WARMUP_QUERY = "wireless earphones with good bass"
+
+
+class ClientRegistry:
+    """
+    Pooled HTTP clients shared by every component that talks to one upstream service.
+    Each service gets one sync and one async httpx client with the same keep-alive
+    limits, so connections (and their TLS sessions) are reused across requests
+    instead of being set up per client object. Clients are created on first use.
+    """
+
+    def __init__(self, max_connections: int = 20, max_keepalive_connections: int = 10,
+                 keepalive_expiry: float = 60.0, connect_timeout: float = 5.0, read_timeout: float = 60.0):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._clients: Dict[str, httpx.Client] = {}
+        self._async_clients: Dict[str, httpx.AsyncClient] = {}
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ClientRegistry":
+        http_config = config.get("http_clients", {})
+        return cls(
+            max_connections=http_config.get("max_connections", 20),
+            max_keepalive_connections=http_config.get("max_keepalive_connections", 10),
+            keepalive_expiry=http_config.get("keepalive_expiry", 60.0),
+            connect_timeout=http_config.get("connect_timeout", 5.0),
+            read_timeout=http_config.get("read_timeout", 60.0),
+        )
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_keepalive_connections,
+                            keepalive_expiry=self.keepalive_expiry)
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+    def client_args(self) -> dict:
+        """Keyword arguments for SDKs that build their own httpx clients (e.g. google-genai)."""
+        return {"limits": self.limits()}
+
+    def client(self, service: str) -> httpx.Client:
+        if service not in self._clients:
+            self._clients[service] = httpx.Client(limits=self.limits(), timeout=self.timeout())
+        return self._clients[service]
+
+    def async_client(self, service: str) -> httpx.AsyncClient:
+        if service not in self._async_clients:
+            self._async_clients[service] = httpx.AsyncClient(limits=self.limits(), timeout=self.timeout())
+        return self._async_clients[service]
+
+    async def aclose(self):
+        for client in self._clients.values():
+            client.close()
+        for client in self._async_clients.values():
+            await client.aclose()
+        self._clients.clear()
+        self._async_clients.clear()
+
+    def stats(self) -> dict:
+        return {
+            "services": sorted(set(self._clients) | set(self._async_clients)),
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry_s": self.keepalive_expiry,
+        }
+
+
+async def _probe(name: str, coro, timings: dict):
+    start = time.perf_counter()
+    try:
+        await coro
+        timings[name] = round(time.perf_counter() - start, 4)
+    except Exception as e:
+        # Warm-up is best effort: a failed probe leaves that client cold, it does not stop the app
+        timings[name] = None
+        logger.warning(f"Warm-up {name} probe failed: {e}")
+
+
+async def warm_up(retriever_obj, llm, query: str = WARMUP_QUERY) -> dict:
+    """
+    Issue one embedding, one vector search and a one-token completion so the pooled
+    connections are open before the first user request. Bypasses the embedding cache,
+    which would otherwise answer the probe without touching the network.
+    Returns the seconds each probe took (None if it failed).
+    """
+    timings: dict = {}
+    start = time.perf_counter()
+    embeddings = retriever_obj.model_loader.load_embeddings()
+    embeddings = getattr(embeddings, "embeddings", embeddings)  # unwrap CachedEmbeddings
+    embedding: list = []
+
+    async def embed():
+        embedding.extend(await embeddings.aembed_query(query))
+
+    await _probe("embed_s", embed(), timings)
+    if embedding:
+        await _probe("search_s", retriever_obj.asearch_with_scores(query, embedding=embedding), timings)
+    await _probe("llm_s", llm.bind(max_tokens=1).ainvoke("Reply with OK."), timings)
+    timings["total_s"] = round(time.perf_counter() - start, 4)
+    logger.info(f"Warm-up finished: {timings}")
+    return timings
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatchEmbeddings(Embeddings):
+    """
+    Gathers query embeddings requested concurrently into one batched call.
+
+    The first `aembed_query` starts a `max_wait_ms` window; every query arriving
+    within it (up to `max_batch_size`) is embedded by a single `aembed_documents`
+    call, and identical texts in a batch are embedded once. At most
+    `max_concurrent_batches` calls are in flight; while they are, new queries keep
+    accumulating and go out together as soon as one finishes, so batches grow with
+    load instead of queueing one call per query. `batch_kwargs` are
+    passed to that call, e.g. task_type="RETRIEVAL_QUERY" so Gemini still embeds
+    the batch as queries. Everything else is passed straight through.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 max_concurrent_batches: int = 4, batch_kwargs: dict = None):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_concurrent_batches = max_concurrent_batches
+        self.batch_kwargs = batch_kwargs or {}
+        self._pending: List[tuple] = []
+        self._timer = None
+        self._tasks: set = set()
+        self.queries = 0
+        self.batches = 0
+        self.texts_embedded = 0
+
+    @classmethod
+    def from_config(cls, embeddings: Embeddings, config: dict, batch_kwargs: dict = None) -> "MicroBatchEmbeddings":
+        coalescing_config = config.get("coalescing", {})
+        return cls(
+            embeddings,
+            max_batch_size=coalescing_config.get("max_batch_size", 32),
+            max_wait_ms=coalescing_config.get("max_wait_ms", 5.0),
+            max_concurrent_batches=coalescing_config.get("max_concurrent_batches", 4),
+            batch_kwargs=batch_kwargs,
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self.queries += 1
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # At the in-flight limit, queries keep accumulating; _batch_done flushes them
+        while self._pending and len(self._tasks) < self.max_concurrent_batches:
+            batch = self._pending[: self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size :]
+            task = asyncio.ensure_future(self._embed_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task: asyncio.Future):
+        self._tasks.discard(task)
+        if self._pending:
+            self._flush()
+
+    async def _embed_batch(self, batch: List[tuple]):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self.batches += 1
+        self.texts_embedded += len(texts)
+        try:
+            vectors = await self.embeddings.aembed_documents(texts, **self.batch_kwargs)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except BaseException:
+            # Cancelled (e.g. at shutdown) or interrupted: never leave a request awaiting forever
+            for _, future in batch:
+                future.cancel()
+            raise
+        by_text = dict(zip(texts, vectors))
+        for text, future in batch:
+            if not future.done():  # the waiting request may have been cancelled
+                future.set_result(by_text[text])
+
+    def stats(self) -> dict:
+        return {
+            "queries": self.queries,
+            "batches": self.batches,
+            "texts_embedded": self.texts_embedded,
+            "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one execution: the first caller runs
+    it, later callers await the same result (or exception) until it finishes.
+    The shared call is shielded, so one caller's cancellation does not fail the rest.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "in_flight": len(self._inflight),
+        }
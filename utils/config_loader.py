@@ -1,10 +1,28 @@
 import os
 import yaml
 
-def load_config(config_path: str = None) -> dict:
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_configs: dict = {}  # absolute path -> parsed config
+
+
+def load_config(config_path: str = None, reload: bool = False) -> dict:
+    """
+    Parsed config.yaml, read once per process: every caller (ModelLoader, Retriever,
+    DataIngestion, ...) shares the same dict, so a setting changed at runtime is seen
+    by all of them. reload=True re-reads the file into a new dict.
+    """
     if config_path is None:
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        config_path = os.path.join(base_dir, "config", "config.yaml")
-    with open(config_path, "r") as file:
-        config = yaml.safe_load(file)
-    return config
\ No newline at end of file
+        config_path = os.path.join(BASE_DIR, "config", "config.yaml")
+    config_path = os.path.abspath(config_path)
+    if reload or config_path not in _configs:
+        with open(config_path, "r") as file:
+            _configs[config_path] = yaml.safe_load(file)
+    return _configs[config_path]
+
+
+def resolve_path(path: str) -> str:
+    """Resolve a config-relative path against the project root."""
+    if os.path.isabs(path):
+        return path
+    return os.path.join(BASE_DIR, path)
@@ -0,0 +1,152 @@
+import re
+import logging
+from typing import List, Tuple
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4  # rough average for English text with Llama/GPT tokenizers
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+NO_CONTEXT = "No relevant product reviews found for this query."
+NO_HISTORY = "No previous conversation."
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count (~4 characters per token), cheap enough to run on every request."""
+    return len(text) // CHARS_PER_TOKEN + 1 if text else 0
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to about `max_tokens` at a word boundary, marking the cut with an ellipsis."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    cut = text[: max(max_tokens, 1) * CHARS_PER_TOKEN]
+    if " " in cut:
+        cut = cut[: cut.rindex(" ")]
+    return cut.rstrip(" ,.;:-") + "…"
+
+
+def _word_set(text: str) -> set:
+    return set(WORD_PATTERN.findall(text.lower()))
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+class ContextBuilder:
+    """
+    Assembles the product_bot context and history under token budgets.
+
+    Retrieved reviews keep their rank order. A review whose words overlap an
+    already-kept review of the same product by at least `dedupe_similarity`
+    (Jaccard) is dropped. Each review is capped at `max_review_tokens`, and
+    reviews are added until `max_context_tokens` is reached. Each one is
+    prefixed with a compact "[name | rating/5]" header.
+    History keeps the conversation summary plus the newest turns that fit
+    `max_history_tokens`, with each answer capped at `max_turn_tokens`.
+    """
+
+    def __init__(self, max_context_tokens: int = 1200, max_review_tokens: int = 250,
+                 max_history_tokens: int = 500, max_turn_tokens: int = 120,
+                 dedupe_similarity: float = 0.8, max_name_words: int = 8):
+        self.max_context_tokens = max_context_tokens
+        self.max_review_tokens = max_review_tokens
+        self.max_history_tokens = max_history_tokens
+        self.max_turn_tokens = max_turn_tokens
+        self.dedupe_similarity = dedupe_similarity
+        self.max_name_words = max_name_words
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.tokens_saved = 0
+        self.duplicates_dropped = 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ContextBuilder":
+        builder_config = config.get("context_builder", {})
+        return cls(
+            max_context_tokens=builder_config.get("max_context_tokens", 1200),
+            max_review_tokens=builder_config.get("max_review_tokens", 250),
+            max_history_tokens=builder_config.get("max_history_tokens", 500),
+            max_turn_tokens=builder_config.get("max_turn_tokens", 120),
+            dedupe_similarity=builder_config.get("dedupe_similarity", 0.8),
+            max_name_words=builder_config.get("max_name_words", 8),
+        )
+
+    def _header(self, doc: Document) -> str:
+        words = str(doc.metadata.get("product_name", "Unknown product")).split()
+        name = " ".join(words[: self.max_name_words]) + ("…" if len(words) > self.max_name_words else "")
+        rating = doc.metadata.get("product_rating")
+        return f"[{name} | {rating}/5]" if rating not in (None, "") else f"[{name}]"
+
+    def build_context(self, docs: List[Document]) -> Tuple[str, dict]:
+        """Returns (context string, stats) for the retrieved documents, best first."""
+        kept_words: dict = {}  # product name -> word sets of reviews already included
+        entries = []
+        used = 0
+        raw_tokens = 0
+        duplicates = truncated = 0
+        for doc in docs:
+            raw_tokens += count_tokens(doc.page_content)
+            product = doc.metadata.get("product_name", "")
+            words = _word_set(doc.page_content)
+            if any(_jaccard(words, seen) >= self.dedupe_similarity for seen in kept_words.get(product, [])):
+                duplicates += 1
+                continue
+
+            header = self._header(doc)
+            remaining = self.max_context_tokens - used - count_tokens(header) - 1
+            if remaining < min(32, self.max_review_tokens):
+                break  # not enough room left for a useful excerpt
+            review = truncate_to_tokens(doc.page_content, min(self.max_review_tokens, remaining))
+            truncated += review != doc.page_content
+            entry = f"{header} {review}"
+            entries.append(entry)
+            used += count_tokens(entry)
+            kept_words.setdefault(product, []).append(words)
+
+        context = "\n\n".join(entries) if entries else NO_CONTEXT
+        stats = {
+            "docs_in": len(docs),
+            "docs_kept": len(entries),
+            "duplicates": duplicates,
+            "truncated": truncated,
+            "raw_tokens": raw_tokens,
+            "context_tokens": count_tokens(context),
+        }
+        self.duplicates_dropped += duplicates
+        return context, stats
+
+    def build_history(self, history: List[dict], summary: str = "") -> str:
+        """
+        Newest turns first until the budget is spent, then rendered oldest to newest
+        after the rolling summary of earlier turns, if there is one.
+        """
+        summary_line = f"Summary of earlier conversation: {summary}" if summary else ""
+        lines = []
+        used = count_tokens(summary_line)
+        for turn in reversed(history):
+            block = f"Customer: {turn['user']}\nAssistant: {truncate_to_tokens(turn['bot'], self.max_turn_tokens)}"
+            tokens = count_tokens(block)
+            if lines and used + tokens > self.max_history_tokens:
+                break
+            lines.append(block)
+            used += tokens
+        if summary_line:
+            lines.append(summary_line)
+        return "\n".join(reversed(lines)) if lines else NO_HISTORY
+
+    def record(self, prompt_tokens: int, raw_tokens: int):
+        """Account one prompt: `raw_tokens` is what it would have cost without budgeting."""
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.tokens_saved += max(raw_tokens - prompt_tokens, 0)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.requests, 1) if self.requests else 0.0,
+            "avg_tokens_saved": round(self.tokens_saved / self.requests, 1) if self.requests else 0.0,
+            "duplicates_dropped": self.duplicates_dropped,
+        }
@@ -0,0 +1,106 @@
+import time
+import logging
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+from utils.context_builder import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """You maintain a running summary of a customer's conversation with a product support assistant.
+
+Update the current summary with the new turns below.
+
+Rules:
+- Keep product names, ratings, the customer's needs and preferences, and what was already recommended or ruled out
+- Drop greetings, filler and anything already covered by the summary
+- Write plain sentences, at most {max_words} words
+- Output ONLY the updated summary, nothing else
+
+CURRENT SUMMARY:
+{summary}
+
+NEW TURNS:
+{turns}
+
+UPDATED SUMMARY:"""
+
+
+class ConversationSummarizer:
+    """
+    Folds older turns of a session into a compact rolling summary so prompts
+    carry the summary plus only the latest turn verbatim.
+
+    Runs after the response has been sent (FastAPI background task), so the
+    LLM call is off the request's critical path. At most one summary per
+    session is in flight per worker; a turn recorded meanwhile is simply
+    folded on the next run.
+    """
+
+    def __init__(self, llm, session_store, max_summary_tokens: int = 150, min_turns: int = 2):
+        self.chain = (
+            ChatPromptTemplate.from_template(SUMMARY_PROMPT)
+            | llm
+            | StrOutputParser()
+        )
+        self.session_store = session_store
+        self.max_summary_tokens = max_summary_tokens
+        self.min_turns = max(min_turns, 2)  # the latest turn always stays verbatim
+        self._in_flight: set = set()
+        self.runs = 0
+        self.failures = 0
+        self.turns_folded = 0
+        self.llm_seconds = 0.0
+
+    @classmethod
+    def from_config(cls, llm, session_store, config: dict) -> "ConversationSummarizer":
+        summary_config = config.get("conversation_summary", {})
+        return cls(
+            llm,
+            session_store,
+            max_summary_tokens=summary_config.get("max_summary_tokens", 150),
+            min_turns=summary_config.get("min_turns", 2),
+        )
+
+    async def asummarize(self, session_id: str):
+        # Claimed before the first await and held until the fold is stored, so two
+        # concurrent calls for one session never fold the same turns twice
+        if session_id in self._in_flight:
+            return
+        self._in_flight.add(session_id)
+        try:
+            state = await self.session_store.aget_state(session_id)
+            if len(state["turns"]) < self.min_turns:
+                return
+            to_fold = state["turns"][:-1]
+
+            try:
+                start = time.perf_counter()
+                summary = await self.chain.ainvoke({
+                    "summary": state["summary"] or "None yet.",
+                    "turns": "\n".join(f"Customer: {turn['user']}\nAssistant: {turn['bot']}" for turn in to_fold),
+                    "max_words": self.max_summary_tokens * 3 // 4,
+                })
+                elapsed = time.perf_counter() - start
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"[{session_id}] Conversation summary failed, keeping raw turns: {e}")
+                return
+
+            summary = truncate_to_tokens(summary.strip(), self.max_summary_tokens)
+            await self.session_store.afold(session_id, summary, to_fold)
+        finally:
+            self._in_flight.discard(session_id)
+        self.runs += 1
+        self.turns_folded += len(to_fold)
+        self.llm_seconds += elapsed
+        logger.info(f"[{session_id}] Folded {len(to_fold)} turns into summary "
+                    f"({count_tokens(summary)} tokens, {elapsed:.3f}s)")
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "turns_folded": self.turns_folded,
+            "avg_llm_latency_s": round(self.llm_seconds / self.runs, 4) if self.runs else 0.0,
+        }
@@ -0,0 +1,170 @@
+import os
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of host parameters per statement
+LOOKUP_CHUNK = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Persistent embedding cache wrapped around any LangChain embedder.
+
+    Vectors are stored in SQLite as float32 blobs keyed by a SHA-256 of
+    (model name, embedding kind, text). Query and document embeddings are
+    cached separately because providers such as Gemini embed them with
+    different task types.
+
+    The async methods run their SQLite lookups and writes in a worker thread,
+    so a slow disk or a locked database never stalls the event loop. Entry and
+    byte counts per model are kept in a small stats table updated with each
+    write, so stats() never scans the cache.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, path: str):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, kind TEXT NOT NULL, vector BLOB NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_stats ("
+            "model TEXT PRIMARY KEY, entries INTEGER NOT NULL, bytes_stored INTEGER NOT NULL)"
+        )
+        # Caches written before the stats table existed are counted once, here
+        self._conn.execute(
+            "INSERT OR IGNORE INTO embedding_stats (model, entries, bytes_stored) "
+            "SELECT ?, COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE model = ?",
+            (model_name, model_name),
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text: str, kind: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(unique_keys), LOOKUP_CHUNK):
+                chunk = unique_keys[i : i + LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def _store(self, items: Dict[str, List[float]], kind: str):
+        rows = [(key, self.model_name, kind, np.asarray(vector, dtype=np.float32).tobytes())
+                for key, vector in items.items()]
+        with self._lock:
+            # A key always maps to the same vector, so rows already cached are left alone
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, kind, vector) VALUES (?, ?, ?, ?)", rows
+            )
+            added = self._conn.total_changes - before
+            if added:
+                self._conn.execute(
+                    "UPDATE embedding_stats SET entries = entries + ?, bytes_stored = bytes_stored + ? WHERE model = ?",
+                    (added, added * len(rows[0][3]), self.model_name),
+                )
+            self._conn.commit()
+
+    def _partition(self, texts: List[str], kind: str):
+        keys = [self._key(text, kind) for text in texts]
+        found = self._lookup(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        miss_count = sum(1 for key in keys if key not in found)
+        with self._lock:  # lookups also run in worker threads
+            self.hits += len(keys) - miss_count
+            self.misses += miss_count
+        return keys, found, missing
+
+    def is_cached(self, texts: List[str], kind: str = "document") -> bool:
+        """True when every text already has a cached embedding (no provider call needed)."""
+        keys = [self._key(text, kind) for text in texts]
+        return len(self._lookup(keys)) == len(set(keys))
+
+    def cached_vectors(self, texts: List[str], kind: str = "document") -> Dict[str, List[float]]:
+        """text -> cached vector for the texts already in the cache; never calls the provider."""
+        keys = [self._key(text, kind) for text in texts]
+        found = self._lookup(keys)
+        return {text: found[key] for key, text in zip(keys, texts) if key in found}
+
+    def seed(self, texts: List[str], vectors, kind: str = "document"):
+        """Store vectors computed elsewhere (e.g. loaded from an embedding snapshot) for these texts."""
+        self._store({self._key(text, kind): vector for text, vector in zip(texts, vectors)}, kind)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._partition(texts, "document")
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed, "document")
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, found, missing = self._partition([text], "query")
+        if missing:
+            vector = self.embeddings.embed_query(text)
+            self._store({keys[0]: vector}, "query")
+            return vector
+        return found[keys[0]]
+
+    async def ais_cached(self, texts: List[str], kind: str = "document") -> bool:
+        return await asyncio.to_thread(self.is_cached, texts, kind)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = await asyncio.to_thread(self._partition, texts, "document")
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            await asyncio.to_thread(self._store, computed, "document")
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, found, missing = await asyncio.to_thread(self._partition, [text], "query")
+        if missing:
+            vector = await self.embeddings.aembed_query(text)
+            await asyncio.to_thread(self._store, {keys[0]: vector}, "query")
+            return vector
+        return found[keys[0]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, bytes_stored = self._conn.execute(
+                "SELECT entries, bytes_stored FROM embedding_stats WHERE model = ?", (self.model_name,)
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes_stored": bytes_stored,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
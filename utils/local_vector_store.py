@@ -0,0 +1,401 @@
+import os
+import json
+import uuid
+import asyncio
+import threading
+import logging
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from utils.metadata_filter import MetadataColumns
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.npy"
+DOCS_FILE = "docs.json"
+CENTROIDS_FILE = "ivf_centroids.npy"
+LIST_OFFSETS_FILE = "ivf_offsets.npy"
+LIST_ROWS_FILE = "ivf_rows.npy"
+KMEANS_ITERATIONS = 10
+SCORE_BLOCK_ROWS = 4096  # int8 rows widened to float32 at a time when scoring a quantized matrix
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector index over a normalized float32 matrix.
+
+    `index_type="exact"` scores every row with one matrix-vector product and
+    picks the top-k with argpartition. `index_type="ivf"` additionally
+    clusters the rows with k-means into `nlist` inverted lists and only
+    scores the `nprobe` lists closest to the query, for larger catalogs.
+
+    Vectors and IVF lists are persisted as .npy files by `persist()` and
+    memory-mapped on load, so startup does not read the whole index into
+    memory. Writes are buffered in memory until `persist()`. Scores are
+    returned as (1 + cosine) / 2, the same scale AstraDB reports for its
+    cosine metric, so RELEVANCE_THRESHOLD means the same for both backends.
+
+    `from_arrays` wraps vectors that are already in memory or memory-mapped
+    (e.g. an embedding snapshot) without copying them, with ids, texts and
+    metadata given as any sequences (read on access). Given per-row `scales`,
+    the matrix holds int8 rows (row ≈ int8 row * scale); scoring and IVF
+    clustering widen them to float32 one block at a time. Such a store is read-only.
+    """
+
+    def __init__(self, embedding: Embeddings, path: str = None, index_type: str = "exact",
+                 nlist: int = 64, nprobe: int = 8):
+        if index_type not in ("exact", "ivf"):
+            raise ValueError(f"Unknown local index type: {index_type}")
+        self.embedding = embedding
+        self.path = path
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._row_by_id: dict = {}
+        self._pending: List[np.ndarray] = []
+        self._centroids = None
+        self._list_offsets = None
+        self._list_rows = None
+        self._ivf_dirty = False
+        self._columns = None  # MetadataColumns for filtered search, rebuilt after writes
+        self._scales = None   # per-row scales when the matrix holds int8 rows
+        self._read_only = False
+        # ingestion upserts batches from worker threads (aadd_texts)
+        self._lock = threading.RLock()
+        if path and os.path.exists(os.path.join(path, VECTORS_FILE)):
+            self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @classmethod
+    def from_arrays(cls, embedding: Embeddings, vectors: np.ndarray, ids: Sequence[str], texts: Sequence[str],
+                    metadatas: Sequence[dict], scales: Optional[np.ndarray] = None,
+                    **kwargs: Any) -> "LocalVectorStore":
+        """Read-only store over L2-normalized float32 rows, or int8 rows with per-row `scales`, used in place."""
+        store = cls(embedding, **kwargs)
+        store._vectors = vectors
+        store._scales = scales
+        store._ids = ids
+        store._texts = texts
+        store._metadatas = metadatas
+        store._read_only = True
+        store._ivf_dirty = store.index_type == "ivf"
+        return store
+
+    # --- persistence ---
+
+    def _load(self):
+        self._vectors = np.load(os.path.join(self.path, VECTORS_FILE), mmap_mode="r")
+        with open(os.path.join(self.path, DOCS_FILE), "r") as f:
+            docs = json.load(f)
+        self._ids = docs["ids"]
+        self._texts = docs["texts"]
+        self._metadatas = docs["metadatas"]
+        self._row_by_id = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        if self.index_type == "ivf" and os.path.exists(os.path.join(self.path, CENTROIDS_FILE)):
+            self._centroids = np.load(os.path.join(self.path, CENTROIDS_FILE), mmap_mode="r")
+            self._list_offsets = np.load(os.path.join(self.path, LIST_OFFSETS_FILE), mmap_mode="r")
+            self._list_rows = np.load(os.path.join(self.path, LIST_ROWS_FILE), mmap_mode="r")
+        else:
+            self._ivf_dirty = self.index_type == "ivf"
+        logger.info(f"Loaded local vector index: {len(self._ids)} vectors from {self.path}")
+
+    def persist(self):
+        if not self.path:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        # Rows may be overwritten in place, so writers wait until the files are out
+        with self._lock:
+            vectors = self._matrix()
+            if self._ivf_dirty:
+                self._rebuild_ivf()
+            # Write to temp files and swap them in: the old files may still be memory-mapped
+            _atomic_save(os.path.join(self.path, VECTORS_FILE), np.ascontiguousarray(vectors))
+            if self._centroids is not None:
+                _atomic_save(os.path.join(self.path, CENTROIDS_FILE), np.asarray(self._centroids))
+                _atomic_save(os.path.join(self.path, LIST_OFFSETS_FILE), np.asarray(self._list_offsets))
+                _atomic_save(os.path.join(self.path, LIST_ROWS_FILE), np.asarray(self._list_rows))
+            docs_path = os.path.join(self.path, DOCS_FILE)
+            with open(docs_path + ".tmp", "w") as f:
+                json.dump({"ids": self._ids, "texts": self._texts, "metadatas": self._metadatas}, f,
+                          default=_json_default)
+            os.replace(docs_path + ".tmp", docs_path)
+
+    # --- writes ---
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, *,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        vectors = self.embedding.embed_documents(texts)
+        return self.add_embeddings(texts, vectors, metadatas=metadatas, ids=ids)
+
+    async def aadd_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, *,
+                         ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        vectors = await self.embedding.aembed_documents(texts)
+        return await asyncio.to_thread(self.add_embeddings, texts, vectors, metadatas=metadatas, ids=ids)
+
+    def add_embeddings(self, texts: List[str], vectors: List[List[float]],
+                       metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None) -> List[str]:
+        """Upsert precomputed vectors; existing ids are overwritten in place."""
+        with self._lock:
+            self._check_writable()
+            if not texts:
+                return []
+            metadatas = metadatas or [{} for _ in texts]
+            ids = ids or [str(uuid.uuid4()) for _ in texts]
+            new_vectors = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+            appended = []
+            overwritten = {}  # row -> vector; the last one wins if an id repeats
+            for doc_id, text, metadata, vector in zip(ids, texts, metadatas, new_vectors):
+                row = self._row_by_id.get(doc_id)
+                if row is None:
+                    self._row_by_id[doc_id] = len(self._ids)
+                    self._ids.append(doc_id)
+                    self._texts.append(text)
+                    self._metadatas.append(dict(metadata))
+                    appended.append(vector)
+                else:
+                    overwritten[row] = vector
+                    self._texts[row] = text
+                    self._metadatas[row] = dict(metadata)
+            if appended:
+                self._pending.append(np.stack(appended))
+            if overwritten:
+                rows = np.fromiter(overwritten, dtype=np.int64, count=len(overwritten))
+                self._writable_matrix()[rows] = np.stack(list(overwritten.values()))
+            self._ivf_dirty = True
+            self._columns = None
+            return list(ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        with self._lock:
+            self._check_writable()
+            if not ids:
+                return False
+            remove = {self._row_by_id[doc_id] for doc_id in ids if doc_id in self._row_by_id}
+            if not remove:
+                return False
+            keep = [row for row in range(len(self._ids)) if row not in remove]
+            self._vectors = np.array(self._matrix()[keep], dtype=np.float32)
+            self._ids = [self._ids[row] for row in keep]
+            self._texts = [self._texts[row] for row in keep]
+            self._metadatas = [self._metadatas[row] for row in keep]
+            self._row_by_id = {doc_id: row for row, doc_id in enumerate(self._ids)}
+            self._ivf_dirty = True
+            self._columns = None
+            return True
+
+    def get_vectors(self, ids: Iterable[str]) -> dict:
+        """Document ID -> stored (L2-normalized) vector, for the ids the store holds."""
+        with self._lock:
+            found = [(doc_id, self._row_by_id[doc_id]) for doc_id in ids if doc_id in self._row_by_id]
+            if not found:
+                return {}
+            vectors = self._rows(self._matrix(), np.array([row for _, row in found]))
+        return {doc_id: vector for (doc_id, _), vector in zip(found, vectors)}
+
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        """Documents for the ids the store holds, in the order given."""
+        with self._lock:
+            rows = [self._row_by_id[doc_id] for doc_id in ids if doc_id in self._row_by_id]
+            return [Document(id=self._ids[row], page_content=self._texts[row], metadata=dict(self._metadatas[row]))
+                    for row in rows]
+
+    def clear(self):
+        """Remove every document; persist() writes the empty store."""
+        with self._lock:
+            self._check_writable()
+            self._vectors = np.zeros((0, 0), dtype=np.float32)
+            self._pending = []
+            self._ids, self._texts, self._metadatas = [], [], []
+            self._row_by_id = {}
+            self._ivf_dirty = self.index_type == "ivf"
+            self._columns = None
+
+    def _check_writable(self):
+        if self._read_only:
+            raise ValueError("A store built with from_arrays is read-only")
+
+    def _matrix(self) -> np.ndarray:
+        """The full vector matrix, folding in rows appended since the last consolidation."""
+        with self._lock:
+            if self._pending:
+                parts = ([self._vectors] if len(self._vectors) else []) + self._pending
+                self._vectors = np.vstack(parts)
+                self._pending = []
+            return self._vectors
+
+    def _writable_matrix(self) -> np.ndarray:
+        """
+        The consolidated matrix as an in-memory array rows can be written into. A memory-mapped
+        matrix is copied once, on the first overwrite after loading; later writes go in place.
+        """
+        with self._lock:
+            vectors = self._matrix()
+            if not vectors.flags.writeable:
+                self._vectors = vectors = np.array(vectors, dtype=np.float32)
+            return vectors
+
+    def _rebuild_ivf(self):
+        self._ivf_dirty = False
+        if self.index_type != "ivf" or len(self._ids) == 0:
+            self._centroids = self._list_offsets = self._list_rows = None
+            return
+        vectors = self._matrix()
+        nlist = min(self.nlist, len(vectors))
+        rng = np.random.default_rng(0)
+        centroids = np.array(self._rows(vectors, rng.choice(len(vectors), nlist, replace=False)), dtype=np.float32)
+        for _ in range(KMEANS_ITERATIONS):
+            assignments = self._assign(vectors, centroids)
+            sums = np.zeros_like(centroids)
+            for start in range(0, len(vectors), SCORE_BLOCK_ROWS):
+                block = slice(start, start + SCORE_BLOCK_ROWS)
+                np.add.at(sums, assignments[block], self._rows(vectors, block))
+            counts = np.bincount(assignments, minlength=nlist)
+            nonempty = counts > 0
+            centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+            centroids = _normalize_rows(centroids)
+        assignments = self._assign(vectors, centroids)
+        order = np.argsort(assignments, kind="stable").astype(np.int32)
+        counts = np.bincount(assignments, minlength=nlist)
+        self._centroids = centroids
+        self._list_rows = order
+        self._list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    # --- reads ---
+
+    def _candidate_rows(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """Rows to score for this query; None means all rows (exact search)."""
+        with self._lock:
+            # Searches run in worker threads; the first one after a write rebuilds the lists for all
+            if self._ivf_dirty:
+                self._rebuild_ivf()
+            centroids, list_offsets, list_rows = self._centroids, self._list_offsets, self._list_rows
+        if centroids is None:
+            return None
+        nprobe = min(self.nprobe, len(centroids))
+        closest = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([list_rows[list_offsets[c]:list_offsets[c + 1]] for c in closest])
+
+    def _filter_rows(self, rows: Optional[np.ndarray], filter: Optional[dict]) -> Optional[np.ndarray]:
+        """Restrict candidate rows to those matching a metadata filter (equality, $in, $ne/$nin, ranges)."""
+        if not filter:
+            return rows
+        with self._lock:
+            if self._columns is None:
+                self._columns = MetadataColumns(self._metadatas)
+            mask = self._columns.mask(filter)
+        return np.flatnonzero(mask) if rows is None else rows[mask[rows]]
+
+    def _rows(self, vectors: np.ndarray, index) -> np.ndarray:
+        """float32 rows of the matrix at `index` (a slice or row array), dequantized if int8."""
+        if self._scales is None:
+            return vectors[index]
+        return vectors[index].astype(np.float32) * self._scales[index, None]
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """Closest centroid per row, computed one block of rows at a time."""
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), SCORE_BLOCK_ROWS):
+            block = slice(start, start + SCORE_BLOCK_ROWS)
+            assignments[block] = np.argmax(self._rows(vectors, block) @ centroids.T, axis=1)
+        return assignments
+
+    def _scores(self, vectors: np.ndarray, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """Cosine scores of `rows` (None: all rows) against a normalized query."""
+        if self._scales is None:
+            return vectors @ query if rows is None else vectors[rows] @ query
+        count = len(vectors) if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCORE_BLOCK_ROWS):
+            block = slice(start, start + SCORE_BLOCK_ROWS) if rows is None else rows[start:start + SCORE_BLOCK_ROWS]
+            scores[start:start + SCORE_BLOCK_ROWS] = self._rows(vectors, block) @ query
+        return scores
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[dict] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        if not self._ids:
+            return []
+        query = _normalize_rows(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+        vectors = self._matrix()
+        rows = self._filter_rows(self._candidate_rows(query), filter)
+        if rows is not None and len(rows) == 0:
+            return []
+        scores = self._scores(vectors, query, rows)
+        row_ids = rows
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for position in top:
+            row = int(position if row_ids is None else row_ids[position])
+            document = Document(id=self._ids[row], page_content=self._texts[row], metadata=dict(self._metadatas[row]))
+            results.append((document, float((1.0 + scores[position]) / 2.0)))
+        return results
+
+    async def asimilarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                                      filter: Optional[dict] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return await asyncio.to_thread(self.similarity_search_with_score_by_vector, embedding, k, filter)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, filter)
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None,
+                                            **kwargs: Any) -> List[Tuple[Document, float]]:
+        embedding = await self.embedding.aembed_query(query)
+        return await self.asimilarity_search_with_score_by_vector(embedding, k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k, **kwargs)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, *,
+                   ids: Optional[List[str]] = None, **kwargs: Any) -> "LocalVectorStore":
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def _atomic_save(path: str, array: np.ndarray):
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def _json_default(value):
+    # pandas hands us numpy scalars in metadata
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
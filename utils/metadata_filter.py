@@ -0,0 +1,76 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+RANGE_OPERATORS = {
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+    "$lt": np.less,
+    "$lte": np.less_equal,
+}
+
+
+def _conditions(condition) -> dict:
+    return condition if isinstance(condition, dict) else {"$eq": condition}
+
+
+class MetadataColumns:
+    """
+    Evaluates the Mongo-style metadata filters AstraDB and Pinecone accept
+    ({"field": value}, or {"field": {"$in": [...], "$gte": 4, ...}}; all fields
+    must match) over a whole list of metadata dicts at once. Equality and $in go
+    through a value -> rows map, ranges through a float column; both are built
+    on first use per field.
+    """
+
+    def __init__(self, metadatas: List[dict]):
+        self.metadatas = metadatas
+        self._rows: Dict[str, Dict[object, np.ndarray]] = {}
+        self._numbers: Dict[str, np.ndarray] = {}
+
+    def _value_rows(self, key: str) -> Dict[object, np.ndarray]:
+        if key not in self._rows:
+            grouped: dict = {}
+            for row, metadata in enumerate(self.metadatas):
+                grouped.setdefault(metadata.get(key), []).append(row)
+            self._rows[key] = {value: np.asarray(rows, dtype=np.int64) for value, rows in grouped.items()}
+        return self._rows[key]
+
+    def _numeric(self, key: str) -> np.ndarray:
+        if key not in self._numbers:
+            column = np.full(len(self.metadatas), np.nan)
+            for row, metadata in enumerate(self.metadatas):
+                value = metadata.get(key)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    column[row] = value
+            self._numbers[key] = column
+        return self._numbers[key]
+
+    def _in(self, key: str, values) -> np.ndarray:
+        selected = np.zeros(len(self.metadatas), dtype=bool)
+        value_rows = self._value_rows(key)
+        for value in values:
+            if value in value_rows:
+                selected[value_rows[value]] = True
+        return selected
+
+    def mask(self, filter: Optional[dict]) -> np.ndarray:
+        """Boolean array, True for rows matching the filter."""
+        selected = np.ones(len(self.metadatas), dtype=bool)
+        for key, condition in (filter or {}).items():
+            for operator, operand in _conditions(condition).items():
+                if operator == "$eq":
+                    selected &= self._in(key, [operand])
+                elif operator == "$ne":
+                    selected &= ~self._in(key, [operand])
+                elif operator == "$in":
+                    selected &= self._in(key, operand)
+                elif operator == "$nin":
+                    selected &= ~self._in(key, operand)
+                elif operator in RANGE_OPERATORS:
+                    column = self._numeric(key)
+                    with np.errstate(invalid="ignore"):
+                        selected &= RANGE_OPERATORS[operator](column, operand)  # NaN compares False
+                else:
+                    raise ValueError(f"Unsupported filter operator: {operator}")
+        return selected
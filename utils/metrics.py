@@ -0,0 +1,48 @@
+import threading
+from collections import deque
+
+
+class LatencyTracker:
+    """Keeps a rolling window of latency samples per metric name."""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples: dict[str, deque] = {}
+        self._counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.window)
+                self._counts[name] = 0
+            self._samples[name].append(seconds)
+            self._counts[name] += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            snapshot = {name: sorted(samples) for name, samples in self._samples.items()}
+            counts = dict(self._counts)
+
+        result = {}
+        for name, ordered in snapshot.items():
+            if not ordered:
+                continue
+            result[name] = {
+                "count": counts[name],
+                "mean_s": round(sum(ordered) / len(ordered), 4),
+                "p50_s": round(percentile(ordered, 50), 4),
+                "p95_s": round(percentile(ordered, 95), 4),
+                "p99_s": round(percentile(ordered, 99), 4),
+                "max_s": round(ordered[-1], 4),
+            }
+        return result
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile (pct in 0-100) of unsorted samples; 0.0 when there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
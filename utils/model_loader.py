@@ -1,19 +1,29 @@
 import os
 import logging
 from dotenv import load_dotenv
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_groq import ChatGroq
-from utils.config_loader import load_config
+from utils.config_loader import load_config, resolve_path
+from utils.embedding_cache import CachedEmbeddings
+from utils.client_registry import ClientRegistry
+from utils.coalescing import MicroBatchEmbeddings
 
 logger = logging.getLogger(__name__)
 
 
 class ModelLoader:
+    """
+    Builds the embedding model and LLM once and hands out the same instances.
+    Both talk to their APIs through the pooled, keep-alive clients in `self.clients`.
+    The provider SDKs are imported on first load, not when this module is imported;
+    `ModelLoader.shared()` is the one instance a process's components should use.
+    """
+
+    _shared = None
 
     def __init__(self):
         load_dotenv()
         self.config = load_config()
         self._validate_env()
+        self.clients = ClientRegistry.from_config(self.config)
         self._embeddings = None
         self._llm = None
 
@@ -24,16 +34,42 @@ class ModelLoader:
             raise EnvironmentError(f"Missing environment variables: {missing_vars}")
         self.groq_api_key = os.getenv("GROQ_API_KEY")
 
+    @classmethod
+    def shared(cls) -> "ModelLoader":
+        """Process-wide ModelLoader, so every component reuses one set of models and connection pools."""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
     def load_embeddings(self):
         if not self._embeddings:
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings
             model_name = self.config["embedding_model"]["model_name"]
-            self._embeddings = GoogleGenerativeAIEmbeddings(model=model_name)
+            self._embeddings = GoogleGenerativeAIEmbeddings(model=model_name, client_args=self.clients.client_args())
             logger.info(f"Embedding model loaded: {model_name}")
+
+            if self.config.get("coalescing", {}).get("batch_query_embeddings", False):
+                # Batched queries must still be embedded with the query task type
+                self._embeddings = MicroBatchEmbeddings.from_config(
+                    self._embeddings, self.config, batch_kwargs={"task_type": "RETRIEVAL_QUERY"}
+                )
+
+            cache_config = self.config.get("embedding_cache", {})
+            if cache_config.get("enabled", False):
+                cache_path = resolve_path(cache_config.get("path", "data/embedding_cache.sqlite"))
+                self._embeddings = CachedEmbeddings(self._embeddings, model_name, cache_path)
+                logger.info(f"Embedding cache enabled: {cache_path}")
         return self._embeddings
 
     def load_llm(self):
         if not self._llm:
+            from langchain_groq import ChatGroq
             model_name = self.config["llm"]["model_name"]
-            self._llm = ChatGroq(model=model_name, api_key=self.groq_api_key)
+            self._llm = ChatGroq(
+                model=model_name,
+                api_key=self.groq_api_key,
+                http_client=self.clients.client("groq"),
+                http_async_client=self.clients.async_client("groq"),
+            )
             logger.info(f"LLM loaded: {model_name}")
         return self._llm
\ No newline at end of file
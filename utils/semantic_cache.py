@@ -0,0 +1,148 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from utils.config_loader import resolve_path
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """
+    Answer cache keyed on the embedding of the rewritten query.
+
+    A lookup hits when a cached query embedding has cosine similarity >= the
+    threshold. Entries expire after `ttl_seconds` and the least recently used
+    entry is evicted once `max_entries` is reached. The whole cache is dropped
+    when the collection version file changes (see `bump_collection_version`),
+    which the ingestion pipeline touches after every reload.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, max_entries: int = 512,
+                 ttl_seconds: float = 3600, version_file: str = None):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version_file = resolve_path(version_file) if version_file else None
+        self._entries: OrderedDict[int, dict] = OrderedDict()
+        self._next_id = 0
+        self._matrix = None
+        self._matrix_ids: List[int] = []
+        self._version = self._read_version()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> "SemanticCache":
+        cache_config = config.get("semantic_cache", {})
+        return cls(
+            similarity_threshold=cache_config.get("similarity_threshold", 0.95),
+            max_entries=cache_config.get("max_entries", 512),
+            ttl_seconds=cache_config.get("ttl_seconds", 3600),
+            version_file=cache_config.get("version_file"),
+        )
+
+    def lookup(self, embedding: List[float]) -> Optional[str]:
+        self._check_version()
+        self._expire()
+        if not self._entries:
+            self.misses += 1
+            return None
+
+        query = _normalize(embedding)
+        matrix = self._get_matrix()
+        if matrix.shape[1] != query.shape[0]:
+            self.misses += 1
+            return None
+        similarities = matrix @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            self.misses += 1
+            return None
+
+        entry_id = self._matrix_ids[best]
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        entry = self._entries[entry_id]
+        logger.info(f"Semantic cache hit (similarity={similarities[best]:.3f}) for '{entry['query']}'")
+        return entry["answer"]
+
+    def store(self, query: str, embedding: List[float], answer: str):
+        self._check_version()
+        while len(self._entries) >= self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._entries[self._next_id] = {
+            "query": query,
+            "vector": _normalize(embedding),
+            "answer": answer,
+            "created_at": time.monotonic(),
+        }
+        self._next_id += 1
+        self._matrix = None
+
+    def clear(self):
+        self._entries.clear()
+        self._matrix = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [entry_id for entry_id, entry in self._entries.items()
+                   if now - entry["created_at"] > self.ttl_seconds]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        if expired:
+            self._matrix = None
+
+    def _get_matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix_ids = list(self._entries.keys())
+            self._matrix = np.stack([self._entries[i]["vector"] for i in self._matrix_ids])
+        return self._matrix
+
+    def _read_version(self):
+        if not self.version_file or not os.path.exists(self.version_file):
+            return None
+        return os.stat(self.version_file).st_mtime_ns
+
+    def _check_version(self):
+        version = self._read_version()
+        if version != self._version:
+            logger.info("Vector collection changed; invalidating semantic cache.")
+            self._version = version
+            self.invalidations += 1
+            self.clear()
+
+
+def bump_collection_version(config: dict):
+    """Mark the vector collection as reloaded so every semantic cache drops its entries."""
+    version_file = config.get("semantic_cache", {}).get("version_file")
+    if not version_file:
+        return
+    path = resolve_path(version_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(str(time.time_ns()))
+
+
+def _normalize(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,274 @@
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List
+
+from utils.config_loader import resolve_path
+
+logger = logging.getLogger(__name__)
+
+# Client-supplied session IDs must look like one we would have issued
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def is_valid_session_id(session_id: str) -> bool:
+    return bool(session_id) and SESSION_ID_PATTERN.match(session_id) is not None
+
+
+def remaining_turns(turns: List[dict], folded_turns: List[dict]) -> List[dict]:
+    """
+    `turns` without the first len(folded_turns), which the summary covers. If the
+    max_turns cap dropped some of the oldest turns meanwhile, only the folded turns
+    still at the front are removed.
+    """
+    for dropped in range(len(folded_turns)):
+        kept = len(folded_turns) - dropped
+        if turns[:kept] == folded_turns[dropped:]:
+            return turns[kept:]
+    return turns  # the cap has already dropped every folded turn
+
+
+class SessionStore(ABC):
+    """
+    Conversation state per session ID: the recent turns plus a rolling summary
+    of the turns folded out of them. Sessions expire `ttl_seconds` after
+    their last recorded turn, and once more than `max_sessions` are held the
+    least recently active ones are evicted.
+
+    Request handlers use the async variants (aget_state, aappend, afold), which
+    run the blocking implementations in a worker thread.
+    """
+
+    backend: str
+
+    def __init__(self, max_sessions: int = 10000, ttl_seconds: float = 86400):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, session_id: str) -> List[dict]:
+        return self.get_state(session_id)["turns"]
+
+    @abstractmethod
+    def get_state(self, session_id: str) -> dict:
+        """{"turns": [...], "summary": str} for the session (empty if unknown or expired)."""
+
+    @abstractmethod
+    def append(self, session_id: str, turn: dict, max_turns: int):
+        """Record a turn, keeping only the latest `max_turns` for the session."""
+
+    @abstractmethod
+    def fold(self, session_id: str, summary: str, folded_turns: List[dict]):
+        """
+        Replace the summary and drop the turns it now covers, by position (see
+        remaining_turns) so a repeated question is not mistaken for a folded
+        one. Turns appended while the summary was being written are kept.
+        """
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    async def aget_state(self, session_id: str) -> dict:
+        return await asyncio.to_thread(self.get_state, session_id)
+
+    async def aappend(self, session_id: str, turn: dict, max_turns: int):
+        await asyncio.to_thread(self.append, session_id, turn, max_turns)
+
+    async def afold(self, session_id: str, summary: str, folded_turns: List[dict]):
+        await asyncio.to_thread(self.fold, session_id, summary, folded_turns)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "sessions": len(self),
+            "max_sessions": self.max_sessions,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Per-process store: an OrderedDict in least-recently-active order. Its
+    operations never block, so the async variants run them inline.
+    """
+
+    backend = "memory"
+
+    def __init__(self, max_sessions: int = 10000, ttl_seconds: float = 86400):
+        super().__init__(max_sessions, ttl_seconds)
+        self._sessions: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_state(self, session_id: str) -> dict:
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if not session:
+                return {"turns": [], "summary": ""}
+            return {"turns": list(session["turns"]), "summary": session["summary"]}
+
+    def append(self, session_id: str, turn: dict, max_turns: int):
+        with self._lock:
+            self._expire()
+            session = self._sessions.pop(session_id, None) or {"turns": [], "summary": ""}
+            session["turns"] = (session["turns"] + [turn])[-max_turns:]
+            session["updated_at"] = time.time()
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def fold(self, session_id: str, summary: str, folded_turns: List[dict]):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session:
+                session["summary"] = summary
+                session["turns"] = remaining_turns(session["turns"], folded_turns)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def aget_state(self, session_id: str) -> dict:
+        return self.get_state(session_id)
+
+    async def aappend(self, session_id: str, turn: dict, max_turns: int):
+        self.append(session_id, turn, max_turns)
+
+    async def afold(self, session_id: str, summary: str, folded_turns: List[dict]):
+        self.fold(session_id, summary, folded_turns)
+
+    def _expire(self):
+        # Oldest sessions are at the front, so stop at the first live one
+        cutoff = time.time() - self.ttl_seconds
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session["updated_at"] >= cutoff:
+                break
+            del self._sessions[session_id]
+            self.expirations += 1
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Store shared by every worker on the host: one row per session with the
+    turns as JSON and the summary as text. Appends run in an IMMEDIATE
+    transaction so concurrent workers never lose a turn; expiry and capacity
+    eviction run when a new session is created, which is the only time the
+    row count grows.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, max_sessions: int = 10000, ttl_seconds: float = 86400):
+        super().__init__(max_sessions, ttl_seconds)
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, updated_at REAL NOT NULL, turns TEXT NOT NULL, "
+            "summary TEXT NOT NULL DEFAULT '')"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+        if "summary" not in columns:  # databases created before rolling summaries
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN summary TEXT NOT NULL DEFAULT ''")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        self._lock = threading.Lock()
+
+    def get_state(self, session_id: str) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT turns, summary FROM sessions WHERE session_id = ? AND updated_at >= ?",
+                (session_id, time.time() - self.ttl_seconds),
+            ).fetchone()
+        if not row:
+            return {"turns": [], "summary": ""}
+        return {"turns": json.loads(row[0]), "summary": row[1]}
+
+    def append(self, session_id: str, turn: dict, max_turns: int):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT turns, updated_at, summary FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                live = row is not None and row[1] >= now - self.ttl_seconds
+                turns = (json.loads(row[0]) if live else []) + [turn]
+                self._conn.execute(
+                    "INSERT INTO sessions (session_id, updated_at, turns, summary) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET updated_at = excluded.updated_at, "
+                    "turns = excluded.turns, summary = excluded.summary",
+                    (session_id, now, json.dumps(turns[-max_turns:]), row[2] if live else ""),
+                )
+                if row is None:
+                    self._evict(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def fold(self, session_id: str, summary: str, folded_turns: List[dict]):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT turns FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                if row:
+                    turns = remaining_turns(json.loads(row[0]), folded_turns)
+                    self._conn.execute(
+                        "UPDATE sessions SET turns = ?, summary = ? WHERE session_id = ?",
+                        (json.dumps(turns), summary, session_id),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, now: float):
+        expired = self._conn.execute(
+            "DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        evicted = self._conn.execute(
+            "DELETE FROM sessions WHERE session_id IN ("
+            "SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,),
+        ).rowcount
+        self.expirations += expired
+        self.evictions += evicted
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def load_session_store(config: dict) -> SessionStore:
+    """Build the session store selected by `session_store.backend` in config.yaml."""
+    store_config = config.get("session_store", {})
+    backend = store_config.get("backend", "memory")
+    max_sessions = store_config.get("max_sessions", 10000)
+    ttl_seconds = store_config.get("ttl_seconds", 86400)
+    if backend == "memory":
+        return InMemorySessionStore(max_sessions, ttl_seconds)
+    if backend == "sqlite":
+        path = resolve_path(store_config.get("path", "data/sessions.sqlite"))
+        logger.info(f"Using SQLite session store at {path}")
+        return SQLiteSessionStore(path, max_sessions, ttl_seconds)
+    raise ValueError(f"Unknown session store backend: {backend}")
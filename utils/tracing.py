@@ -0,0 +1,173 @@
+import json
+import time
+import uuid
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Optional, Tuple
+
+from utils.metrics import LatencyTracker
+
+logger = logging.getLogger(__name__)
+request_logger = logging.getLogger("rag.requests")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+
+
+class RequestTrace:
+    """
+    Per-stage timings for one request. Spans with the same stage name accumulate,
+    so concurrent work (e.g. a speculative search) counts toward its stage.
+    """
+
+    def __init__(self, endpoint: str, session_id: str = None):
+        self.request_id = uuid.uuid4().hex[:16]
+        self.endpoint = endpoint
+        self.session_id = session_id
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.attributes: dict = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+
+def start_trace(endpoint: str, session_id: str = None) -> RequestTrace:
+    """Begin a trace and make it current for this request's task (and tasks/threads it spawns)."""
+    trace = RequestTrace(endpoint, session_id)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def annotate(**attributes):
+    """Attach attributes (cache hits, doc counts, ...) to the current trace, if any."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+@contextmanager
+def span(stage: str):
+    """Time the enclosed block into the current trace; a no-op outside a traced request."""
+    trace = _current_trace.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.add(stage, time.perf_counter() - start)
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, rendered in Prometheus text format."""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Iterable[float]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, dict] = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+        series["counts"][bisect_left(self.buckets, value)] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            label_str = ",".join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series["counts"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label_str},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_str}}} {series['sum']:.6f}")
+            lines.append(f"{self.name}_count{{{label_str}}} {series['count']}")
+        return "\n".join(lines)
+
+
+class RequestMetrics:
+    """
+    Collects finished request traces: per-stage latency histograms and request
+    counters for /metrics, rolling per-stage percentiles for /stats, plus an
+    optional one-line JSON log per request. The first request per endpoint is
+    kept separately, since it pays for any connection setup warm-up did not do.
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS, json_log: bool = False):
+        self.stage_latency = Histogram(
+            "rag_stage_latency_seconds",
+            "Time spent in each pipeline stage per request.",
+            ("endpoint", "stage"),
+            buckets,
+        )
+        self.recent = LatencyTracker()
+        self.json_log = json_log
+        self._requests: Dict[tuple, int] = {}
+        self.first_requests: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RequestMetrics":
+        observability_config = config.get("observability", {})
+        return cls(
+            buckets=observability_config.get("histogram_buckets", DEFAULT_BUCKETS),
+            json_log=observability_config.get("json_request_log", False),
+        )
+
+    def finish(self, trace: RequestTrace, status: str = "ok"):
+        """Close the trace: records 'total' and every stage, and logs it if JSON logging is on."""
+        trace.stages["total"] = trace.elapsed()
+        with self._lock:
+            key = (trace.endpoint, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self.first_requests.setdefault(trace.endpoint, trace.stages["total"])
+            for stage, seconds in trace.stages.items():
+                self.stage_latency.observe((trace.endpoint, stage), seconds)
+        for stage, seconds in trace.stages.items():
+            self.recent.record(f"{trace.endpoint} {stage}", seconds)
+        if self.json_log:
+            request_logger.info(json.dumps({
+                "request_id": trace.request_id,
+                "endpoint": trace.endpoint,
+                "session_id": trace.session_id,
+                "status": status,
+                "started_at": round(trace.started_at, 3),
+                "stages_s": {stage: round(seconds, 4) for stage, seconds in trace.stages.items()},
+                **trace.attributes,
+            }))
+
+    def stage_summary(self) -> dict:
+        """Rolling count/mean/p50/p95/p99 per "endpoint stage" over recent requests."""
+        return self.recent.summary()
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP rag_requests_total Chat requests handled, by endpoint and outcome.",
+                "# TYPE rag_requests_total counter",
+            ]
+            for (endpoint, status), count in sorted(self._requests.items()):
+                lines.append(f'rag_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+            lines.append("# HELP rag_first_request_seconds Latency of the first request served, by endpoint.")
+            lines.append("# TYPE rag_first_request_seconds gauge")
+            for endpoint, seconds in sorted(self.first_requests.items()):
+                lines.append(f'rag_first_request_seconds{{endpoint="{endpoint}"}} {seconds:.6f}')
+            lines.append(self.stage_latency.render())
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,157 @@
+import os
+import logging
+from typing import Dict, List
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from utils.config_loader import resolve_path
+
+logger = logging.getLogger(__name__)
+
+FETCH_CHUNK = 100  # document IDs per read-back request
+
+BACKEND_ENV_VARS = {
+    "astradb": ["ASTRA_DB_API_ENDPOINT", "ASTRA_DB_APPLICATION_TOKEN", "ASTRA_DB_KEYSPACE"],
+    "pinecone": ["PINECONE_API_KEY"],
+    "local": [],
+}
+
+
+def get_backend(config: dict) -> str:
+    backend = config.get("vector_store", {}).get("backend", "astradb")
+    if backend not in BACKEND_ENV_VARS:
+        raise ValueError(f"Unknown vector store backend: {backend}")
+    return backend
+
+
+def store_key(config: dict, backend: str = None) -> str:
+    """Stable name for the collection a backend writes to, e.g. 'astradb:rag_customer'."""
+    backend = backend or get_backend(config)
+    if backend == "astradb":
+        return f"astradb:{config['astra_db']['collection_name']}"
+    if backend == "pinecone":
+        return f"pinecone:{config['pinecone']['index_name']}"
+    return f"local:{config.get('vector_store', {}).get('local', {}).get('path', 'data/vector_index')}"
+
+
+def load_vector_store(config: dict, embeddings, backend: str = None, clients=None):
+    """
+    Build the vector store selected by `vector_store.backend` in config.yaml.
+    Backend clients are imported lazily so only the selected one is loaded.
+    With a ClientRegistry as `clients`, AstraDB requests go through its pooled
+    "astradb" clients (see use_pooled_clients).
+    """
+    load_dotenv()
+    backend = backend or get_backend(config)
+    missing_vars = [var for var in BACKEND_ENV_VARS[backend] if os.getenv(var) is None]
+    if missing_vars:
+        raise EnvironmentError(f"Missing environment variables: {missing_vars}")
+
+    if backend == "astradb":
+        from langchain_astradb import AstraDBVectorStore
+        vstore = AstraDBVectorStore(
+            embedding=embeddings,
+            collection_name=config["astra_db"]["collection_name"],
+            api_endpoint=os.getenv("ASTRA_DB_API_ENDPOINT"),
+            token=os.getenv("ASTRA_DB_APPLICATION_TOKEN"),
+            namespace=os.getenv("ASTRA_DB_KEYSPACE"),
+        )
+        if clients is not None:
+            use_pooled_clients(vstore, clients)
+        return vstore
+
+    if backend == "pinecone":
+        from langchain_pinecone import PineconeVectorStore
+        from pinecone import ServerlessSpec, Pinecone
+        pinecone = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+        index_name = config["pinecone"]["index_name"]
+        if index_name not in pinecone.list_indexes():
+            pinecone.create_index(
+                name=index_name,
+                dimension=768,
+                serverless_spec=ServerlessSpec(min_nodes=1, max_nodes=3)
+            )
+        return PineconeVectorStore(index_name=index_name, embedding=embeddings)
+
+    from utils.local_vector_store import LocalVectorStore
+    local_config = config.get("vector_store", {}).get("local", {})
+    return LocalVectorStore(
+        embeddings,
+        path=resolve_path(local_config.get("path", "data/vector_index")),
+        index_type=local_config.get("index_type", "exact"),
+        nlist=local_config.get("nlist", 64),
+        nprobe=local_config.get("nprobe", 8),
+    )
+
+
+def use_pooled_clients(vstore, clients) -> bool:
+    """
+    Route an AstraDBVectorStore's collection requests through the registry's "astradb" clients.
+    astrapy takes no httpx client or limits: each collection object builds its own clients with
+    httpx defaults (idle connections closed after 5s), so the registry's are swapped in. Skipped,
+    returning False, on the Python versions where astrapy disables connection reuse itself.
+    Pinecone's SDK pools its own urllib3 connections and is left as it is.
+    """
+    from astrapy.utils import api_commander
+    if api_commander.disable_ssl_reuse:
+        logger.warning("astrapy disables connection reuse on this Python version; AstraDB keeps its own clients")
+        return False
+    for commander in (vstore.astra_env.collection._api_commander, vstore.astra_env.async_collection._api_commander):
+        commander.client = clients.client("astradb")
+        commander.async_client = clients.async_client("astradb")
+    return True
+
+
+def store_has_documents(vstore) -> bool:
+    """True when the store holds at least one document, whichever way its IDs were assigned."""
+    from utils.local_vector_store import LocalVectorStore
+    if isinstance(vstore, LocalVectorStore):
+        return len(vstore) > 0
+    if hasattr(vstore, "astra_env"):  # AstraDBVectorStore
+        vstore.astra_env.ensure_db_setup()
+        return vstore.astra_env.collection.find_one({}, projection={"_id": True}) is not None
+    return vstore._index.describe_index_stats().total_vector_count > 0  # PineconeVectorStore
+
+
+def clear_vector_store(vstore):
+    """Delete every document in the store."""
+    if hasattr(vstore, "clear"):  # AstraDBVectorStore, LocalVectorStore
+        vstore.clear()
+    else:
+        vstore.delete(delete_all=True)
+
+
+def fetch_vectors(vstore, ids: List[str]) -> Dict[str, List[float]]:
+    """Document ID -> vector as stored, for those of `ids` the store holds. Reads only; never embeds."""
+    from utils.local_vector_store import LocalVectorStore
+    if isinstance(vstore, LocalVectorStore):
+        return vstore.get_vectors(ids)
+    found = {}
+    for start in range(0, len(ids), FETCH_CHUNK):
+        chunk = list(ids[start:start + FETCH_CHUNK])
+        if hasattr(vstore, "astra_env"):  # AstraDBVectorStore
+            for result in vstore.run_query(n=len(chunk), ids=chunk, include_embeddings=True):
+                found[result.id] = result.embedding
+        else:  # PineconeVectorStore
+            response = vstore._index.fetch(ids=chunk, namespace=vstore._namespace)
+            for doc_id, vector in response.vectors.items():
+                found[doc_id] = vector.values
+    return found
+
+
+def fetch_documents(vstore, ids: List[str]) -> Dict[str, Document]:
+    """Document ID -> stored Document (text and metadata), for those of `ids` the store holds."""
+    from utils.local_vector_store import LocalVectorStore
+    found = {}
+    for start in range(0, len(ids), FETCH_CHUNK):
+        chunk = list(ids[start:start + FETCH_CHUNK])
+        if isinstance(vstore, LocalVectorStore) or hasattr(vstore, "astra_env"):  # AstraDBVectorStore
+            documents = vstore.get_by_ids(chunk)
+        else:  # PineconeVectorStore keeps the text in a metadata field
+            response = vstore._index.fetch(ids=chunk, namespace=vstore._namespace)
+            documents = []
+            for doc_id, vector in response.vectors.items():
+                metadata = dict(vector.metadata or {})
+                documents.append(Document(id=doc_id, page_content=metadata.pop(vstore._text_key, ""), metadata=metadata))
+        for doc in documents:
+            found[doc.id] = doc
+    return found